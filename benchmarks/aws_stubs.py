@@ -0,0 +1,268 @@
+"""
+In-memory S3, Lambda, Bedrock and API Gateway clients for running the handlers without AWS.
+
+Each stand-in can wait a sampled latency per call, so the full Lambda 3 ->
+Lambda 2 -> S3 -> SEC -> Bedrock chain can be timed and profiled on a laptop or
+in CI with realistic proportions. FakeBedrock also simulates token rates:
+time to first token, prompt processing per input token and output tokens per
+second, for both invoke_model and invoke_model_with_response_stream.
+
+Inject them through the modules' hooks:
+
+    aws = fake_aws('aws', lambda_functions={'NathanAsfaw-SEC-Document-Processor': lambda_2.lambda_handler})
+    lambda_3.set_client_factory(aws.client)
+    lambda_2.set_s3_client(aws.s3)
+    SECEdgar(use_s3=True, s3_client=aws.s3)
+
+or, for code without a hook (lambda_1), patch boto3 with `with stub_aws(aws):`.
+"""
+
+import contextvars
+import hashlib
+import io
+import json
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+
+class Latency(namedtuple('Latency', ['distribution', 'a', 'b'])):
+    """A latency distribution in milliseconds.
+
+    fixed: always a; uniform: between a and b; lognormal: median a with shape b
+    (0.3-0.6 looks like real service latency, with a long right tail).
+    """
+
+    @classmethod
+    def parse(cls, spec):
+        """'fixed:20', 'uniform:10:50' or 'lognormal:25:0.5'"""
+        distribution, *params = spec.split(':')
+        params = [float(p) for p in params] + [0.0] * (2 - len(params))
+        return cls(distribution, params[0], params[1])
+
+    def sample_ms(self, rng):
+        if self.distribution == 'fixed':
+            return self.a
+        if self.distribution == 'uniform':
+            return rng.uniform(self.a, self.b)
+        if self.distribution == 'lognormal':
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        raise ValueError(f"Unknown latency distribution {self.distribution}")
+
+
+NO_LATENCY = Latency('fixed', 0.0, 0.0)
+
+
+class FakeService:
+    """Shared latency sampling; the random generator is locked since batch requests use threads"""
+
+    def __init__(self, latency=NO_LATENCY, seed=None):
+        self.latency = latency
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self, latency=None):
+        with self._lock:
+            self.calls += 1
+            return (latency or self.latency).sample_ms(self._rng)
+
+    def wait(self, latency=None):
+        delay = self.sample_ms(latency)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+
+class FakeS3(FakeService):
+    """Objects kept in a dict by (bucket, key)"""
+
+    def __init__(self, objects=None, latency=NO_LATENCY, seed=None):
+        super().__init__(latency, seed)
+        self.objects = dict(objects or {})
+
+    def get_object(self, Bucket, Key, **kwargs):
+        response = self.head_object(Bucket, Key)
+        body = self.objects[(Bucket, Key)]
+        return dict(response, Body=io.BytesIO(body))
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.wait()
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': f"{Key} not found"}}, 'HeadObject')
+        body = self.objects[(Bucket, Key)]
+        return {'ContentLength': len(body), 'ETag': self.etag(body)}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.wait()
+        self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode('utf-8')
+        return {'ETag': self.etag(self.objects[(Bucket, Key)])}
+
+    @staticmethod
+    def etag(body):
+        # S3's ETag for a single-part upload is the quoted MD5 of the body
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        with open(Filename, 'wb') as f:
+            f.write(self.get_object(Bucket, Key)['Body'].read())
+
+
+class FakeLambda(FakeService):
+    """Invokes other handlers in-process by function name, after the invoke overhead.
+
+    Each call runs in a copy of the caller's context, so the callee's per-invocation state
+    (the current timings in metrics.py) is kept apart from the caller's as it is on AWS.
+    """
+
+    def __init__(self, functions=None, latency=NO_LATENCY, seed=None):
+        super().__init__(latency, seed)
+        self.functions = dict(functions or {})
+
+    def invoke(self, FunctionName, Payload=b'{}', **kwargs):
+        self.wait()
+        if FunctionName not in self.functions:
+            raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': FunctionName}}, 'Invoke')
+        result = contextvars.copy_context().run(self.functions[FunctionName], json.loads(Payload), None)
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+
+class FakeBedrock(FakeService):
+    """Answers with a canned reply at a simulated token rate.
+
+    Time to first token is sampled from latency plus input_tokens / prefill_tokens_per_second;
+    the answer then arrives at output_tokens_per_second (0 for instant). Token counts are
+    estimated at 4 characters per token.
+    """
+
+    def __init__(self, answer="Total net sales were $383,285 million.", latency=NO_LATENCY,
+                 prefill_tokens_per_second=0, output_tokens_per_second=0, seed=None):
+        super().__init__(latency, seed)
+        self.answer = answer
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.output_tokens_per_second = output_tokens_per_second
+        self.requests = []
+
+    def usage(self, request):
+        prompt_chars = len(json.dumps(request.get('messages', []))) + len(str(request.get('system', '')))
+        return {'input_tokens': prompt_chars // 4, 'output_tokens': max(1, len(self.answer) // 4)}
+
+    def _first_token(self, usage):
+        delay = self.sample_ms() / 1000
+        if self.prefill_tokens_per_second:
+            delay += usage['input_tokens'] / self.prefill_tokens_per_second
+        time.sleep(delay)
+
+    def _generate(self, tokens):
+        if self.output_tokens_per_second:
+            time.sleep(tokens / self.output_tokens_per_second)
+
+    def invoke_model(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        self.requests.append(request)
+        usage = self.usage(request)
+        self._first_token(usage)
+        self._generate(usage['output_tokens'])
+        response = {'content': [{'type': 'text', 'text': self.answer}], 'usage': usage}
+        return {'body': io.BytesIO(json.dumps(response).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        request = json.loads(body)
+        self.requests.append(request)
+        return {'body': self._stream(self.usage(request))}
+
+    def _stream(self, usage):
+        def event(message):
+            return {'chunk': {'bytes': json.dumps(message).encode('utf-8')}}
+
+        self._first_token(usage)
+        yield event({'type': 'message_start', 'message': {'usage': {'input_tokens': usage['input_tokens']}}})
+        words = self.answer.split(' ')
+        for n, word in enumerate(words):
+            text = word if n == 0 else ' ' + word
+            if n:
+                self._generate(max(1, len(text) // 4))
+            yield event({'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': text}})
+        yield event({'type': 'message_delta', 'usage': {'output_tokens': usage['output_tokens']}})
+        yield event({'type': 'message_stop'})
+
+
+class FakeApiGateway(FakeService):
+    """Collects the chunks posted to WebSocket connections"""
+
+    def __init__(self, latency=NO_LATENCY, seed=None):
+        super().__init__(latency, seed)
+        self.posted = []
+
+    def post_to_connection(self, ConnectionId, Data, **kwargs):
+        self.wait()
+        self.posted.append((ConnectionId, Data))
+
+
+class FakeAWS:
+    """One stand-in per service, handed out by client() in place of boto3.client"""
+
+    def __init__(self, s3=None, lambda_client=None, bedrock=None, apigateway=None):
+        self.s3 = s3 or FakeS3()
+        self.lambda_client = lambda_client or FakeLambda()
+        self.bedrock = bedrock or FakeBedrock()
+        self.apigateway = apigateway or FakeApiGateway()
+        self.services = {'s3': self.s3, 'lambda': self.lambda_client, 'bedrock-runtime': self.bedrock,
+                         'apigatewaymanagementapi': self.apigateway}
+
+    def client(self, service_name, *args, **kwargs):
+        if service_name not in self.services:
+            raise ValueError(f"No stand-in for AWS service {service_name}")
+        return self.services[service_name]
+
+
+# Latency profiles: 'instant' isolates local work, 'aws' approximates warm calls from a Lambda
+# in the same region (S3 GetObject, synchronous Lambda invoke, Claude Sonnet on Bedrock)
+PROFILES = {
+    'instant': {},
+    'aws': {
+        's3': Latency('lognormal', 25, 0.5),
+        'lambda': Latency('lognormal', 20, 0.4),
+        'bedrock': Latency('lognormal', 600, 0.3),
+        'prefill_tokens_per_second': 8000,
+        'output_tokens_per_second': 60,
+        'apigateway': Latency('lognormal', 15, 0.4),
+    },
+}
+
+
+def fake_aws(profile='instant', s3_objects=None, lambda_functions=None, answer=None, seed=None):
+    """A FakeAWS with the latencies of a named profile"""
+    settings = PROFILES[profile]
+    bedrock_options = {'answer': answer} if answer else {}
+    return FakeAWS(
+        s3=FakeS3(s3_objects, settings.get('s3', NO_LATENCY), seed),
+        lambda_client=FakeLambda(lambda_functions, settings.get('lambda', NO_LATENCY), seed),
+        bedrock=FakeBedrock(latency=settings.get('bedrock', NO_LATENCY),
+                            prefill_tokens_per_second=settings.get('prefill_tokens_per_second', 0),
+                            output_tokens_per_second=settings.get('output_tokens_per_second', 0),
+                            seed=seed, **bedrock_options),
+        apigateway=FakeApiGateway(settings.get('apigateway', NO_LATENCY), seed),
+    )
+
+
+class FakeSession:
+    def __init__(self, client, **kwargs):
+        self._client = client
+
+    def client(self, service_name, *args, **kwargs):
+        return self._client(service_name, *args, **kwargs)
+
+
+@contextmanager
+def stub_aws(aws=None):
+    """Patch boto3.client and boto3.Session to hand out the stand-ins, for code without an injection hook"""
+    aws = aws or FakeAWS()
+    with patch('boto3.client', side_effect=aws.client), \
+            patch('boto3.Session', side_effect=lambda **kwargs: FakeSession(aws.client, **kwargs)):
+        yield aws
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: finding companies in questions by scanning every name vs the Aho-Corasick matcher.
+
+Builds an index the size of EDGAR's company_tickers.json (the recorded fixture
+padded with synthetic names) and times a substring scan of every name and
+ticker against the CompanyMatcher for a set of sample questions.
+
+Usage:
+    python benchmarks/bench_company_matcher.py [companies]
+"""
+
+import json
+import os
+import sys
+import time
+
+CIK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cik_module')
+sys.path.insert(0, CIK_DIR)
+
+from CIK_module import CompanyMatcher
+
+QUESTIONS = [
+    "What was Apple's total revenue in 2023?",
+    "Compare JPMorgan Chase & Co. and Bank of America net income in FY2022",
+    "How did NVDA gross margin change in the third quarter?",
+    "What were the main supply chain risks?",
+]
+
+
+def load_index(size):
+    with open(os.path.join(CIK_DIR, 'fixtures', 'company_tickers.json')) as f:
+        companies = list(json.load(f).values())
+    name_dict = {c['title'].lower(): str(c['cik_str']) for c in companies}
+    ticker_dict = {c['ticker'].lower(): str(c['cik_str']) for c in companies}
+    for i in range(size - len(companies)):
+        name_dict[f"synthetic holdings {i} group inc"] = str(2000000 + i)
+        ticker_dict[f"zz{i:04d}"] = str(2000000 + i)
+    return name_dict, ticker_dict
+
+
+def naive_find(question, name_dict, ticker_dict):
+    text = question.lower()
+    words = set(text.replace('?', ' ').split())
+    return [cik for name, cik in name_dict.items() if name in text] + \
+        [cik for ticker, cik in ticker_dict.items() if ticker in words]
+
+
+def per_question_ms(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for question in QUESTIONS:
+            func(question)
+    return (time.perf_counter() - start) * 1000 / (iterations * len(QUESTIONS))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    name_dict, ticker_dict = load_index(size)
+    start = time.perf_counter()
+    matcher = CompanyMatcher(name_dict, ticker_dict)
+    build_ms = (time.perf_counter() - start) * 1000
+    summary = {
+        'companies': len(name_dict),
+        'matcher_build_ms': round(build_ms, 1),
+        'naive_ms_per_question': round(per_question_ms(lambda q: naive_find(q, name_dict, ticker_dict), 20), 4),
+        'matcher_ms_per_question': round(per_question_ms(matcher.find, 2000), 4),
+        'mentions': {q: [m.text for m in matcher.find(q)] for q in QUESTIONS},
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory and lookup time of the company listing, old dicts vs CompanyTable.
+
+Builds a listing the size of EDGAR's company_tickers.json (the recorded fixture
+padded with synthetic companies, some with a second share class) and measures
+the memory held by the old name/ticker dicts of CIK strings and by the
+CompanyTable, with tracemalloc, plus the time for ticker and name lookups.
+Both include the parsed JSON they keep alive: the old SECEdgar kept filejson
+next to its dicts, while the table reuses the listing's title strings and lets
+the rest of the JSON go.
+
+Usage:
+    python benchmarks/bench_company_store.py [companies]
+"""
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+CIK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cik_module')
+sys.path.insert(0, CIK_DIR)
+
+from CIK_module import CompanyTable
+
+
+def load_listing(size):
+    with open(os.path.join(CIK_DIR, 'fixtures', 'company_tickers.json')) as f:
+        entries = list(json.load(f).values())
+    i = 0
+    while len(entries) < size:
+        cik = 2000000 + i
+        entries.append({'cik_str': cik, 'ticker': f"ZZ{i:04d}", 'title': f"Synthetic Holdings {i} Group Inc."})
+        if i % 10 == 0:
+            entries.append({'cik_str': cik, 'ticker': f"ZZ{i:04d}-B", 'title': f"Synthetic Holdings {i} Group Inc."})
+        i += 1
+    return json.dumps({str(n): entry for n, entry in enumerate(entries)})
+
+
+def legacy_store(raw):
+    """The listing plus the dicts cik_json_to_dict built before the company table"""
+    filejson = json.loads(raw)
+    name_dict, ticker_dict = {}, {}
+    for value in filejson.values():
+        cik = str(value['cik_str'])
+        name_dict[value['title'].lower()] = cik
+        ticker_dict[value['ticker'].lower()] = cik
+    return filejson, name_dict, ticker_dict
+
+
+def table_store(raw):
+    return CompanyTable.from_json(json.loads(raw))
+
+
+def measure_memory(build, raw):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = build(raw)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return store, after - before
+
+
+def lookup_us(func, keys, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for key in keys:
+            func(key)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(keys))
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    raw = load_listing(size)
+    (filejson, name_dict, ticker_dict), legacy_bytes = measure_memory(legacy_store, raw)
+    table, table_bytes = measure_memory(table_store, raw)
+    tickers = [value['ticker'] for value in filejson.values()]
+    names = [value['title'] for value in filejson.values()]
+    ticker_view, name_view = table.ticker_view(), table.name_view()
+    summary = {
+        'entries': len(filejson),
+        'companies': len(table),
+        'legacy_bytes': legacy_bytes,
+        'company_table_bytes': table_bytes,
+        'memory_reduction_pct': round(100.0 * (legacy_bytes - table_bytes) / legacy_bytes, 1),
+        'legacy_ticker_lookup_us': round(lookup_us(lambda t: ticker_dict[t.lower()], tickers), 3),
+        'table_ticker_lookup_us': round(lookup_us(lambda t: ticker_view[t.lower()], tickers), 3),
+        'legacy_name_lookup_us': round(lookup_us(lambda n: name_dict[n.lower()], names), 3),
+        'table_name_lookup_us': round(lookup_us(lambda n: name_view[n.lower()], names), 3),
+    }
+    summary['table_reverse_lookup_us'] = round(lookup_us(table.by_cik, [value['cik_str'] for value in filejson.values()]), 3)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: per-request question analysis before and after the one-pass parser.
+
+Before, Lambda 3 ran the keyword scan in determine_filing_type twice per request
+(once to check the filing URL memo and again inside get_sec_document_url), and
+the model router scanned the question again for years. Now the question is
+parsed once into a QuestionIntent that is passed down. Reports microseconds per
+request for both over a set of sample questions.
+
+Usage:
+    python benchmarks/bench_question_parser.py [iterations]
+"""
+
+import json
+import os
+import sys
+import time
+
+LAMBDA3_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda3_module')
+sys.path.insert(0, LAMBDA3_DIR)
+
+import model_router
+from question_parser import parse_question
+
+QUESTIONS = [
+    "What was Apple's total revenue in 2023?",
+    "How much did Amazon invest in Anthropic in Q3 2023?",
+    "What were the quarterly earnings?",
+    "Compare FY2022 and FY2023 net income for MSFT",
+    "What were Bank of America's main credit risks in the third quarter of 2022?",
+    "Why did NVDA gross margin expand in fiscal year 2024?",
+    "Where is the company headquarters located?",
+    "Summarize the risk factors in the 10-K",
+]
+
+
+def legacy_filing_type(question):
+    """The substring scan determine_filing_type used before the parser"""
+    question_lower = question.lower()
+    if 'q1' in question_lower or 'first quarter' in question_lower:
+        return "Quarter", "1"
+    elif 'q2' in question_lower or 'second quarter' in question_lower:
+        return "Quarter", "2"
+    elif 'q3' in question_lower or 'third quarter' in question_lower:
+        return "Quarter", "3"
+    elif 'q4' in question_lower or 'fourth quarter' in question_lower:
+        return "Quarter", "4"
+    quarterly_keywords = ['quarter', 'quarterly', 'q1', 'q2', 'q3', 'q4', '10-q']
+    if any(keyword in question_lower for keyword in quarterly_keywords):
+        return "Quarter", "1"
+    return "Annual", None
+
+
+def legacy_request(question):
+    legacy_filing_type(question)
+    legacy_filing_type(question)
+    return set(model_router.YEAR_PATTERN.findall(question.lower()))
+
+
+def parsed_request(question):
+    intent = parse_question(question)
+    return intent.filing_type, intent.quarter, intent.years
+
+
+def time_per_request(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for question in QUESTIONS:
+            func(question)
+    return (time.perf_counter() - start) * 1e6 / (iterations * len(QUESTIONS))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    legacy_us = time_per_request(legacy_request, iterations)
+    parsed_us = time_per_request(parsed_request, iterations)
+    disagreements = [q for q in QUESTIONS if legacy_filing_type(q) != parsed_request(q)[:2]]
+    summary = {
+        'questions': len(QUESTIONS),
+        'iterations': iterations,
+        'legacy_us_per_request': round(legacy_us, 2),
+        'parser_us_per_request': round(parsed_us, 2),
+        # The parser also extracts the fiscal year, and company mentions on request, which the legacy scan never did
+        'intents': {q: dict(intent._asdict(), company_mentions=intent.company_mentions)
+                    for q, intent in ((q, parse_question(q)) for q in QUESTIONS)},
+        'filing_type_disagreements': disagreements,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
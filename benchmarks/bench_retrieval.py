@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: BM25 passage retrieval vs. the old 100,000-character truncation.
+
+Compares prompt size (characters and approximate tokens) and the local latency
+of building Claude's context for a set of typical questions. Bedrock time is
+estimated from prompt tokens with a configurable prefill rate, since prompt
+size is what drives time-to-first-token.
+
+Usage:
+    python benchmarks/bench_retrieval.py [--filing-chars 600000] [--prefill-tps 2500]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda3_module'))
+
+import retrieval
+from lambda_3 import MAX_DOCUMENT_CHARS
+from token_budget import estimate_tokens
+
+QUESTIONS = [
+    "What was total revenue in 2023?",
+    "What was net income for the fiscal year?",
+    "How much cash and cash equivalents did the company hold?",
+    "What were research and development expenses?",
+    "What are the main risk factors related to supply chain?",
+]
+
+SECTIONS = [
+    "Risk Factors. The Company's operations and performance depend significantly on global and regional economic conditions and supply chain partners.",
+    "Management's Discussion and Analysis. Total net sales were ${a}.{b} billion, compared with ${c}.{b} billion in the prior year.",
+    "Net income for the fiscal year was ${b}.{a} billion and diluted earnings per share were ${b}.{c}.",
+    "Cash and cash equivalents totaled ${c}.{a} billion at the end of the year, and marketable securities were ${a}.{c} billion.",
+    "Research and development expense increased to ${b}.{b} billion driven by headcount-related costs.",
+    "Legal Proceedings. The Company is subject to various legal proceedings and claims arising in the ordinary course of business.",
+]
+
+BOILERPLATE = ("The Company has entered into agreements with third parties and evaluates its "
+               "estimates on an ongoing basis, including those related to revenue recognition. ")
+
+
+def synthetic_filing(target_chars, seed=7):
+    """Build a deterministic filing-like text with facts scattered through boilerplate"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < target_chars:
+        section = rng.choice(SECTIONS).format(a=rng.randint(1, 99), b=rng.randint(1, 9), c=rng.randint(10, 400))
+        block = section + " " + BOILERPLATE * rng.randint(5, 20)
+        parts.append(block)
+        size += len(block)
+    return "".join(parts)[:target_chars]
+
+
+def run(filing_chars, prefill_tps, repeat):
+    text = synthetic_filing(filing_chars)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        truncated = text[:MAX_DOCUMENT_CHARS]
+    truncate_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        index = retrieval.BM25Index(retrieval.chunk_text(text))
+    index_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    query_ms = []
+    context_chars = []
+    context_tokens = []
+    for question in QUESTIONS:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            context = index.build_context(question)
+        query_ms.append((time.perf_counter() - start) * 1000 / repeat)
+        context_chars.append(len(context))
+        context_tokens.append(estimate_tokens(context))
+
+    baseline_tokens = estimate_tokens(truncated)
+    retrieval_tokens = sum(context_tokens) // len(context_tokens)
+    return {
+        'filing_chars': len(text),
+        'passages': len(index.passages),
+        'baseline': {
+            'context_chars': len(truncated),
+            'approx_tokens': baseline_tokens,
+            'local_ms': round(truncate_ms, 3),
+            'est_prefill_ms': round(baseline_tokens / prefill_tps * 1000, 1),
+        },
+        'retrieval': {
+            'context_chars': sum(context_chars) // len(context_chars),
+            'approx_tokens': retrieval_tokens,
+            'index_build_ms': round(index_ms, 3),
+            'query_ms': round(sum(query_ms) / len(query_ms), 3),
+            'est_prefill_ms': round(retrieval_tokens / prefill_tps * 1000, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filing-chars', type=int, default=600000)
+    parser.add_argument('--prefill-tps', type=float, default=2500.0,
+                        help='assumed Bedrock prompt processing rate (tokens/second)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.filing_chars, args.prefill_tps, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: filtering submissions columns with Python loops vs NumPy masks.
+
+Builds synthetic submissions pages the size of EDGAR's filings.recent block
+(1,000 filings of mixed forms over 20 years) and times the loops that
+find_10k_filing/find_10q_filing used to run against FilingColumns, for a batch
+of form/year queries per company. The conversion to arrays is reported
+separately, since it happens once per version of a company's submissions.
+
+Usage:
+    python benchmarks/bench_submissions_filter.py [companies] [filings_per_page]
+"""
+
+import datetime
+import json
+import os
+import random
+import sys
+import time
+
+CIK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cik_module')
+sys.path.insert(0, CIK_DIR)
+
+from CIK_module import FilingColumns
+
+FORMS = ['10-K', '10-Q', '10-Q', '10-Q', '8-K', '8-K', '4', '4', '4', 'SC 13G/A', 'DEF 14A', '10-K/A']
+YEARS = range(2005, 2025)
+
+
+def synthetic_page(seed, filings):
+    rng = random.Random(seed)
+    start = datetime.date(2025, 1, 1)
+    columns = {'form': [], 'filingDate': [], 'reportDate': [], 'accessionNumber': [], 'primaryDocument': []}
+    for i in range(filings):
+        filed = start - datetime.timedelta(days=i * 7 + rng.randrange(7))
+        columns['form'].append(rng.choice(FORMS))
+        columns['filingDate'].append(filed.isoformat())
+        columns['reportDate'].append((filed - datetime.timedelta(days=35)).isoformat())
+        columns['accessionNumber'].append(f"0000{seed:06d}-{filed.year % 100:02d}-{i:06d}")
+        columns['primaryDocument'].append(f"doc{i}.htm")
+    return columns
+
+
+def legacy_select(columns, form, year):
+    """The enumerate loop from the old finders"""
+    forms = columns['form']
+    filing_dates = columns['filingDate']
+    rows = []
+    for i, value in enumerate(forms):
+        if value == form and i < len(filing_dates):
+            if filing_dates[i].startswith(str(year)):
+                rows.append(i)
+    return rows
+
+
+def main():
+    companies = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    filings = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    pages = [synthetic_page(seed, filings) for seed in range(companies)]
+    queries = [(form, year) for form in ('10-K', '10-Q') for year in YEARS]
+
+    start = time.perf_counter()
+    legacy = [[legacy_select(page, form, year) for form, year in queries] for page in pages]
+    legacy_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arrays = [FilingColumns(page) for page in pages]
+    convert_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = [[columns.select(form, year).tolist() for form, year in queries] for columns in arrays]
+    select_s = time.perf_counter() - start
+
+    summary = {
+        'companies': companies,
+        'filings_per_page': filings,
+        'queries_per_company': len(queries),
+        'legacy_loop_ms': round(legacy_s * 1000, 1),
+        'numpy_convert_ms': round(convert_s * 1000, 1),
+        'numpy_select_ms': round(select_s * 1000, 1),
+        'speedup_excluding_convert': round(legacy_s / select_s, 1),
+        'speedup_including_convert': round(legacy_s / (convert_s + select_s), 1),
+        'results_match': legacy == vectorized,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
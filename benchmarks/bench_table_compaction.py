@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark: token count of filing text with and without table compaction.
+
+Runs the Lambda 3 HTML-to-text step over a corpus of recorded filings and
+reports approximate token counts for the old flattened text and for the text
+with tables emitted as compact tab-separated rows.
+
+Usage:
+    python benchmarks/bench_table_compaction.py [filing.htm | directory ...]
+
+Directories are searched recursively, so benchmarks/fixtures/www.sec.gov
+covers the recorded 10-Ks. Defaults to the recorded filings in
+lambda3_module/fixtures.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+
+LAMBDA3_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda3_module')
+sys.path.insert(0, LAMBDA3_DIR)
+
+from bs4 import BeautifulSoup
+
+import table_compaction
+from lambda_3 import html_to_text
+
+
+def corpus_files(paths):
+    files = []
+    for path in paths or [os.path.join(LAMBDA3_DIR, 'fixtures')]:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', '*.htm*'), recursive=True)))
+        else:
+            files.append(path)
+    return files
+
+
+def measure(path):
+    with open(path, 'rb') as f:
+        html = f.read()
+    flat = html_to_text(BeautifulSoup(html, 'html.parser'), compact_tables=False)
+    start = time.perf_counter()
+    compact = html_to_text(BeautifulSoup(html, 'html.parser'), compact_tables=True)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {
+        'file': os.path.basename(path),
+        'flat_chars': len(flat),
+        'compact_chars': len(compact),
+        'flat_tokens': table_compaction.count_tokens(flat),
+        'compact_tokens': table_compaction.count_tokens(compact),
+        'extract_ms': round(elapsed_ms, 2),
+    }
+
+
+def main():
+    results = [measure(path) for path in corpus_files(sys.argv[1:])]
+    flat_tokens = sum(r['flat_tokens'] for r in results)
+    compact_tokens = sum(r['compact_tokens'] for r in results)
+    summary = {
+        'files': results,
+        'total_flat_tokens': flat_tokens,
+        'total_compact_tokens': compact_tokens,
+        'token_reduction_pct': round(100.0 * (flat_tokens - compact_tokens) / flat_tokens, 1) if flat_tokens else 0.0,
+    }
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Recorded SEC responses for the benchmarks, stored under benchmarks/fixtures/ by URL.
+
+A response for https://data.sec.gov/submissions/CIK0000320193.json lives at
+fixtures/data.sec.gov/submissions/CIK0000320193.json, so the same tree can be
+served over HTTP or patched in for requests.get. The set covers:
+
+- www.sec.gov/files/company_tickers.json, the company listing
+- a small submissions payload (Apple, recent filings only)
+- a large submissions payload (Microsoft, 1,000 recent filings plus two
+  overflow pages going back to 1994)
+- a 10-K (inline XBRL) and a 10-Q document from those submissions
+
+The payloads follow EDGAR's layout column for column. They are generated
+deterministically by this script, which writes the tree again when run:
+
+Usage:
+    python benchmarks/fixtures.py
+"""
+
+import datetime
+import io
+import json
+import os
+import random
+import shutil
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+COMPANY_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+SUBMISSIONS_URL = "https://data.sec.gov/submissions/CIK{cik:010d}.json"
+
+# (cik, ticker, name, fiscal year end, first year, Form 4s a year, recent filings kept before overflow pages)
+SMALL_COMPANY = (320193, 'aapl', 'Apple Inc.', '0930', 2016, 20, 1000)
+LARGE_COMPANY = (789019, 'msft', 'MICROSOFT CORP', '0630', 1994, 60, 1000)
+OVERFLOW_PAGE_SIZE = 1000
+LAST_FILING_DATE = datetime.date(2025, 6, 30)
+
+# The filings the handler benchmarks ask for, written as documents
+SMALL_10K_PERIOD = datetime.date(2023, 9, 30)
+LARGE_10Q_PERIOD = datetime.date(2023, 9, 30)
+
+
+def fixture_path(url):
+    """Where the recorded response for a URL is stored"""
+    parts = urlsplit(url)
+    return os.path.join(FIXTURES_DIR, parts.netloc, *parts.path.strip('/').split('/'))
+
+
+def load_fixture(url):
+    """The recorded body for a URL as bytes, or None when there is no recording"""
+    path = fixture_path(url)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def load_json(url):
+    return json.loads(load_fixture(url))
+
+
+class FixtureResponse:
+    """The parts of requests.Response the modules use"""
+
+    def __init__(self, url, status_code, content=b''):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = {'Content-Length': str(len(content))}
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(f"{self.status_code} Error for url: {self.url}")
+
+    def iter_content(self, chunk_size=65536):
+        stream = io.BytesIO(self.content)
+        return iter(lambda: stream.read(chunk_size), b'')
+
+
+class RecordedSEC:
+    """Stand-in for requests.get that answers from the fixtures and counts requests"""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.calls.append(url)
+        content = load_fixture(url)
+        if content is None:
+            return FixtureResponse(url, 404, b'{"error": "not recorded"}')
+        return FixtureResponse(url, 200, content)
+
+
+def company_listing(size):
+    """The recorded listing padded with synthetic companies to about the size of EDGAR's"""
+    entries = list(load_json(COMPANY_TICKERS_URL).values())
+    i = 0
+    while len(entries) < size:
+        cik = 2000000 + i
+        entries.append({'cik_str': cik, 'ticker': f"ZZ{i:04d}", 'title': f"Synthetic Holdings {i} Group Inc."})
+        if i % 10 == 0:
+            entries.append({'cik_str': cik, 'ticker': f"ZZ{i:04d}-B", 'title': f"Synthetic Holdings {i} Group Inc."})
+        i += 1
+    return {str(n): entry for n, entry in enumerate(entries)}
+
+
+def period_ends(year, fiscal_year_end):
+    """The four quarter ends of a fiscal year, the last one being the fiscal year end"""
+    month, day = int(fiscal_year_end[:2]), int(fiscal_year_end[2:])
+    ends = []
+    for back in (9, 6, 3, 0):
+        m = month - back
+        y = year if m > 0 else year - 1
+        m = m if m > 0 else m + 12
+        last_day = (datetime.date(y + (m == 12), m % 12 + 1, 1) - datetime.timedelta(days=1)).day
+        ends.append(datetime.date(y, m, min(day, last_day)))
+    return ends
+
+
+def filing_rows(company):
+    """Every filing of a synthetic company, newest first, with EDGAR's submissions columns"""
+    cik, ticker, name, fiscal_year_end, first_year, form4_per_year, _ = company
+    rng = random.Random(cik)
+    rows = []
+
+    def add(form, filed, report=None, document=None, items=''):
+        if filed > LAST_FILING_DATE:
+            return
+        rows.append({
+            'filingDate': filed,
+            'reportDate': report.isoformat() if report else '',
+            'acceptanceDateTime': f"{filed.isoformat()}T16:{rng.randrange(60):02d}:{rng.randrange(60):02d}.000Z",
+            'act': '34' if form in ('10-K', '10-Q', '8-K', 'DEF 14A') else '',
+            'form': form,
+            'fileNumber': '001-37845' if form in ('10-K', '10-Q', '8-K') else '',
+            'filmNumber': str(rng.randrange(10 ** 7, 10 ** 8)) if form != '4' else '',
+            'items': items,
+            'core_type': form,
+            'size': rng.randrange(4000, 12000) if form == '4' else rng.randrange(200000, 12000000),
+            'isXBRL': 1 if form in ('10-K', '10-Q') and filed.year >= 2009 else 0,
+            'isInlineXBRL': 1 if form in ('10-K', '10-Q') and filed.year >= 2019 else 0,
+            'primaryDocument': document,
+            'primaryDocDescription': form,
+        })
+
+    for year in range(first_year, LAST_FILING_DATE.year + 2):
+        for quarter, end in enumerate(period_ends(year, fiscal_year_end), start=1):
+            if quarter == 4:
+                add('10-K', end + datetime.timedelta(days=28 + rng.randrange(14)), end, f"{ticker}-{end:%Y%m%d}.htm")
+            else:
+                add('10-Q', end + datetime.timedelta(days=30 + rng.randrange(10)), end, f"{ticker}-{end:%Y%m%d}.htm")
+        start = datetime.date(year, 1, 1)
+        for _ in range(8):
+            filed = start + datetime.timedelta(days=rng.randrange(365))
+            add('8-K', filed, filed, f"{ticker}-{filed:%Y%m%d}x8k.htm", items=rng.choice(['2.02,9.01', '5.07', '8.01,9.01']))
+        for _ in range(form4_per_year):
+            filed = start + datetime.timedelta(days=rng.randrange(365))
+            add('4', filed, filed - datetime.timedelta(days=2), 'xslF345X05/wk-form4_%d.xml' % rng.randrange(10 ** 9))
+        add('DEF 14A', start + datetime.timedelta(days=rng.randrange(365)), None, f"{ticker}-def14a_{year}.htm")
+        add('SC 13G/A', start + datetime.timedelta(days=40), None, f"sc13ga-{year}.htm")
+
+    rows.sort(key=lambda row: row['filingDate'], reverse=True)
+    sequence = {}
+    for row in rows:
+        yy = row['filingDate'].year % 100
+        sequence[yy] = sequence.get(yy, 0) + 1
+        row['accessionNumber'] = f"{cik:010d}-{yy:02d}-{sequence[yy]:06d}"
+        row['filingDate'] = row['filingDate'].isoformat()
+    return rows
+
+
+def columns(rows):
+    keys = ['accessionNumber', 'filingDate', 'reportDate', 'acceptanceDateTime', 'act', 'form', 'fileNumber',
+            'filmNumber', 'items', 'core_type', 'size', 'isXBRL', 'isInlineXBRL', 'primaryDocument',
+            'primaryDocDescription']
+    return {key: [row[key] for row in rows] for key in keys}
+
+
+def submissions(company):
+    """The submissions payload and its overflow pages ({file name: page})"""
+    cik, ticker, name, fiscal_year_end, _, _, recent_size = company
+    rows = filing_rows(company)
+    recent, older = rows[:recent_size], rows[recent_size:]
+    pages = {}
+    files = []
+    for n in range(0, len(older), OVERFLOW_PAGE_SIZE):
+        chunk = older[n:n + OVERFLOW_PAGE_SIZE]
+        page_name = f"CIK{cik:010d}-submissions-{n // OVERFLOW_PAGE_SIZE + 1:03d}.json"
+        pages[page_name] = columns(chunk)
+        files.append({'name': page_name, 'filingCount': len(chunk),
+                      'filingFrom': chunk[-1]['filingDate'], 'filingTo': chunk[0]['filingDate']})
+    payload = {
+        'cik': str(cik), 'entityType': 'operating', 'sic': '3571', 'sicDescription': 'Electronic Computers',
+        'insiderTransactionForOwnerExists': 0, 'insiderTransactionForIssuerExists': 1,
+        'name': name, 'tickers': [ticker.upper()], 'exchanges': ['Nasdaq'],
+        'ein': '942404110', 'category': 'Large accelerated filer', 'fiscalYearEnd': fiscal_year_end,
+        'stateOfIncorporation': 'CA', 'formerNames': [],
+        'filings': {'recent': columns(recent), 'files': files},
+    }
+    return payload, pages
+
+
+def document_url(company, payload, form, period):
+    """Archive URL of the filing of a form for a period in a submissions payload"""
+    recent = payload['filings']['recent']
+    for i, value in enumerate(recent['form']):
+        if value == form and recent['reportDate'][i] == period.isoformat():
+            accession = recent['accessionNumber'][i].replace('-', '')
+            return f"https://www.sec.gov/Archives/edgar/data/{company[0]}/{accession}/{recent['primaryDocument'][i]}"
+    raise ValueError(f"No {form} for {period} in the generated submissions")
+
+
+NARRATIVE = [
+    "The Company's operations and performance depend significantly on global and regional economic conditions, "
+    "and adverse economic conditions can materially adversely affect the Company's business.",
+    "The Company depends on component and product manufacturing and logistical services provided by outsourcing "
+    "partners, many of which are located outside of the U.S., and supply chain disruptions could affect results.",
+    "Net sales for {year} were ${a},{b:03d} million, and gross margin percentage was {c}.{d}%, "
+    "reflecting cost savings and a different product mix.",
+    "Research and development expense increased {c}% to ${a},{b:03d} million, driven primarily by headcount-related costs.",
+    "The Company believes its balances of unrestricted cash, cash equivalents and marketable securities, along with "
+    "cash generated by ongoing operations, will be sufficient to satisfy its cash requirements over the next 12 months.",
+    "The Company is subject to legal proceedings and claims that have not been fully resolved and that have arisen "
+    "in the ordinary course of business.",
+]
+
+TABLE_ROW = ('<tr><td style="width:48%"><span>{label}</span></td>'
+             '<td style="width:1%"><span>$</span></td><td style="width:10%;text-align:right"><span>{a:,}</span></td>'
+             '<td style="width:1%"><span></span></td><td><span></span></td>'
+             '<td style="width:1%"><span>$</span></td><td style="width:10%;text-align:right"><span>{b:,}</span></td>'
+             '<td style="width:1%"><span></span></td></tr>\n')
+
+LABELS = ['Products', 'Services', 'Total net sales', 'Cost of sales', 'Gross margin', 'Research and development',
+          'Selling, general and administrative', 'Operating income', 'Other income/(expense), net',
+          'Income before provision for income taxes', 'Provision for income taxes', 'Net income']
+
+
+def filing_document(sample, title, sections, seed):
+    """A filing of realistic size: the sample's XBRL header and tables, then narrative and financial tables"""
+    rng = random.Random(seed)
+    with open(sample) as f:
+        html = f.read()
+    body = [f'<div><span style="font-weight:700">{title}</span></div>\n']
+    for n in range(sections):
+        body.append(f'<div><span style="font-weight:700">Item {n % 15 + 1}. Section {n + 1}</span></div>\n')
+        for _ in range(rng.randint(4, 10)):
+            text = rng.choice(NARRATIVE).format(year=2023, a=rng.randint(1, 400), b=rng.randrange(1000),
+                                                c=rng.randint(1, 60), d=rng.randrange(10))
+            body.append(f'<div style="margin-top:6pt"><span style="font-family:Helvetica;font-size:9pt">{text}</span></div>\n')
+        if n % 3 == 0:
+            body.append('<table style="border-collapse:collapse;width:100%">\n')
+            for label in rng.sample(LABELS, 8):
+                body.append(TABLE_ROW.format(label=label, a=rng.randint(100, 400000), b=rng.randint(100, 400000)))
+            body.append('</table>\n')
+    return html.replace('</body>', ''.join(body) + '</body>')
+
+
+def write(url, content):
+    path = fixture_path(url)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = 'w' if isinstance(content, str) else 'wb'
+    with open(path, mode) as f:
+        f.write(content)
+    return path
+
+
+def write_json(url, payload):
+    return write(url, json.dumps(payload, separators=(',', ':')))
+
+
+def generate():
+    """Write the fixture tree; returns the URLs of the documents the handler benchmarks use"""
+    listing = fixture_path(COMPANY_TICKERS_URL)
+    os.makedirs(os.path.dirname(listing), exist_ok=True)
+    shutil.copyfile(os.path.join(ROOT, 'cik_module', 'fixtures', 'company_tickers.json'), listing)
+
+    documents = {}
+    for company in (SMALL_COMPANY, LARGE_COMPANY):
+        payload, pages = submissions(company)
+        write_json(SUBMISSIONS_URL.format(cik=company[0]), payload)
+        for page_name, page in pages.items():
+            write_json(f"https://data.sec.gov/submissions/{page_name}", page)
+        documents[company[1]] = payload
+
+    samples = os.path.join(ROOT, 'lambda3_module', 'fixtures')
+    ten_k = document_url(SMALL_COMPANY, documents['aapl'], '10-K', SMALL_10K_PERIOD)
+    write(ten_k, filing_document(os.path.join(samples, 'sample_10k_ixbrl.htm'), 'ANNUAL REPORT', 80, 1))
+    ten_q = document_url(LARGE_COMPANY, documents['msft'], '10-Q', LARGE_10Q_PERIOD)
+    write(ten_q, filing_document(os.path.join(samples, 'sample_10q_tables.htm'), 'QUARTERLY REPORT', 40, 2))
+    return {'10-K': ten_k, '10-Q': ten_q}
+
+
+if __name__ == '__main__':
+    print(json.dumps(generate(), indent=2))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Local EDGAR replay server: serves the recorded fixtures over HTTP like sec.gov.
+
+Requests are answered from benchmarks/fixtures/ by host and path, so
+http://127.0.0.1:8765/data.sec.gov/submissions/CIK0000320193.json returns the
+recording of https://data.sec.gov/submissions/CIK0000320193.json. Point the
+pipeline at it with SEC_EDGAR_BASE_URL (read by CIK_module, lambda_1 and
+lambda_3) or SECEdgar(base_url=...).
+
+A network profile shapes every response:
+- latency_ms/jitter_ms: time before the response starts (latency plus a uniform jitter)
+- bandwidth_kbps: the body is written at this rate (0 for unlimited)
+- error_rate: fraction of requests answered 503
+- throttle_rate: fraction answered 429, on top of rate_limit
+- rate_limit: requests per second over which requests get 429, as sec.gov does at 10
+
+Record mode (--record) fetches anything not yet recorded from the real host,
+saves it to the fixture tree and serves it; the SEC asks for a User-Agent
+naming you and an email address. GET /__stats returns request counts as JSON.
+
+Usage:
+    python benchmarks/replay_server.py [--port 8765] [--profile sec] [--latency-ms 50] \
+        [--error-rate 0.02] [--record --user-agent "Name name@example.com"]
+    SEC_EDGAR_BASE_URL=http://127.0.0.1:8765 python lambda2_module/lambda_2.py
+"""
+
+import argparse
+import json
+import mimetypes
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from fixtures import FIXTURES_DIR
+
+SEC_HOSTS = ('www.sec.gov', 'data.sec.gov')
+CHUNK_BYTES = 16 * 1024
+
+Profile = namedtuple('Profile', ['latency_ms', 'jitter_ms', 'bandwidth_kbps', 'error_rate', 'throttle_rate', 'rate_limit'])
+
+PROFILES = {
+    'none': Profile(0, 0, 0, 0.0, 0.0, 0),
+    # Typical sec.gov from a US region, including its 10 requests per second limit
+    'sec': Profile(80, 60, 20000, 0.0, 0.0, 10),
+    'slow': Profile(400, 300, 2000, 0.0, 0.0, 10),
+    'flaky': Profile(80, 60, 20000, 0.05, 0.05, 10),
+}
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Threaded HTTP server for the fixture tree; start() runs it in the background"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, profile=PROFILES['none'], fixtures_dir=FIXTURES_DIR, record=False,
+                 user_agent=None, seed=None, host='127.0.0.1'):
+        super().__init__((host, port), ReplayHandler)
+        self.profile = profile
+        self.fixtures_dir = os.path.abspath(fixtures_dir)
+        self.record = record
+        self.user_agent = user_agent
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+        self._recent = deque()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def decide(self):
+        """Delay in seconds and the status to inject (None to serve the recording) for one request"""
+        profile = self.profile
+        with self.lock:
+            delay = (profile.latency_ms + self.rng.uniform(0, profile.jitter_ms)) / 1000
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            self._recent.append(now)
+            if profile.rate_limit and len(self._recent) > profile.rate_limit:
+                return delay, 429
+            roll = self.rng.random()
+        if roll < profile.throttle_rate:
+            return delay, 429
+        if roll < profile.throttle_rate + profile.error_rate:
+            return delay, 503
+        return delay, None
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def local_path(self, request_path):
+        """Fixture file for a request path like /data.sec.gov/submissions/CIK0000320193.json, or None"""
+        parts = request_path.split('?', 1)[0].strip('/').split('/')
+        if len(parts) < 2 or parts[0] not in SEC_HOSTS or '..' in parts:
+            return None
+        return os.path.join(self.fixtures_dir, *parts)
+
+    def fetch_upstream(self, request_path, path):
+        """Record mode: fetch the path from the real host and save it as a fixture"""
+        host, _, rest = request_path.strip('/').partition('/')
+        response = requests.get(f"https://{host}/{rest}", headers={'User-Agent': self.user_agent}, timeout=30)
+        self.count('recorded_requests')
+        if response.status_code != 200:
+            return response.status_code
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(response.content)
+        self.count('recorded_files')
+        print(f"Recorded https://{host}/{rest} ({len(response.content)} bytes)")
+        return 200
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        if self.path == '/__stats':
+            with server.lock:
+                body = json.dumps(dict(server.stats)).encode('utf-8')
+            return self.respond(200, body, 'application/json')
+
+        server.count('requests')
+        delay, injected = server.decide()
+        time.sleep(delay)
+        if injected is not None:
+            server.count(f"status_{injected}")
+            message = b'Request Rate Threshold Exceeded' if injected == 429 else b'Service Unavailable'
+            return self.respond(injected, message, 'text/plain', {'Retry-After': '1'} if injected == 429 else None)
+
+        path = server.local_path(self.path)
+        if path is None:
+            server.count('status_400')
+            return self.respond(400, b'Path must start with /www.sec.gov/ or /data.sec.gov/', 'text/plain')
+        if not os.path.isfile(path) and server.record:
+            status = server.fetch_upstream(self.path, path)
+            if status != 200:
+                server.count(f"status_{status}")
+                return self.respond(status, b'Upstream error', 'text/plain')
+        if not os.path.isfile(path):
+            server.count('status_404')
+            return self.respond(404, b'Not recorded', 'text/plain')
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        server.count('status_200')
+        server.count('bytes_sent', len(body))
+        content_type = 'application/json' if path.endswith('.json') else mimetypes.guess_type(path)[0] or 'text/html'
+        self.respond(200, body, content_type, bandwidth_kbps=server.profile.bandwidth_kbps)
+
+    def respond(self, status, body, content_type, headers=None, bandwidth_kbps=0):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if not bandwidth_kbps:
+            self.wfile.write(body)
+            return
+        # Throttle the body to the profile's bandwidth
+        seconds_per_chunk = CHUNK_BYTES * 8 / (bandwidth_kbps * 1000)
+        for start in range(0, len(body), CHUNK_BYTES):
+            self.wfile.write(body[start:start + CHUNK_BYTES])
+            time.sleep(seconds_per_chunk * min(1.0, (len(body) - start) / CHUNK_BYTES))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='none')
+    for field, kind in (('latency_ms', float), ('jitter_ms', float), ('bandwidth_kbps', float),
+                        ('error_rate', float), ('throttle_rate', float), ('rate_limit', int)):
+        parser.add_argument('--' + field.replace('_', '-'), type=kind, help=f"override the profile's {field}")
+    parser.add_argument('--fixtures', default=FIXTURES_DIR)
+    parser.add_argument('--record', action='store_true', help='fetch and save anything not recorded yet')
+    parser.add_argument('--user-agent', help='User-Agent for record mode, e.g. "Name name@example.com"')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    if args.record and not args.user_agent:
+        parser.error('--record needs --user-agent; the SEC rejects requests without one')
+
+    overrides = {field: getattr(args, field) for field in Profile._fields if getattr(args, field) is not None}
+    profile = PROFILES[args.profile]._replace(**overrides)
+    server = ReplayServer(args.port, profile, args.fixtures, args.record, args.user_agent, args.seed)
+    print(json.dumps({'base_url': server.base_url, 'profile': profile._asdict(), 'record': args.record}, indent=2))
+    print(f"export SEC_EDGAR_BASE_URL={server.base_url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: times every hot path against the recorded SEC fixtures.
+
+Covers the CIK module (cik_json_to_dict, search_names, find_10k_filing,
+find_10q_filing, including walks through overflow submissions pages),
+lambda_3.download_sec_document, and the three handlers end to end with S3,
+Lambda invoke and Bedrock replaced by the in-memory stand-ins in aws_stubs.py,
+injected through lambda_3.set_client_factory and lambda_2.set_s3_client.
+Nothing touches the network or AWS. --aws aws gives the stand-ins warm
+in-region latencies and Bedrock token rates, so the handler timings show
+where a real request spends its time; the default "instant" isolates local work. Caches are cleared before every timed
+iteration, so each one measures a cold lookup in a warm container.
+
+With --replay PROFILE the SEC requests go over HTTP to the local replay server
+(replay_server.py) with that network profile, e.g. "sec" for sec.gov-like
+latency and rate limiting; failed iterations are counted in "errors".
+
+Results are printed (or written with --output) as JSON. Pass --compare with an
+earlier results file to check for regressions: any benchmark whose median is
+more than --tolerance slower fails the run with exit status 1.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--repeat 20] [--companies 10000] [--only find_10] \
+        [--replay sec] [--aws aws] [--output results.json] [--compare baseline.json] [--tolerance 0.25]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+for module_dir in ('lambda1_module', 'lambda2_module', 'lambda3_module', 'cik_module'):
+    sys.path.insert(0, os.path.join(ROOT, module_dir))
+sys.path.insert(0, BENCH_DIR)
+
+import CIK_module
+import answer_cache
+import lambda_1
+import lambda_2
+import lambda_3
+import retrieval
+import xbrl_facts
+from CIK_module import SECEdgar
+from aws_stubs import PROFILES as AWS_PROFILES, fake_aws, stub_aws
+from replay_server import PROFILES, ReplayServer
+from fixtures import (COMPANY_TICKERS_URL, LARGE_COMPANY, LARGE_10Q_PERIOD, SMALL_COMPANY, SMALL_10K_PERIOD,
+                      SUBMISSIONS_URL, RecordedSEC, company_listing, document_url, load_json)
+
+LISTING_BUCKET = 'nathanasfaw-sec-edgar-files'
+LISTING_KEY = 'company_tickers.json'
+LAMBDA2_FUNCTION = 'NathanAsfaw-SEC-Document-Processor'
+
+
+def clear_caches():
+    """Forget everything the modules cache between invocations of a warm container"""
+    CIK_module.clear_fiscal_period_cache()
+    CIK_module.clear_negative_cache()
+    CIK_module.clear_company_facts_cache()
+    lambda_2._unknown_companies.clear()
+    answer_cache.clear_answer_cache()
+    retrieval.clear_index_cache()
+    xbrl_facts.clear_fact_cache()
+
+
+class Context:
+    """Fixtures and stubs shared by the benchmarks"""
+
+    def __init__(self, companies, replay=None, aws_profile='instant'):
+        self.sec = RecordedSEC()
+        self.replay = replay
+        self.aws_profile = aws_profile
+        self.listing = company_listing(companies)
+        self.small_cik, self.large_cik = str(SMALL_COMPANY[0]), str(LARGE_COMPANY[0])
+        self.small = load_json(SUBMISSIONS_URL.format(cik=SMALL_COMPANY[0]))
+        self.large = load_json(SUBMISSIONS_URL.format(cik=LARGE_COMPANY[0]))
+        self.ten_k_url = document_url(SMALL_COMPANY, self.small, '10-K', SMALL_10K_PERIOD)
+        self.ten_q_url = document_url(LARGE_COMPANY, self.large, '10-Q', LARGE_10Q_PERIOD)
+        with patch('requests.get', side_effect=self.sec.get), contextlib.redirect_stdout(io.StringIO()):
+            self.edgar = SECEdgar(COMPANY_TICKERS_URL)
+
+    def sec_access(self):
+        """Serve SEC requests from the fixtures in-process, or send them to the replay server"""
+        stack = contextlib.ExitStack()
+        if self.replay is None:
+            stack.enter_context(patch('requests.get', side_effect=self.sec.get))
+        else:
+            stack.enter_context(patch.dict(os.environ, {'SEC_EDGAR_BASE_URL': self.replay.base_url}))
+            stack.enter_context(patch.object(CIK_module, 'SEC_EDGAR_BASE_URL', self.replay.base_url))
+            stack.enter_context(patch.object(self.edgar, 'base_url', self.replay.base_url))
+        return stack
+
+    def sec_requests(self):
+        return len(self.sec.calls) if self.replay is None else self.replay.stats['requests']
+
+    @contextlib.contextmanager
+    def aws(self):
+        """Inject the AWS stand-ins into Lambda 2 and 3; Lambda 1 has no hook, so boto3 is patched for it"""
+        aws = fake_aws(self.aws_profile, {(LISTING_BUCKET, LISTING_KEY): json.dumps(self.listing).encode('utf-8')},
+                       {LAMBDA2_FUNCTION: lambda_2.lambda_handler}, seed=1)
+        lambda_3.set_client_factory(aws.client)
+        lambda_2.set_s3_client(aws.s3)
+        try:
+            with stub_aws(aws):
+                yield aws
+        finally:
+            lambda_3.set_client_factory(None)
+            lambda_2.set_s3_client(None)
+
+
+def handler_ok(result):
+    if result.get('statusCode') != 200:
+        raise AssertionError(f"Handler returned {result.get('statusCode')}: {result.get('body')}")
+    return result
+
+
+# Each benchmark returns a function to time; caches are cleared before every call
+
+def bench_cik_json_to_dict(ctx):
+    raw = json.dumps(ctx.listing)
+
+    def run():
+        ctx.edgar.filejson = json.loads(raw)
+        ctx.edgar.cik_json_to_dict()
+    return run
+
+
+def bench_search_names(ctx):
+    return lambda: [ctx.edgar.search_names(partial) for partial in ('apple', 'holdings 12', 'corp', 'bank of')]
+
+
+def bench_find_10k_filing(ctx):
+    return lambda: ctx.edgar.find_10k_filing(ctx.small_cik, 2023, ctx.small)
+
+
+def bench_find_10k_filing_overflow(ctx):
+    return lambda: ctx.edgar.find_10k_filing(ctx.large_cik, 2001, ctx.large)
+
+
+def bench_find_10q_filing(ctx):
+    return lambda: ctx.edgar.find_10q_filing(ctx.large_cik, 2023, 2, ctx.large)
+
+
+def bench_find_10q_filing_overflow(ctx):
+    return lambda: ctx.edgar.find_10q_filing(ctx.large_cik, 2004, 2, ctx.large)
+
+
+def bench_download_sec_document(ctx):
+    return lambda: lambda_3.download_sec_document(ctx.ten_k_url, max_chars=None)
+
+
+def bench_lambda1_handler(ctx):
+    return lambda: handler_ok(lambda_1.lambda_handler({}, None))
+
+
+def bench_lambda2_annual(ctx):
+    event = {'request_type': 'Annual', 'company': 'AAPL', 'year': '2023'}
+    return lambda: handler_ok(lambda_2.lambda_handler(event, None))
+
+
+def bench_lambda2_quarter(ctx):
+    event = {'request_type': 'Quarter', 'company': 'MSFT', 'year': '2024', 'quarter': 'Q1'}
+    return lambda: handler_ok(lambda_2.lambda_handler(event, None))
+
+
+def bench_lambda3_xbrl_answer(ctx):
+    event = {'question': "What was Apple's total revenue in 2023?", 'ticker': 'AAPL', 'year': '2023'}
+    return lambda: handler_ok(lambda_3.lambda_handler(event, None))
+
+
+def bench_lambda3_bedrock_answer(ctx):
+    event = {'question': "What are the main supply chain risks?", 'ticker': 'AAPL', 'year': '2023'}
+    return lambda: handler_ok(lambda_3.lambda_handler(event, None))
+
+
+def bench_lambda3_stream_answer(ctx):
+    event = {'question': "What are the main supply chain risks?", 'ticker': 'AAPL', 'year': '2023', 'stream': True}
+    return lambda: handler_ok(lambda_3.lambda_handler(event, None))
+
+
+BENCHMARKS = [
+    ('cik_json_to_dict', bench_cik_json_to_dict),
+    ('search_names', bench_search_names),
+    ('find_10k_filing', bench_find_10k_filing),
+    ('find_10k_filing_overflow', bench_find_10k_filing_overflow),
+    ('find_10q_filing', bench_find_10q_filing),
+    ('find_10q_filing_overflow', bench_find_10q_filing_overflow),
+    ('download_sec_document', bench_download_sec_document),
+    ('lambda1_handler', bench_lambda1_handler),
+    ('lambda2_annual', bench_lambda2_annual),
+    ('lambda2_quarter', bench_lambda2_quarter),
+    ('lambda3_xbrl_answer', bench_lambda3_xbrl_answer),
+    ('lambda3_bedrock_answer', bench_lambda3_bedrock_answer),
+    ('lambda3_stream_answer', bench_lambda3_stream_answer),
+]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(ctx, run, repeat):
+    """Time run() repeat times after one untimed warm-up; returns summary stats in milliseconds"""
+    samples = []
+    requests_made = errors = 0
+    with ctx.sec_access(), ctx.aws(), contextlib.redirect_stdout(io.StringIO()):
+        clear_caches()
+        try:
+            run()
+        except Exception:
+            pass
+        for _ in range(repeat):
+            clear_caches()
+            before = ctx.sec_requests()
+            start = time.perf_counter()
+            try:
+                run()
+            except Exception:
+                errors += 1
+            samples.append((time.perf_counter() - start) * 1000)
+            requests_made = ctx.sec_requests() - before
+    return {
+        'iterations': repeat,
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'sec_requests': requests_made,
+        'errors': errors,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Median change per benchmark against a baseline results file; regressions exceed the tolerance"""
+    report = {}
+    for name, current in results['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        ratio = current['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        report[name] = {
+            'baseline_median_ms': before['median_ms'],
+            'median_ms': current['median_ms'],
+            'change_pct': round((ratio - 1) * 100, 1),
+            'regression': ratio > 1 + tolerance,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--companies', type=int, default=10000, help='size of the padded company listing')
+    parser.add_argument('--only', action='append', help='run benchmarks whose name contains this (repeatable)')
+    parser.add_argument('--replay', choices=sorted(PROFILES), help='go through the replay server with this profile')
+    parser.add_argument('--aws', choices=sorted(AWS_PROFILES), default='instant',
+                        help='latency profile of the AWS stand-ins')
+    parser.add_argument('--output', help='write the results JSON here')
+    parser.add_argument('--compare', help='baseline results JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed median slowdown (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    replay = ReplayServer(profile=PROFILES[args.replay], seed=1) if args.replay else None
+    if replay:
+        replay.start()
+    ctx = Context(args.companies, replay, args.aws)
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'companies': len(ctx.listing),
+            'replay_profile': args.replay,
+            'aws_profile': args.aws,
+        },
+        'results': {},
+    }
+    for name, bench in BENCHMARKS:
+        if args.only and not any(part in name for part in args.only):
+            continue
+        results['results'][name] = measure(ctx, bench(ctx), args.repeat)
+    if replay:
+        results['meta']['replay_stats'] = dict(replay.stats)
+        replay.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            report = compare(results, json.load(f), args.tolerance)
+        print(json.dumps({'comparison': report}, indent=2))
+        regressions = [name for name, entry in report.items() if entry['regression']]
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
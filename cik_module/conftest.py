@@ -0,0 +1,99 @@
+import json
+import os
+from contextlib import ExitStack
+from unittest.mock import patch
+
+import pytest
+import CIK_module
+from CIK_module import SECEdgar
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+# Returns the recorded SEC response for a URL from the fixtures folder, or a 404
+def fixture_response(url):
+    name = url.rsplit('/', 1)[-1]
+    path = os.path.join(FIXTURES, 'companyfacts_' + name if '/companyfacts/' in url else name)
+    if not os.path.exists(path):
+        return FakeResponse(404)
+    with open(path) as f:
+        return FakeResponse(200, json.load(f))
+
+
+# Serves recorded SEC responses from the fixtures folder and counts requests per URL
+def fake_sec_get(calls):
+    def get(url, headers=None, **kwargs):
+        calls.append(url)
+        return fixture_response(url)
+    return get
+
+
+def columns(*filings):
+    keys = ('form', 'filingDate', 'reportDate', 'accessionNumber', 'primaryDocument')
+    return {key: [filing[n] for filing in filings] for n, key in enumerate(keys)}
+
+
+# Apple's fiscal year ends on the last Saturday of September
+APPLE = {
+    'fiscalYearEnd': '0930',
+    'filings': {
+        'recent': columns(
+            ('10-Q', '2024-02-02', '2023-12-30', '0000320193-24-000006', 'aapl-20231230.htm'),
+            ('10-K', '2023-11-03', '2023-09-30', '0000320193-23-000106', 'aapl-20230930.htm'),
+            ('10-Q', '2023-08-04', '2023-07-01', '0000320193-23-000077', 'aapl-20230701.htm'),
+            ('8-K', '2023-08-03', '', '0000320193-23-000075', 'aapl-20230803.htm'),
+            ('10-Q', '2023-05-05', '2023-04-01', '0000320193-23-000064', 'aapl-20230401.htm'),
+            ('10-Q', '2023-02-03', '2022-12-31', '0000320193-23-000006', 'aapl-20221231.htm'),
+        ),
+        'files': [{'name': 'CIK0000320193-submissions-001.json'}],
+    },
+}
+# Older pages put the columns at the top level
+OLDER_PAGE = columns(('10-K', '2022-10-28', '2022-09-24', '0000320193-22-000108', 'aapl-20220924.htm'))
+
+
+def clear_caches():
+    CIK_module.clear_company_facts_cache()
+    CIK_module.clear_fiscal_period_cache()
+    CIK_module.clear_negative_cache()
+
+
+# Builds SECEdgar instances on the recorded company listing: sec_edgar(respond, **kwargs) answers
+# the instance's SEC requests with respond(url) (the recorded fixtures by default) for the rest of
+# the test, keeping the URLs in edgar.calls and the timeouts in edgar.timeouts
+@pytest.fixture
+def sec_edgar():
+    clear_caches()
+    patches = ExitStack()
+
+    def build(respond=fixture_response, **kwargs):
+        with patch('CIK_module.requests.get', side_effect=fake_sec_get([])):
+            edgar = SECEdgar('https://www.sec.gov/files/company_tickers.json', **kwargs)
+        edgar.calls = []
+        edgar.timeouts = []
+
+        def get(url, headers=None, timeout=None, **get_kwargs):
+            edgar.calls.append(url)
+            edgar.timeouts.append(timeout)
+            return respond(url)
+
+        patches.enter_context(patch('CIK_module.requests.get', side_effect=get))
+        return edgar
+
+    with patches:
+        yield build
+    clear_caches()
+
+
+@pytest.fixture
+def se(sec_edgar):
+    return sec_edgar()
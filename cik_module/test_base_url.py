@@ -0,0 +1,32 @@
+from unittest.mock import patch
+
+import CIK_module
+from CIK_module import SECEdgar, sec_url
+from conftest import APPLE, FakeResponse, fake_sec_get
+
+
+# Test that only sec.gov hosts are rewritten, keeping the path and query
+def test_sec_url():
+    url = "https://data.sec.gov/submissions/CIK0000320193.json"
+    assert sec_url(url) == url
+    assert sec_url(url, "http://127.0.0.1:8765/") == "http://127.0.0.1:8765/data.sec.gov/submissions/CIK0000320193.json"
+    assert sec_url("https://www.sec.gov/cgi-bin/browse-edgar?action=getcompany", "http://replay") == \
+        "http://replay/www.sec.gov/cgi-bin/browse-edgar?action=getcompany"
+    assert sec_url("https://example.com/data.json", "http://replay") == "https://example.com/data.json"
+    with patch.object(CIK_module, 'SEC_EDGAR_BASE_URL', "http://replay"):
+        assert sec_url(url) == "http://replay/data.sec.gov/submissions/CIK0000320193.json"
+
+
+# Test that SECEdgar fetches through the base URL but returns canonical filing URLs
+def test_secedgar_base_url():
+    calls = []
+    with patch('CIK_module.requests.get', side_effect=fake_sec_get(calls)):
+        se = SECEdgar(base_url="http://127.0.0.1:8765")
+    assert calls == ["http://127.0.0.1:8765/www.sec.gov/files/company_tickers.json"]
+    assert se.ticker_to_cik('AAPL') == '320193'
+
+    CIK_module.clear_fiscal_period_cache()
+    with patch('CIK_module.requests.get', return_value=FakeResponse(200, APPLE)) as get:
+        url = se.annual_filing('320193', 2023)
+    assert get.call_args[0][0] == "http://127.0.0.1:8765/data.sec.gov/submissions/CIK0000320193.json"
+    assert url == "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
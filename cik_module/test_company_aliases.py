@@ -0,0 +1,49 @@
+from CIK_module import SECEdgar, build_alias_index, company_alias
+
+
+# Test that case, punctuation, "&" and legal suffixes do not change the alias
+def test_company_alias():
+    assert company_alias("Apple Inc.") == company_alias("APPLE INC") == company_alias("Apple") == 'apple'
+    assert company_alias("BANK OF AMERICA CORP /DE/") == 'bank of america'
+    assert company_alias("JPMorgan Chase & Co.") == company_alias("jpmorgan chase and co") == 'jpmorgan chase'
+    assert company_alias("The Coca-Cola Company") == 'coca cola'
+    assert company_alias("Apple Inc.", strip_suffixes=False) == 'apple inc'
+
+
+# Test that name variants resolve through the alias index
+def test_name_variants(se):
+    for name in ["Apple", "Apple Inc", "APPLE INC", "apple inc."]:
+        assert se.name_to_cik(name) == '320193'
+    assert se.name_to_cik("Bank of America") == '70858'
+    assert se.name_to_cik("JPMorgan Chase and Co") == '19617'
+    assert se.name_to_cik("Nonexistent Company") is None
+
+
+# Test that companies sharing an alias are reported, not overwritten
+def test_collisions_are_kept_apart():
+    aliases, collisions = build_alias_index({'acme inc': '1', 'acme corp': '2', 'beta co': '3', 'beta inc': '3'})
+    assert aliases == {'beta': '3'}
+    assert collisions == {'acme': {'acme inc': '1', 'acme corp': '2'}}
+    # A third company with the alias joins the collisions instead of claiming it
+    aliases, collisions = build_alias_index({'acme inc': '1', 'acme corp': '2', 'acme co': '3', 'acme ltd': '3'})
+    assert aliases == {}
+    assert collisions == {'acme': {'acme inc': '1', 'acme corp': '2', 'acme co': '3', 'acme ltd': '3'}}
+
+    se = SECEdgar.__new__(SECEdgar)
+    se.filejson = {'0': {'cik_str': 1, 'ticker': 'ACMI', 'title': 'Acme Inc'},
+                   '1': {'cik_str': 2, 'ticker': 'ACMC', 'title': 'ACME CORP'}}
+    se.cik_json_to_dict()
+    # Built on first use, not by cik_json_to_dict
+    assert se._alias_index is None
+    assert list(se.alias_collisions) == ['acme']
+    assert se.name_to_cik("acme") is None
+    assert se.name_to_cik("Acme Corp.") == '2'
+    assert se.find_companies("How did Acme do?") == []
+
+
+# Test that ticker hits don't pay for the alias index, and the first name lookup builds it
+def test_alias_index_built_on_name_lookup(se):
+    assert se.ticker_to_cik('AAPL') == '320193'
+    assert se._alias_index is None
+    assert se.name_to_cik('Apple') == '320193'
+    assert se._alias_index is not None
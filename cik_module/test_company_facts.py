@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+import CIK_module
+
+
+# Test that each fiscal year maps to the filing's own period, not the restated prior years
+def test_lookup_metric_by_fiscal_year(se):
+    revenue_2023 = se.lookup_metric('320193', 'RevenueFromContractWithCustomerExcludingAssessedTax', 2023)
+    assert revenue_2023['value'] == 383285000000
+    assert revenue_2023['end'] == '2023-09-30'
+
+    revenue_2022 = se.lookup_metric('320193', 'us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax', 2022)
+    assert revenue_2022['value'] == 394328000000
+
+    # Quarterly keys keep the three-month value, not the year-to-date one
+    q3 = se.lookup_metric('320193', 'RevenueFromContractWithCustomerExcludingAssessedTax', 2023, 'Q3')
+    assert q3['value'] == 81797000000
+
+    # Instant facts use the latest balance sheet date in the filing
+    assets = se.lookup_metric('320193', 'Assets', 2023)
+    assert assets['value'] == 352583000000
+
+    assert se.lookup_metric('320193', 'Revenues', 2023) is None
+
+
+# Test that trend lookups for several years are served from one cached download
+def test_metric_history_uses_cache(se):
+    history = se.metric_history('0000320193', 'NetIncomeLoss', [2021, 2022, 2023])
+    assert history[2021] is None
+    assert history[2022]['value'] == 99803000000
+    assert history[2023]['value'] == 96995000000
+
+    se.lookup_metric('320193', 'NetIncomeLoss', 2022)
+    facts_calls = [url for url in se.calls if '/companyfacts/' in url]
+    assert facts_calls == ['https://data.sec.gov/api/xbrl/companyfacts/CIK0000320193.json']
+
+
+# Test that an expired entry is fetched again
+def test_company_facts_ttl(se):
+    se.company_facts_index('320193')
+    with patch('CIK_module.time.time', return_value=CIK_module.time.time() + CIK_module.COMPANY_FACTS_TTL_SECONDS + 1):
+        se.company_facts_index('320193')
+    assert len([url for url in se.calls if '/companyfacts/' in url]) == 2
+
+
+# Test that unknown companies return None rather than raising
+def test_company_facts_missing(se):
+    assert se.company_facts_index('0000000') is None
+    assert se.lookup_metric('0000000', 'Revenues', 2023) is None
+    assert se.company_facts_index(None) is None
+
+
+# Test that a single-concept lookup reuses a fresh companyfacts download
+def test_company_concept_reuses_company_facts(se):
+    se.company_facts_index('320193')
+    index = se.company_concept_index('320193', 'NetIncomeLoss')
+    assert index[('us-gaap:NetIncomeLoss', 2023, 'FY')]['value'] == 96995000000
+    assert not [url for url in se.calls if '/companyconcept/' in url]
+
+
+# Test that the shared cache keeps only the most recently used entries and drops expired ones
+def test_company_facts_cache_is_bounded():
+    CIK_module.clear_company_facts_cache()
+    with patch.object(CIK_module, 'COMPANY_FACTS_CACHE_SIZE', 2):
+        CIK_module.cache_company_facts('1', {})
+        CIK_module.cache_company_facts('2', {})
+        assert CIK_module.cached_company_facts('1') == {}
+        CIK_module.cache_company_facts('3', {})
+        assert set(CIK_module._company_facts_cache) == {'1', '3'}
+    later = CIK_module.time.time() + CIK_module.COMPANY_FACTS_TTL_SECONDS + 1
+    with patch('CIK_module.time.time', return_value=later):
+        CIK_module.cache_company_facts('4', {})
+    assert set(CIK_module._company_facts_cache) == {'4'}
+    CIK_module.clear_company_facts_cache()
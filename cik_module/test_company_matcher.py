@@ -0,0 +1,55 @@
+from CIK_module import CompanyMatcher
+
+
+def found(se, text):
+    return [(m.text, m.cik) for m in se.find_companies(text)]
+
+
+# Test that names are matched without their legal suffixes, possessives or punctuation
+def test_names_in_questions(se):
+    assert found(se, "What was Apple's revenue in 2023?") == [('Apple', '320193')]
+    assert found(se, "Compare JPMorgan Chase & Co. with Bank of America") == [
+        ('JPMorgan Chase & Co', '19617'), ('Bank of America', '70858')]
+    assert found(se, "How is Microsoft Corp doing?") == [('Microsoft Corp', '789019')]
+
+
+# Test tickers, share-class tickers and the ticker handed on for a name
+def test_tickers(se):
+    assert found(se, "what was aapl revenue?") == [('aapl', '320193')]
+    assert found(se, "How did BRK.B and $NVDA do?") == [('BRK.B', '1067983'), ('NVDA', '1045810')]
+    assert se.find_companies("Alphabet capex")[0].ticker in ('GOOGL', 'GOOG')
+
+
+# Test that short tickers which are also ordinary words need capitals or a "$"
+def test_ambiguous_tickers():
+    matcher = CompanyMatcher({'on semiconductor corp': '1097864', 'agilent technologies inc': '1090872',
+                              'c3.ai, inc.': '1577526'},
+                             {'on': '1097864', 'a': '1090872', 'ai': '1577526'})
+    assert matcher.find("Is revenue on track?") == []
+    assert [m.cik for m in matcher.find("Is ON gross margin improving?")] == ['1097864']
+    assert matcher.find("WHAT IS ON THE BALANCE SHEET?") == []
+    # Single letters and finance vocabulary only with a "$"
+    assert matcher.find("A key risk is AI regulation") == []
+    assert [m.cik for m in matcher.find("Compare $A and $AI")] == ['1090872', '1577526']
+    # Lower-case word lists have no case to go on, so ambiguous tickers are left alone
+    assert matcher.replace("is on track for a record".split()) == (set(), "is on track for a record".split())
+
+
+# Test that one-word names which are also ordinary words need a capital, like tickers
+def test_ambiguous_names():
+    matcher = CompanyMatcher({'target corp': '27419', 'gap inc': '39911', 'block, inc.': '1512673',
+                              'apple inc.': '320193'},
+                             {'tgt': '27419', 'gap': '39911', 'xyz': '1512673', 'aapl': '320193'})
+    assert [m.cik for m in matcher.find("Did the margin target for Apple change in 2023?")] == ['320193']
+    assert matcher.find("Is the gap between revenue and cost growing?") == []
+    assert matcher.find("How big was the block of shares repurchased?") == []
+    assert [m.cik for m in matcher.find("Compare Target, Gap and Block margins")] == ['27419', '39911', '1512673']
+    assert [m.cik for m in matcher.find("WHAT IS THE MARGIN TARGET FOR APPLE?")] == ['320193']
+    # Names that are not ordinary words match in lower case too
+    assert [m.cik for m in matcher.find("what was apple revenue?")] == ['320193']
+    assert matcher.replace("margin target for apple".split()) == ({'320193'}, "margin target for".split())
+
+
+# Test that the matcher is built once per index
+def test_matcher_is_cached(se):
+    assert se.company_matcher() is se.company_matcher()
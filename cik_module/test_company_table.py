@@ -0,0 +1,42 @@
+import pytest
+from CIK_module import CompanyTable
+
+
+# Test that share classes are kept on one record and found from the CIK
+def test_multiple_tickers_and_reverse_lookup(se):
+    alphabet = se.cik_to_company('1652044')
+    assert alphabet.cik == 1652044 and alphabet.title == 'Alphabet Inc.'
+    assert alphabet.tickers == ('GOOGL', 'GOOG')
+    assert se.tickers_for_cik(1067983) == ('BRK-B', 'BRK-A')
+    assert se.cik_to_company('999999999') is None and se.tickers_for_cik('999999999') == ()
+
+
+# Test that the old dict interface still answers with CIK strings
+def test_dict_views(se):
+    assert se.ticker_dict['goog'] == se.ticker_dict['googl'] == '1652044'
+    assert se.name_dict['apple inc.'] == '320193'
+    assert 'msft' in se.ticker_dict and 'nope' not in se.ticker_dict
+    assert dict(se.ticker_dict.items())['aapl'] == '320193'
+    assert se.ticker_to_cik('AXP') == '4962'
+    with pytest.raises(KeyError):
+        se.name_dict['nope']
+
+
+# Test that a title or ticker listed twice keeps its first company
+def test_first_listing_wins():
+    table = CompanyTable()
+    table.add(1, 'Acme Inc', 'ACME')
+    table.add(2, 'ACME INC', 'ACME')
+    table.add(1, 'Acme Inc', 'ACMEW')
+    assert len(table) == 2
+    assert table.by_name('acme inc').cik == 1
+    assert table.by_ticker('acme').tickers == ('ACME', 'ACMEW')
+    assert table.by_cik(2).tickers == ()
+
+
+# Test that rebuilding the index without reloading the released listing fails clearly
+def test_rebuild_needs_listing(se):
+    assert se.filejson is None
+    with pytest.raises(RuntimeError, match='load the listing again'):
+        se.cik_json_to_dict()
+    assert se.ticker_to_cik('AAPL') == '320193'
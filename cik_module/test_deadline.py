@@ -0,0 +1,31 @@
+import time
+
+import CIK_module
+from conftest import APPLE, OLDER_PAGE, FakeResponse
+
+
+# Test that SEC request timeouts end at the deadline, but never drop below the minimum
+def test_request_timeout(se):
+    assert se.request_timeout() == CIK_module.SEC_REQUEST_TIMEOUT_SECONDS
+    se.deadline = time.time() + 5
+    assert 4 < se.request_timeout() <= 5
+    se.deadline = time.time() - 1
+    assert se.request_timeout() == CIK_module.MIN_SEC_REQUEST_TIMEOUT_SECONDS
+    assert se.deadline_passed()
+
+
+# Test that older submissions pages are skipped after the deadline and the miss isn't cached
+def test_deadline_skips_older_pages(sec_edgar):
+    se = sec_edgar(lambda url: FakeResponse(200, OLDER_PAGE if 'submissions-001' in url else APPLE),
+                   deadline=time.time() + 60)
+    se.deadline = time.time() - 1
+    assert se.annual_filing('320193', 2022) is None
+    assert se.fiscal_period_filing('320193', 2022) is None
+    assert [url for url in se.calls if 'submissions-001' in url] == []
+    assert se.stats['deadline_skipped_pages'] == 1
+
+    # With time left the same lookups read the older page
+    se.deadline = time.time() + 60
+    assert se.annual_filing('320193', 2022).endswith('aapl-20220924.htm')
+    assert se.fiscal_period_filing('320193', 2022).endswith('aapl-20220924.htm')
+    assert all(timeout <= 60 for timeout in se.timeouts)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from CIK_module import FilingColumns
+from conftest import APPLE, OLDER_PAGE, FakeResponse
+
+
+@pytest.fixture
+def se(sec_edgar):
+    return sec_edgar(lambda url: FakeResponse(200, OLDER_PAGE))
+
+
+# Test the array conversion and form/year masks
+def test_filing_columns():
+    columns = FilingColumns(APPLE['filings']['recent'])
+    assert columns.forms.dtype.kind == 'S' and columns.filing_dates.dtype == np.dtype('datetime64[D]')
+    assert list(columns.select('10-Q', 2023)) == [2, 4, 5]
+    assert list(columns.select('10-K', 2023)) == [1]
+    assert np.isnat(columns.report_dates[3])
+    assert columns.filing_date(0) == '2024-02-02'
+    # Rows past the end of filingDate are ignored
+    assert len(FilingColumns({'form': ['10-K', '10-K'], 'filingDate': ['2023-01-01']}).forms) == 1
+
+
+# Test that the finders keep their filing-date semantics
+def test_finders(se):
+    assert se.find_10k_filing('320193', 2023, APPLE).endswith('aapl-20230930.htm')
+    # 10-Qs filed in 2023, most recent first
+    assert se.find_10q_filing('320193', 2023, 1, APPLE).endswith('aapl-20230701.htm')
+    assert se.find_10q_filing('320193', 2023, 3, APPLE).endswith('aapl-20221231.htm')
+    assert se.calls == []
+    # Falls through to the older pages
+    assert se.find_10k_filing('320193', 2022, APPLE).endswith('aapl-20220924.htm')
+    assert se.find_10q_filing('320193', 2023, 4, APPLE) is None
@@ -0,0 +1,55 @@
+import pytest
+from CIK_module import FilingStore
+from conftest import APPLE, OLDER_PAGE, FakeResponse, columns
+
+MICROSOFT = {
+    'name': 'MICROSOFT CORP',
+    'fiscalYearEnd': '0630',
+    'filings': {
+        'recent': columns(
+            ('10-Q', '2024-04-25', '2024-03-31', '0000950170-24-048288', 'msft-20240331.htm'),
+            ('10-K', '2023-07-27', '2023-06-30', '0000950170-23-035122', 'msft-20230630.htm'),
+        ),
+        'files': [],
+    },
+}
+
+
+@pytest.fixture
+def se(sec_edgar, tmp_path):
+    def respond(url):
+        if 'submissions-001' in url:
+            return FakeResponse(200, OLDER_PAGE)
+        return FakeResponse(200, MICROSOFT if 'CIK0000789019' in url else APPLE)
+
+    store = FilingStore(str(tmp_path / 'filings.sqlite3'))
+    yield sec_edgar(respond, filing_store=store)
+    store.close()
+
+
+# Test that fetched submissions are queryable across companies by form and filing date
+def test_query_across_companies(se):
+    se.refresh_filings(['AAPL', 'MSFT'])
+    filings = se.query_filings(forms='10-K', filed_from='2023-01-01', filed_to='2023-12-31')
+    assert [(f['cik'], f['filing_date']) for f in filings] == [(320193, '2023-11-03'), (789019, '2023-07-27')]
+    assert filings[0]['url'] == 'https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm'
+    assert len(se.query_filings(['Microsoft'])) == 2
+    assert se.query_filings(['AAPL'], forms=['10-Q'], limit=1)[0]['report_date'] == '2023-12-30'
+
+
+# Test that unchanged companies are not refetched and older pages are upserted as they are read
+def test_incremental_upsert(se):
+    assert se.refresh_filings(['AAPL', 'MSFT']) == 2
+    assert se.refresh_filings(['AAPL', 'MSFT']) == 0
+    assert not se.filing_store.upsert_submissions('320193', APPLE)
+    assert se.query_filings(['AAPL'], filed_to='2022-12-31') == []
+    se.find_10k_filing('320193', 2022, APPLE)
+    assert [f['filing_date'] for f in se.query_filings(['AAPL'], filed_to='2022-12-31')] == ['2022-10-28']
+
+
+# Test that the store file persists between store instances, as when shipped from S3
+def test_store_persists(se, tmp_path):
+    se.refresh_filings(['AAPL'])
+    reopened = FilingStore(se.filing_store.path)
+    assert len(reopened.query(forms='10-K')) == 1
+    reopened.close()
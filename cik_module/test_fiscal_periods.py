@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+import pytest
+from CIK_module import build_fiscal_period_index, fiscal_period
+from conftest import APPLE, OLDER_PAGE, FakeResponse, columns
+
+
+@pytest.fixture
+def se(sec_edgar):
+    return sec_edgar(lambda url: FakeResponse(200, OLDER_PAGE if 'submissions-001' in url else APPLE))
+
+
+# Test fiscal years that don't follow the calendar, with 52/53-week year ends
+def test_fiscal_period():
+    assert fiscal_period('2023-12-30', '0930') == (2024, 1)
+    assert fiscal_period('2023-07-01', '0930') == (2023, 3)
+    assert fiscal_period('2022-09-24', '0930') == (2022, 4)
+    assert fiscal_period('2023-03-31', '0630') == (2023, 3)
+    assert fiscal_period('2024-02-03', '0131') == (2024, 4)
+    assert fiscal_period('2023-03-31') == (2023, 1)
+
+
+# Test that each fiscal period maps to exactly one filing and Q4 is the 10-K
+def test_index_by_report_date():
+    index = build_fiscal_period_index('320193', APPLE['filings']['recent'], '0930')
+    assert index[(2024, 'Q1')]['accession'] == '0000320193-24-000006'
+    assert index[(2023, 'FY')] is index[(2023, 'Q4')]
+    assert index[(2023, 'Q1')]['report_date'] == '2022-12-31'
+    assert index[(2023, 'FY')]['url'] == \
+        'https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm'
+    assert len(index) == 6
+
+
+# Test lookups through SECEdgar: one submissions fetch, older pages only on a miss
+def test_fiscal_period_filing(se):
+    assert se.fiscal_period_filing('320193', 2024, 1).endswith('aapl-20231230.htm')
+    assert se.fiscal_period_filing('320193', 2023, 4).endswith('aapl-20230930.htm')
+    assert len(se.calls) == 2
+    assert se.fiscal_period_filing('320193', 2022).endswith('aapl-20220924.htm')
+    assert se.calls[-1].endswith('submissions-001.json')
+    assert se.fiscal_period_filing('320193', 2019) is None
+    assert sum(url.endswith('submissions-001.json') for url in se.calls) == 1
+
+
+# Test that a failed older page stays queued, so the next lookup retries it
+def test_failed_page_is_retried(se):
+    with patch('CIK_module.requests.get', side_effect=lambda url, **kwargs: FakeResponse(
+            503 if 'submissions-001' in url else 200, APPLE)):
+        assert se.fiscal_period_filing('320193', 2022) is None
+    assert se.fiscal_period_filing('320193', 2022).endswith('aapl-20220924.htm')
+
+
+# Test that a submissions JSON the caller already has is reused by every lookup
+def test_lookups_reuse_fetched_submissions(se):
+    response_json = se.fetch_company_json('320193')
+    assert se.fiscal_period_filing('320193', 2024, 1, response_json).endswith('aapl-20231230.htm')
+    assert se.annual_filing('320193', 2023, response_json).endswith('aapl-20230930.htm')
+    assert se.quarterly_filing('320193', 2023, 3, response_json) is not None
+    assert len(se.calls) == 1
+
+
+# Test that only filings without a reportDate fall back to the filing-date search, without refetching pages
+def test_undated_fallback(sec_edgar):
+    undated_page = columns(('10-K', '2005-12-01', '', '0000320193-05-000001', 'aapl-2005.htm'),
+                           ('10-Q', '2005-08-01', '', '0000320193-05-000002', 'aapl-200506.htm'))
+    se = sec_edgar(lambda url: FakeResponse(200, undated_page if 'submissions-001' in url else APPLE))
+    assert se.fiscal_period_filing('320193', 2005) is None
+    assert se.undated_filing('320193', 2005).endswith('aapl-2005.htm')
+    assert se.undated_filing('320193', 2005, 1).endswith('aapl-200506.htm')
+    # A fiscal year without its 10-K yet is a miss, not another year's dated 10-K
+    assert se.fiscal_period_filing('320193', 2024) is None
+    assert se.undated_filing('320193', 2024) is None
+    assert sum(url.endswith('submissions-001.json') for url in se.calls) == 1
+    # period_filing tries the fiscal period first, then the undated filings
+    assert se.period_filing('320193', 2005)[0].endswith('aapl-2005.htm')
+    assert se.period_filing('320193', 2005, 1) == (se.undated_filing('320193', 2005, 1), '10-Q')
+    assert se.period_filing('320193', 2023, 4) == (se.fiscal_period_filing('320193', 2023, 4), '10-K')
@@ -0,0 +1,91 @@
+import io
+from unittest.mock import Mock, patch
+
+import pytest
+from CIK_module import NegativeCache, SECEdgar, clear_fiscal_period_cache, listing_version
+from conftest import FakeResponse
+
+SUBMISSIONS = {
+    'filings': {
+        'recent': {'form': ['10-Q'], 'filingDate': ['2024-05-03'], 'reportDate': ['2024-03-30'],
+                   'accessionNumber': ['0000320193-24-000069'], 'primaryDocument': ['aapl-20240330.htm']},
+        'files': [{'name': 'CIK0000320193-submissions-001.json'}],
+    }
+}
+OLDER_PAGE = {'filings': {'recent': {'form': [], 'filingDate': [], 'accessionNumber': [], 'primaryDocument': []}}}
+
+
+@pytest.fixture
+def se(sec_edgar):
+    edgar = sec_edgar(lambda url: FakeResponse(200, OLDER_PAGE if 'submissions-001' in url else edgar.submissions))
+    edgar.submissions = SUBMISSIONS
+    return edgar
+
+
+# Test that a repeated miss skips the overflow pages
+def test_missing_filing_is_remembered(se):
+    assert se.annual_filing('320193', 2001) is None
+    assert len(se.calls) == 2
+    assert se.annual_filing('320193', 2001) is None
+    assert len(se.calls) == 3
+    # Other queries are not affected
+    assert se.quarterly_filing('320193', 2001, 2) is None
+    assert len(se.calls) == 5
+
+
+# Test that a fiscal period miss is remembered past the fiscal index, and impossible years aren't looked up
+def test_missing_fiscal_period_is_remembered(se):
+    assert se.period_filing('320193', 2001) is None
+    assert len(se.calls) == 2
+    clear_fiscal_period_cache()
+    assert se.period_filing('320193', 2001) is None
+    assert len(se.calls) == 3
+    filing_url, form = se.period_filing('320193', 2024, 1)
+    assert filing_url.endswith('aapl-20240330.htm') and form == '10-Q'
+    calls = len(se.calls)
+    assert se.period_filing('320193', 1850) is None
+    assert se.period_filing('320193', 2001, 5) is None
+    assert len(se.calls) == calls
+
+
+# Test that a new filing invalidates the cached miss
+def test_new_submissions_invalidate(se):
+    se.annual_filing('320193', 2001)
+    recent = dict(SUBMISSIONS['filings']['recent'], accessionNumber=['0000320193-24-000081'])
+    se.submissions = {'filings': dict(SUBMISSIONS['filings'], recent=recent)}
+    se.annual_filing('320193', 2001)
+    assert len(se.calls) == 4
+
+
+# Test expiry, fingerprints and the size bound
+def test_negative_cache_entries():
+    cache = NegativeCache(ttl_seconds=60, max_entries=2)
+    with patch('CIK_module.time.time', return_value=1000.0):
+        cache.add(('company', 'nope'), 'listing-1')
+        assert cache.contains(('company', 'nope'))
+        assert not cache.contains(('company', 'nope'), 'listing-2')
+        assert len(cache) == 0
+        cache.add(('company', 'a'), 'listing-1')
+        cache.add(('company', 'b'), 'listing-2')
+        cache.discard_stale('company', 'listing-2')
+        assert not cache.contains(('company', 'a')) and cache.contains(('company', 'b'))
+        cache.add(('company', 'c'))
+        cache.add(('company', 'd'))
+        assert len(cache) == 2
+    with patch('CIK_module.time.time', return_value=1061.0):
+        assert not cache.contains(('company', 'd'))
+    disabled = NegativeCache(ttl_seconds=0)
+    disabled.add(('company', 'x'))
+    assert len(disabled) == 0
+
+
+# Test that the listing version from a HEAD request matches the fingerprint of the listing loaded
+def test_listing_version_matches_fingerprint():
+    s3 = Mock()
+    s3.get_object.return_value = {'Body': io.BytesIO(b'{"0": {"cik_str": 1, "ticker": "ACME", "title": "Acme Inc"}}'),
+                                  'ETag': '"v1"'}
+    s3.head_object.return_value = {'ETag': '"v1"'}
+    edgar = SECEdgar(use_s3=True, s3_client=s3)
+    assert edgar.listing_fingerprint == listing_version(s3) == '"v1"'
+    s3.head_object.side_effect = RuntimeError("no access")
+    assert listing_version(s3) is None
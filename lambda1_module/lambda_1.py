@@ -1,6 +1,11 @@
 import boto3
 import requests
 import json
+import os
+
+from deadline import Deadline
+from metrics import start_timings, with_timings
+from profiling import profiled
 
 '''
 This function will download the SEC Edgar JSON files, 
@@ -11,29 +16,41 @@ This Lambda function should be scheduled to run daily and update the same S3 loc
 The S3 bucket should have version history enabled.'''
 
 # This Lambda function will be responsible for downloading the SEC Edgar JSON files and uploading them to an S3 bucket.
+@profiled('lambda1')
 def lambda_handler(event, context):
     
+    # Stage timings for the response and the EMF log line
+    timings = start_timings('lambda1')
+
     # Making an s3 client
     s3 = boto3.client('s3')
 
     bucket_name = 'nathanasfaw-sec-edgar-files'
     # URLs for the SEC Edgar JSON files
     url = "https://www.sec.gov/files/company_tickers.json"
+    # A stand-in for sec.gov (e.g. the local replay server) serves the same path under its host name
+    if os.environ.get('SEC_EDGAR_BASE_URL'):
+        url = f"{os.environ['SEC_EDGAR_BASE_URL'].rstrip('/')}/www.sec.gov/files/company_tickers.json"
     # Headers for SEC requests
     headers = { 'User-Agent': 'MLT CP nathanrasfaw@gmail.com'}
 
     try:
         print(f'Fetching data from {url}')
 
-        response = requests.get(url, headers=headers)
+        # Give up on sec.gov in time to report the failure instead of timing out
+        timeout = Deadline.from_context(context).timeout(60)
+        with timings.stage('download'):
+            response = requests.get(url, headers=headers, timeout=timeout)
         response.raise_for_status()  # Raise an error for bad status codes
+        timings.count('download_bytes', len(response.content), 'Bytes')
 
         print('Data fetched successfully. Uploading to S3...')
 
         # Uploading the JSON file to S3 
-        s3.put_object(Bucket=bucket_name, Key='company_tickers.json', Body=response.content)
+        with timings.stage('upload'):
+            s3.put_object(Bucket=bucket_name, Key='company_tickers.json', Body=response.content)
         print('Upload to S3 successful')
-        return {
+        result = {
             'statusCode': 200,
             'body': json.dumps({'message': 'Upload successful'})
         }
@@ -43,10 +60,13 @@ def lambda_handler(event, context):
         error_message = f"Error uploading to S3: {str(e)}"
         print(error_message)
         
-        return {
+        result = {
             'statusCode': 500,
             'body': json.dumps({
                 'error': 'Upload failed',
                 'message': error_message
             })
-        }
\ No newline at end of file
+        }
+
+    timings.emit({'Handler': 'lambda1'})
+    return with_timings(result, timings)
\ No newline at end of file
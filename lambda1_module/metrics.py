@@ -0,0 +1,270 @@
+# metrics.py - CloudWatch Embedded Metric Format (EMF) output and per-stage timings for the SEC Lambdas
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = "SECFilingQA"
+
+# When set, Lambda 3 writes each question's span tree here as <trace_id>.json (see export_trace)
+TRACE_EXPORT_DIR = os.environ.get('TRACE_EXPORT_DIR')
+
+
+def emit_metrics(metrics, dimensions=None, namespace=NAMESPACE, properties=None):
+    """Print one EMF log line; CloudWatch turns it into metrics without any API calls.
+
+    metrics maps a metric name to (value, unit), e.g. {'TimeToFirstToken': (812.5, 'Milliseconds')}.
+    dimensions is an optional dict such as {'Route': 'numeric_lookup'}. properties are logged
+    with the record but are not metrics or dimensions (e.g. a TraceId to search the logs by).
+    """
+    if not metrics:
+        return None
+    dimensions = {key: str(value) for key, value in (dimensions or {}).items()}
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)] if dimensions else [[]],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in metrics.items()],
+            }],
+        },
+    }
+    record.update(properties or {})
+    record.update(dimensions)
+    record.update({name: value for name, (value, unit) in metrics.items()})
+    print(json.dumps(record))
+    return record
+
+
+def new_id(nbytes=8):
+    """A random hex ID: 8 bytes for a span, 16 for a trace"""
+    return secrets.token_hex(nbytes)
+
+
+class Timings:
+    """Stage timers, counters and spans for one invocation.
+
+    as_dict() is the "timings" block of the handler's response ("<stage>_ms" plus the
+    counters and total_ms); emit() prints the same values as one EMF record.
+
+    Every stage is also a span. The invocation is the root span, joined to a caller's trace
+    when a trace context ({"trace_id", "parent_span_id"}) is passed in, and trace() returns the
+    span tree, with the trees returned by downstream calls grafted under the span that made them.
+    """
+
+    def __init__(self, name='invocation', trace=None):
+        self.started = time.perf_counter()
+        self.started_wall = time.time()
+        self.stages = {}
+        self.counters = {}
+        self.nested = {}
+        self.sources = []
+        trace = trace or {}
+        self.name = name
+        self.trace_id = trace.get('trace_id') or new_id(16)
+        self.parent_span_id = trace.get('parent_span_id')
+        self.span_id = new_id()
+        # (name, span_id, start, end) in perf_counter seconds; stages still open are in _open
+        self.spans = []
+        self.span_sources = []
+        self.remote = []
+        self._open = []
+        # Worker threads share the invocation's timings (see lambda_3.ask_concurrently)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        span_id = new_id()
+        self._open.append(span_id)
+        try:
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self._lock:
+                self._open.remove(span_id)
+                self.spans.append((name, span_id, started, ended))
+                self.stages[name] = round(self.stages.get(name, 0) + (ended - started) * 1000, 1)
+
+    def add_ms(self, name, ms):
+        """Add a stage timed elsewhere, as a span that ended just now"""
+        ended = time.perf_counter()
+        with self._lock:
+            self.spans.append((name, new_id(), ended - ms / 1000, ended))
+            self.stages[name] = round(self.stages.get(name, 0) + ms, 1)
+
+    def count(self, name, value=1, unit='Count'):
+        with self._lock:
+            total = self.counters.get(name, (0, unit))[0] + value
+            self.counters[name] = (total, unit)
+
+    def include(self, stats, spans=None):
+        """Also report a flat dict of "<stage>_ms" times and counts kept elsewhere, such as SECEdgar.stats.
+
+        spans is an optional list of (name, start, end) perf_counter times for the same stages
+        (SECEdgar.spans); they are placed in the tree under the stage they ran in.
+        """
+        self.sources.append(stats)
+        if spans is not None:
+            self.span_sources.append(spans)
+
+    def trace_context(self):
+        """The trace context to pass downstream: this trace, parented to the innermost open stage"""
+        return {'trace_id': self.trace_id, 'parent_span_id': self._open[-1] if self._open else self.span_id}
+
+    def graft(self, tree):
+        """Add the span tree returned by a downstream call (e.g. Lambda 2's "trace")"""
+        if isinstance(tree, dict) and tree.get('trace_id') == self.trace_id:
+            self.remote.append(tree)
+
+    def trace(self):
+        """The span tree of this invocation, as nested dicts with epoch start_ms and duration_ms.
+
+        Local spans are nested by time (a span is the child of the shortest span that contains it),
+        which also places spans recorded outside stage(), such as SECEdgar's, under the stage they ran in.
+        """
+        now = time.perf_counter()
+        root = self._node(self.name, self.span_id, self.parent_span_id, self.started, now)
+        root['trace_id'] = self.trace_id
+        spans = list(self.spans)
+        for source in self.span_sources:
+            spans.extend((name, new_id(), start, end) for name, start, end in source)
+        # Parents start no later and end no earlier than their children
+        spans.sort(key=lambda span: (span[2], -span[3]))
+        by_id = {self.span_id: root}
+        stack = [(root, now)]
+        for name, span_id, start, end in spans:
+            while len(stack) > 1 and stack[-1][1] < end:
+                stack.pop()
+            parent = stack[-1][0]
+            node = self._node(name, span_id, parent['span_id'], start, end)
+            parent['children'].append(node)
+            by_id[span_id] = node
+            stack.append((node, end))
+        for tree in self.remote:
+            parent = by_id.get(tree.get('parent_id'), root)
+            parent['children'].append(tree)
+        return root
+
+    def _node(self, name, span_id, parent_id, start, end):
+        return {
+            'name': name,
+            'span_id': span_id,
+            'parent_id': parent_id,
+            'start_ms': round(self.started_wall * 1000 + (start - self.started) * 1000, 3),
+            'duration_ms': round((end - start) * 1000, 3),
+            'children': [],
+        }
+
+    def total_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def combined(self):
+        """Stage times and counters, with the included sources added in"""
+        stages, counters = dict(self.stages), dict(self.counters)
+        for stats in self.sources:
+            for name, value in stats.items():
+                if name.endswith('_ms'):
+                    stages[name[:-3]] = round(stages.get(name[:-3], 0) + value, 1)
+                else:
+                    total, unit = counters.get(name, (0, 'Count'))
+                    counters[name] = (total + value, unit)
+        return stages, counters
+
+    def as_dict(self):
+        stages, counters = self.combined()
+        timings = {f"{name}_ms": ms for name, ms in stages.items()}
+        timings.update({name: value for name, (value, unit) in counters.items()})
+        timings.update(self.nested)
+        timings['total_ms'] = self.total_ms()
+        return timings
+
+    def emit(self, dimensions=None, namespace=NAMESPACE):
+        stages, counters = self.combined()
+        metrics = {metric_name(name) + 'Duration': (ms, 'Milliseconds') for name, ms in stages.items()}
+        metrics.update({metric_name(name): counter for name, counter in counters.items()})
+        metrics['TotalDuration'] = (self.total_ms(), 'Milliseconds')
+        return emit_metrics(metrics, dimensions, namespace, {'TraceId': self.trace_id})
+
+
+def metric_name(name):
+    """'document_download' -> 'DocumentDownload'"""
+    return ''.join(part.capitalize() for part in name.split('_'))
+
+
+# The invocation's timings, so helpers deep in a handler can record stages without passing them around
+_current_timings = contextvars.ContextVar('timings', default=None)
+
+
+def start_timings(name='invocation', trace=None):
+    """Begin timing a new invocation and make it the current one.
+
+    trace is the trace context a caller passed in (see Timings.trace_context); without one
+    the invocation starts a new trace.
+    """
+    timings = Timings(name, trace if isinstance(trace, dict) else None)
+    _current_timings.set(timings)
+    return timings
+
+
+def current_timings():
+    return _current_timings.get()
+
+
+@contextmanager
+def timed(stage):
+    """Time a stage of the current invocation (does nothing outside one)"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    with timings.stage(stage):
+        yield
+
+
+def count(name, value=1, unit='Count'):
+    """Add to a counter of the current invocation (does nothing outside one)"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.count(name, value, unit)
+
+
+def with_timings(response, timings, trace=None):
+    """Add the timings block and the span tree ("trace", built now unless passed in) to a handler response's JSON body"""
+    try:
+        body = json.loads(response.get('body') or '{}')
+    except (TypeError, ValueError):
+        return response
+    if isinstance(body, dict):
+        body['timings'] = timings.as_dict()
+        body['trace'] = trace or timings.trace()
+        response['body'] = json.dumps(body)
+    return response
+
+
+def trace_events(tree, service=None):
+    """Flatten a span tree into Chrome trace events ("ph": "X"), one thread per service"""
+    service = tree['name'] if 'trace_id' in tree or service is None else service
+    events = [{
+        'name': tree['name'], 'ph': 'X', 'pid': 1, 'tid': service,
+        'ts': round(tree['start_ms'] * 1000), 'dur': round(tree['duration_ms'] * 1000),
+        'args': {'span_id': tree['span_id'], 'parent_id': tree['parent_id']},
+    }]
+    for child in tree.get('children', []):
+        events.extend(trace_events(child, service))
+    return events
+
+
+def export_trace(tree, path):
+    """Write a span tree as JSON: the tree itself, plus "traceEvents" so the same file
+    opens as a flame graph in chrome://tracing, Perfetto or speedscope"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'trace_id': tree.get('trace_id'), 'spans': tree, 'traceEvents': trace_events(tree)}, f)
+    return path
@@ -0,0 +1,167 @@
+# profiling.py - Opt-in cProfile/tracemalloc reports per Lambda invocation
+import cProfile
+import functools
+import io
+import json
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+import boto3
+
+from metrics import current_timings
+
+# "cpu", "memory" or "cpu,memory" profiles invocations without an event flag; off when unset
+PROFILE_MODE = os.environ.get('PROFILE_MODE', '')
+# Fraction of invocations profiled when PROFILE_MODE is set, e.g. 0.01 for 1% of production traffic
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))
+# A directory, or s3://bucket/prefix to upload the reports
+PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', '/tmp/profiles')
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', 25))
+
+MODES = ('cpu', 'memory')
+
+# cProfile can't nest, so a handler invoked in-process by another (local runs) isn't profiled again
+_active = threading.Lock()
+
+
+def profile_modes(event):
+    """The profilers to run for an event: its "profile" flag (true, "cpu", "memory" or
+    "cpu,memory") always profiles; otherwise PROFILE_MODE applies to a PROFILE_SAMPLE_RATE sample"""
+    flag = event.get('profile') if isinstance(event, dict) else None
+    if flag:
+        requested = MODES if flag is True else str(flag).split(',')
+    elif PROFILE_MODE and random.random() < PROFILE_SAMPLE_RATE:
+        requested = PROFILE_MODE.split(',')
+    else:
+        return ()
+    return tuple(mode for mode in MODES if mode in [part.strip().lower() for part in requested])
+
+
+def profiled(handler_name):
+    """Wrap a lambda_handler so opted-in invocations are profiled and a report is written.
+
+    The report (top functions by cumulative time, top allocation sites and peak traced memory)
+    is written as <handler>/<request_id>.json under PROFILE_OUTPUT, with the raw cProfile stats
+    next to it as <request_id>.prof for snakeviz or pstats. Profiling never fails the request.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            modes = profile_modes(event)
+            if not modes or not _active.acquire(blocking=False):
+                return handler(event, context)
+            try:
+                return run_profiled(handler, event, context, handler_name, modes)
+            finally:
+                _active.release()
+        return wrapper
+    return decorator
+
+
+def run_profiled(handler, event, context, handler_name, modes):
+    request_id = getattr(context, 'aws_request_id', None) or uuid.uuid4().hex
+    profiler = cProfile.Profile() if 'cpu' in modes else None
+    # Leave tracemalloc running if something else started it, only resetting its peak
+    started_tracing = 'memory' in modes and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif 'memory' in modes:
+        tracemalloc.reset_peak()
+    started = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        return handler(event, context)
+    finally:
+        if profiler:
+            profiler.disable()
+        try:
+            timings = current_timings()
+            report = {
+                'handler': handler_name,
+                'request_id': request_id,
+                'trace_id': timings.trace_id if timings is not None else None,
+                'modes': list(modes),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            }
+            if 'memory' in modes:
+                report['memory'] = memory_report(tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1])
+            if profiler:
+                report['cpu'] = cpu_report(profiler)
+            location = write_report(report, profiler)
+            print(f"Profile for {handler_name} request {request_id} written to {location}")
+        except Exception as e:
+            print(f"Error writing profile: {e}")
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+
+def cpu_report(profiler, top_n=None):
+    """Top functions by cumulative time, with their own (total) time and call counts"""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    return {
+        'total_calls': stats.total_calls,
+        'top_functions': [{
+            'function': function,
+            'file': filename,
+            'line': line,
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'total_ms': round(total * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        } for (filename, line, function), (primitive_calls, calls, total, cumulative, callers) in rows[:top_n or PROFILE_TOP_N]],
+    }
+
+
+def memory_report(snapshot, peak_bytes, top_n=None):
+    """Peak traced memory and the allocation sites (file and line) holding the most memory at the end"""
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    top = snapshot.statistics('lineno')[:top_n or PROFILE_TOP_N]
+    return {
+        'peak_bytes': peak_bytes,
+        'top_allocations': [{
+            'file': stat.traceback[0].filename,
+            'line': stat.traceback[0].lineno,
+            'size_bytes': stat.size,
+            'count': stat.count,
+        } for stat in top],
+    }
+
+
+def write_report(report, profiler=None, output=None):
+    """Write the JSON report (and the raw cProfile stats) to a directory or an s3:// prefix"""
+    output = output or PROFILE_OUTPUT
+    name = f"{report['handler']}/{report['request_id']}"
+    raw = None
+    if profiler is not None:
+        # The marshal format that pstats and snakeviz load
+        profiler.create_stats()
+        raw = marshal.dumps(profiler.stats)
+    body = json.dumps(report, indent=2).encode('utf-8')
+    if output.startswith('s3://'):
+        bucket, _, prefix = output[len('s3://'):].partition('/')
+        key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+        s3 = boto3.client('s3')
+        s3.put_object(Bucket=bucket, Key=f"{key}.json", Body=body, ContentType='application/json')
+        if raw is not None:
+            s3.put_object(Bucket=bucket, Key=f"{key}.prof", Body=raw)
+        return f"s3://{bucket}/{key}.json"
+    path = os.path.join(output, f"{name}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(body)
+    if raw is not None:
+        with open(os.path.join(output, f"{name}.prof"), 'wb') as f:
+            f.write(raw)
+    return path
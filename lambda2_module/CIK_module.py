@@ -4,12 +4,834 @@
 
 import requests
 import datetime
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import boto3
+import hashlib
+import numpy as np
 import json
+import logging
 import os 
+import sqlite3
+import threading
 from typing import Dict, Optional
 from botocore.exceptions import ClientError, NoCredentialsError, ProfileNotFound
+import re
+import sys
+import time
+from array import array
+from collections import deque, namedtuple
+from collections.abc import Mapping
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# XBRL company facts are refreshed by the SEC as filings are processed; a day is fresh enough
+COMPANY_FACTS_TTL_SECONDS = 24 * 60 * 60
+
+# Shared across SECEdgar instances so warm Lambda invocations reuse fetched facts
+# Maps a cache key (CIK, or (CIK, concept)) to (fetched_at, index), least recently used first;
+# a companyfacts index is megabytes, so only the most recent entries are kept
+_company_facts_cache = {}
+COMPANY_FACTS_CACHE_SIZE = 32
+
+# Lookups that found nothing (unknown companies, missing filings) are remembered briefly,
+# so a client retrying the same bad query doesn't repeat the full search
+NEGATIVE_CACHE_TTL_SECONDS = int(os.environ.get('NEGATIVE_CACHE_TTL_SECONDS', 5 * 60))
+NEGATIVE_CACHE_SIZE = 4096
+
+# Expected period length in days for each fiscal period code in the facts API
+FISCAL_PERIOD_DAYS = {'FY': (350, 380), 'Q1': (80, 100), 'Q2': (80, 100), 'Q3': (80, 100), 'Q4': (80, 100)}
+
+# 52/53-week years end up to a week after the month-end in fiscalYearEnd (Apple's
+# "0930" year ended on 2022-09-24 and its June quarter on 2023-07-01)
+REPORT_DATE_SLACK_DAYS = 7
+
+# Per-CIK fiscal period indexes, rebuilt when the company's submissions change
+# Maps CIK to {'fingerprint', 'fiscal_year_end', 'index', 'pages'}
+_fiscal_index_cache = {}
+FISCAL_INDEX_CACHE_SIZE = 512
+
+# Optional SQLite store of filing metadata from every submissions response fetched;
+# set FILING_STORE_PATH (e.g. /tmp/sec_filings.sqlite3) to turn it on for all SECEdgar instances
+FILING_STORE_PATH = os.environ.get('FILING_STORE_PATH')
+
+# Base URL of a stand-in for www.sec.gov and data.sec.gov, such as the replay server in
+# benchmarks/replay_server.py; https://<host>/<path> is then fetched from <base>/<host>/<path>
+SEC_EDGAR_BASE_URL = os.environ.get('SEC_EDGAR_BASE_URL')
+SEC_HOSTS = ('www.sec.gov', 'data.sec.gov')
+
+# SEC requests time out after this many seconds, or at the instance's deadline if that is sooner
+SEC_REQUEST_TIMEOUT_SECONDS = 30
+MIN_SEC_REQUEST_TIMEOUT_SECONDS = 1.0
+
+# Lambda 1's copy of the company listing, read by SECEdgar(use_s3=True)
+LISTING_S3_BUCKET = "nathanasfaw-sec-edgar-files"
+LISTING_S3_KEY = "company_tickers.json"
+
+# Array form of each company's recent submissions, keyed by (CIK, submissions fingerprint)
+_filing_columns_cache = {}
+
+
+def cached_company_facts(key) -> Optional[Dict[tuple, dict]]:
+    """Return a fresh cached facts index, marking it most recently used"""
+    cached = _company_facts_cache.pop(key, None)
+    if cached is None or time.time() - cached[0] >= COMPANY_FACTS_TTL_SECONDS:
+        return None
+    _company_facts_cache[key] = cached
+    return cached[1]
+
+
+def cache_company_facts(key, index: Dict[tuple, dict]):
+    """Store a facts index, dropping expired entries and then the least recently used"""
+    now = time.time()
+    for stale in [k for k, (fetched_at, _) in _company_facts_cache.items() if now - fetched_at >= COMPANY_FACTS_TTL_SECONDS]:
+        del _company_facts_cache[stale]
+    _company_facts_cache.pop(key, None)
+    while len(_company_facts_cache) >= COMPANY_FACTS_CACHE_SIZE:
+        _company_facts_cache.pop(next(iter(_company_facts_cache)))
+    _company_facts_cache[key] = (now, index)
+
+
+def build_company_facts_index(facts_json: dict) -> Dict[tuple, dict]:
+    """Index companyfacts/companyconcept JSON by (concept, fiscal year, fiscal period).
+
+    Each filing restates prior periods under its own fy/fp, so for every key we
+    keep the fact that covers the filing's own period: the right duration and the
+    latest end date, preferring the most recently filed value.
+    """
+    index = {}
+    if 'facts' in facts_json:
+        taxonomies = facts_json['facts'].items()
+    else:
+        # companyconcept responses hold a single concept at the top level
+        taxonomies = [(facts_json.get('taxonomy'), {facts_json.get('tag'): facts_json})]
+
+    for taxonomy, concepts in taxonomies:
+        for tag, concept_data in concepts.items():
+            concept = f"{taxonomy}:{tag}"
+            for unit, entries in concept_data.get('units', {}).items():
+                for entry in entries:
+                    fy, fp = entry.get('fy'), entry.get('fp')
+                    if fy is None or fp is None:
+                        continue
+                    start, end = entry.get('start'), entry.get('end')
+                    if start:
+                        days = (datetime.date.fromisoformat(end) - datetime.date.fromisoformat(start)).days
+                        low, high = FISCAL_PERIOD_DAYS.get(fp, (0, 400))
+                        if not low <= days <= high:
+                            continue
+                    key = (concept, int(fy), fp)
+                    current = index.get(key)
+                    if current is None or (end, entry.get('filed', '')) > (current['end'], current['filed']):
+                        index[key] = {
+                            'value': entry.get('val'),
+                            'unit': unit,
+                            'start': start,
+                            'end': end,
+                            'form': entry.get('form'),
+                            'accession': entry.get('accn'),
+                            'filed': entry.get('filed', ''),
+                        }
+    return index
+
+class CompanyRecord:
+    """One company: integer CIK, EDGAR title and every ticker listed for it"""
+
+    __slots__ = ('cik', 'title', 'tickers')
+
+    def __init__(self, cik: int, title: str, tickers: tuple):
+        self.cik = cik
+        self.title = title
+        self.tickers = tickers
+
+    def __repr__(self):
+        return f"CompanyRecord(cik={self.cik}, title={self.title!r}, tickers={self.tickers!r})"
+
+
+class CikView(Mapping):
+    """Read-only {lowercase key: CIK string} view over a CompanyTable index, for code that
+    expects the old name_dict/ticker_dict"""
+
+    __slots__ = ('_rows', '_ciks')
+
+    def __init__(self, rows: Dict[str, int], ciks: array):
+        self._rows = rows
+        self._ciks = ciks
+
+    def __getitem__(self, key):
+        return str(self._ciks[self._rows[key]])
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+
+class CompanyTable:
+    """Column store of the company_tickers.json listing, one row per CIK.
+
+    CIKs live in an integer array; titles are the listing's own strings and tickers are
+    interned, so each string is held once and shared with the index that looks it up.
+    Forward indexes map lowercase names and tickers to rows and the reverse index maps
+    CIKs to rows. A CIK with several share classes keeps all of its tickers.
+
+    The trade-off: for a listing the size of EDGAR's this holds about 15% less memory than
+    dicts of CIK strings (plus the parsed JSON), but a name or ticker lookup goes through
+    the row index and the CIK array, about 2x slower (roughly 0.24 us against 0.1 us; see
+    benchmarks/bench_company_store.py). That is noise next to the SEC requests that follow
+    every lookup, so memory wins.
+    """
+
+    __slots__ = ('_ciks', '_titles', '_tickers', '_extra_tickers', '_row_by_cik', '_row_by_name', '_row_by_ticker')
+
+    def __init__(self):
+        self._ciks = array('q')
+        self._titles = []
+        # First ticker per row; the few CIKs with more share classes keep the rest aside
+        self._tickers = []
+        self._extra_tickers = {}
+        self._row_by_cik = {}
+        self._row_by_name = {}
+        self._row_by_ticker = {}
+
+    @classmethod
+    def from_json(cls, filejson: dict) -> 'CompanyTable':
+        table = cls()
+        for value in filejson.values():
+            table.add(int(value['cik_str']), value['title'], value['ticker'])
+        return table
+
+    def add(self, cik: int, title: str, ticker: Optional[str] = None):
+        row = self._row_by_cik.get(cik)
+        if row is None:
+            row = len(self._ciks)
+            self._ciks.append(cik)
+            self._titles.append(title)
+            self._tickers.append(None)
+            self._row_by_cik[cik] = row
+        # The first company listed under a title or ticker keeps it
+        self._row_by_name.setdefault(sys.intern(title.lower()), row)
+        if ticker:
+            ticker = sys.intern(ticker.lower())
+            if ticker in self._row_by_ticker:
+                return
+            self._row_by_ticker[ticker] = row
+            if self._tickers[row] is None:
+                self._tickers[row] = ticker
+            else:
+                self._extra_tickers[row] = self._extra_tickers.get(row, ()) + (ticker,)
+
+    def __len__(self):
+        return len(self._ciks)
+
+    def _record(self, row: Optional[int]) -> Optional[CompanyRecord]:
+        if row is None:
+            return None
+        tickers = ((self._tickers[row],) if self._tickers[row] else ()) + self._extra_tickers.get(row, ())
+        return CompanyRecord(self._ciks[row], self._titles[row], tuple(ticker.upper() for ticker in tickers))
+
+    def by_cik(self, cik) -> Optional[CompanyRecord]:
+        return self._record(self._row_by_cik.get(int(cik)))
+
+    def by_ticker(self, ticker: str) -> Optional[CompanyRecord]:
+        return self._record(self._row_by_ticker.get(ticker.lower()))
+
+    def by_name(self, name: str) -> Optional[CompanyRecord]:
+        return self._record(self._row_by_name.get(name.lower()))
+
+    def name_view(self) -> CikView:
+        return CikView(self._row_by_name, self._ciks)
+
+    def ticker_view(self) -> CikView:
+        return CikView(self._row_by_ticker, self._ciks)
+
+
+class NegativeCache:
+    """Short-lived record of lookups that found nothing.
+
+    Each miss is stored with a fingerprint of the data it was computed from; a lookup
+    with a different fingerprint (the ticker listing or the company's submissions have
+    changed) drops the entry instead of returning it.
+    """
+
+    def __init__(self, ttl_seconds: int = NEGATIVE_CACHE_TTL_SECONDS, max_entries: int = NEGATIVE_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Maps key to (expires_at, fingerprint)
+        self._entries = {}
+
+    def add(self, key: tuple, fingerprint: Optional[str] = None):
+        if self.ttl_seconds <= 0:
+            return
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            # Oldest insertion first
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (time.time() + self.ttl_seconds, fingerprint)
+
+    def contains(self, key: tuple, fingerprint: Optional[str] = None) -> bool:
+        """True if key is a recent miss; a fingerprint of None skips the data check"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False
+        expires_at, stored = entry
+        if time.time() >= expires_at or (fingerprint is not None and stored != fingerprint):
+            del self._entries[key]
+            return False
+        return True
+
+    def discard_stale(self, kind: str, fingerprint: str):
+        """Drop misses of one kind that were computed from other data"""
+        for key in [k for k, (_, stored) in self._entries.items() if k[0] == kind and stored != fingerprint]:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared across SECEdgar instances, like the company facts cache
+_negative_cache = NegativeCache()
+
+
+def submissions_fingerprint(response_json: dict) -> str:
+    """Changes whenever the company files something: the newest accession and the page count"""
+    filings = response_json.get('filings', {})
+    accessions = filings.get('recent', {}).get('accessionNumber', [])
+    return f"{accessions[0] if accessions else ''}:{len(filings.get('files', []))}"
+
+
+def valid_filing_year(year) -> bool:
+    """A year EDGAR could have a filing for: from 1900 to next year (fiscal years run ahead)"""
+    return isinstance(year, int) and 1900 <= year <= datetime.datetime.now().year + 1
+
+
+def archive_url(cik, accession_number: str, primary_document: str) -> str:
+    """EDGAR archive URL of a filing's primary document"""
+    acc_num = accession_number.replace('-', '')
+    doc = primary_document.strip().rstrip('\\/')
+    return f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_num}/{doc}"
+
+
+class FilingColumns:
+    """One submissions page's parallel columns as NumPy arrays.
+
+    Forms are fixed-width byte strings and dates are datetime64, so a form/year query
+    is a pair of vectorized comparisons instead of a Python loop over every filing.
+    Accession numbers and documents stay as lists; only the matching rows are read.
+    """
+
+    __slots__ = ('forms', 'filing_dates', 'filing_years', 'report_dates', 'accession_numbers', 'primary_documents')
+
+    def __init__(self, columns: dict):
+        forms = columns.get('form', [])
+        filing_dates = columns.get('filingDate', [])
+        # Rows without a filing date are skipped, as the old loops did
+        count = min(len(forms), len(filing_dates))
+        report_dates = list(columns.get('reportDate', []))[:count]
+        report_dates += [''] * (count - len(report_dates))
+        self.forms = np.array(forms[:count], dtype='S')
+        self.filing_dates = np.array(filing_dates[:count], dtype='datetime64[D]')
+        self.filing_years = self.filing_dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        self.report_dates = np.array([date or 'NaT' for date in report_dates], dtype='datetime64[D]')
+        self.accession_numbers = columns.get('accessionNumber', [])
+        self.primary_documents = columns.get('primaryDocument', [])
+
+    def select(self, form: str, year: int) -> np.ndarray:
+        """Row numbers of the given form filed in the given calendar year, in page order"""
+        return np.flatnonzero((self.forms == form.encode('ascii')) & (self.filing_years == int(year)))
+
+    def filing_date(self, row: int) -> str:
+        return str(self.filing_dates[row])
+
+    def url(self, cik, row: int) -> str:
+        return archive_url(cik, self.accession_numbers[row], self.primary_documents[row])
+
+
+def page_columns(page_json: dict) -> dict:
+    """Filing columns of a submissions response; older pages hold them at the top level"""
+    return page_json.get('filings', {}).get('recent') or page_json
+
+
+def filing_columns(cik, response_json: dict) -> FilingColumns:
+    """Arrays for a company's recent filings, converted once per version of its submissions"""
+    key = (str(cik), submissions_fingerprint(response_json))
+    columns = _filing_columns_cache.get(key)
+    if columns is None:
+        columns = FilingColumns(response_json.get('filings', {}).get('recent', {}))
+        if len(_filing_columns_cache) >= FISCAL_INDEX_CACHE_SIZE:
+            _filing_columns_cache.pop(next(iter(_filing_columns_cache)))
+        _filing_columns_cache[key] = columns
+    return columns
+
+
+class FilingStore:
+    """SQLite table of filing metadata, filled from submissions responses as they are fetched.
+
+    Answers cross-company questions ("every 10-K filed in March 2024 by these CIKs")
+    with one indexed query instead of a submissions request per company. The file
+    lives in /tmp in Lambda, or can be downloaded from S3 with from_s3.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS filings (
+        accession TEXT PRIMARY KEY,
+        cik INTEGER NOT NULL,
+        form TEXT NOT NULL,
+        filing_date TEXT NOT NULL,
+        report_date TEXT,
+        primary_document TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_filings_cik_form_date ON filings (cik, form, filing_date);
+    CREATE INDEX IF NOT EXISTS idx_filings_form_date ON filings (form, filing_date);
+    CREATE TABLE IF NOT EXISTS companies (
+        cik INTEGER PRIMARY KEY,
+        name TEXT,
+        fiscal_year_end TEXT,
+        fingerprint TEXT,
+        updated_at REAL
+    );
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(self.SCHEMA)
+
+    @classmethod
+    def from_s3(cls, bucket: str, key: str, path: str, s3_client=None) -> 'FilingStore':
+        """Open the store at path, downloading a shipped copy from S3 first if there is none yet"""
+        if not os.path.exists(path):
+            try:
+                (s3_client or boto3.client('s3')).download_file(bucket, key, path)
+                print(f"Downloaded filing store from s3://{bucket}/{key}")
+            except Exception as e:
+                print(f"Error downloading filing store, starting empty: {e}")
+        return cls(path)
+
+    def upsert_submissions(self, cik, response_json: dict) -> bool:
+        """Store a company's recent filings; returns False when this version is already stored"""
+        fingerprint = submissions_fingerprint(response_json)
+        with self._lock:
+            row = self._conn.execute('SELECT fingerprint FROM companies WHERE cik = ?', (int(cik),)).fetchone()
+            if row is not None and row['fingerprint'] == fingerprint:
+                return False
+            self._upsert_rows(cik, response_json.get('filings', {}).get('recent', {}))
+            self._conn.execute(
+                'INSERT INTO companies (cik, name, fiscal_year_end, fingerprint, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(cik) DO UPDATE SET name = excluded.name, fiscal_year_end = excluded.fiscal_year_end, '
+                'fingerprint = excluded.fingerprint, updated_at = excluded.updated_at',
+                (int(cik), response_json.get('name'), response_json.get('fiscalYearEnd'), fingerprint, time.time()))
+            self._conn.commit()
+        return True
+
+    def upsert_page(self, cik, columns: dict):
+        """Store the filings of an older submissions page"""
+        with self._lock:
+            self._upsert_rows(cik, columns)
+            self._conn.commit()
+
+    def _upsert_rows(self, cik, columns: dict):
+        forms = columns.get('form', [])
+        filing_dates = columns.get('filingDate', [])
+        report_dates = columns.get('reportDate', [])
+        accession_numbers = columns.get('accessionNumber', [])
+        primary_documents = columns.get('primaryDocument', [])
+        rows = [
+            (accession_numbers[i], int(cik), forms[i], filing_dates[i],
+             report_dates[i] if i < len(report_dates) and report_dates[i] else None, primary_documents[i])
+            for i in range(min(len(forms), len(filing_dates), len(accession_numbers), len(primary_documents)))
+        ]
+        self._conn.executemany(
+            'INSERT INTO filings (accession, cik, form, filing_date, report_date, primary_document) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(accession) DO UPDATE SET form = excluded.form, '
+            'filing_date = excluded.filing_date, report_date = excluded.report_date, '
+            'primary_document = excluded.primary_document', rows)
+
+    def query(self, ciks=None, forms=None, filed_from: Optional[str] = None, filed_to: Optional[str] = None,
+              limit: Optional[int] = None) -> List[dict]:
+        """Filings matching every given filter, most recently filed first.
+
+        filed_from and filed_to are inclusive ISO dates ('2024-03-01', '2024-03-31').
+        """
+        clauses, params = [], []
+        if ciks is not None:
+            ciks = [int(cik) for cik in ciks]
+            clauses.append(f"cik IN ({', '.join('?' * len(ciks))})")
+            params += ciks
+        if forms is not None:
+            forms = [forms] if isinstance(forms, str) else list(forms)
+            clauses.append(f"form IN ({', '.join('?' * len(forms))})")
+            params += forms
+        if filed_from:
+            clauses.append('filing_date >= ?')
+            params.append(filed_from)
+        if filed_to:
+            clauses.append('filing_date <= ?')
+            params.append(filed_to)
+        sql = 'SELECT cik, form, filing_date, report_date, accession, primary_document FROM filings'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY filing_date DESC, accession DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row, url=archive_url(row['cik'], row['accession'], row['primary_document'])) for row in rows]
+
+    def updated_at(self, cik) -> Optional[float]:
+        with self._lock:
+            row = self._conn.execute('SELECT updated_at FROM companies WHERE cik = ?', (int(cik),)).fetchone()
+        return row['updated_at'] if row else None
+
+    def close(self):
+        self._conn.close()
+
+
+_default_filing_store = None
+
+
+def default_filing_store() -> Optional[FilingStore]:
+    """The shared store at FILING_STORE_PATH, or None when the store is not configured"""
+    global _default_filing_store
+    if _default_filing_store is None and FILING_STORE_PATH:
+        _default_filing_store = FilingStore(FILING_STORE_PATH)
+    return _default_filing_store
+
+
+def sec_url(url: str, base_url: Optional[str] = None) -> str:
+    """The URL to fetch an SEC URL from; unchanged unless a base URL (or SEC_EDGAR_BASE_URL) is set"""
+    base_url = base_url or SEC_EDGAR_BASE_URL
+    if not base_url:
+        return url
+    parts = urlsplit(url)
+    if parts.netloc not in SEC_HOSTS:
+        return url
+    return f"{base_url.rstrip('/')}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+
+def fiscal_period(report_date: str, fiscal_year_end: Optional[str] = None):
+    """Return (fiscal year, quarter) for a period ending on report_date.
+
+    The fiscal year is the calendar year the company's fiscal year ends in
+    (fiscalYearEnd "0930": the quarter ending 2023-12-30 is Q1 of fiscal 2024),
+    and the quarter counts three-month steps from the start of that year.
+    """
+    day = datetime.date.fromisoformat(report_date) - datetime.timedelta(days=REPORT_DATE_SLACK_DAYS)
+    end_month = int((fiscal_year_end or '1231')[:2])
+    months_into_year = (day.month - end_month - 1) % 12 + 1
+    fiscal_year = day.year + 1 if day.month > end_month else day.year
+    return fiscal_year, (months_into_year + 2) // 3
+
+
+def build_fiscal_period_index(cik, columns: dict, fiscal_year_end: Optional[str] = None,
+                              index: Optional[dict] = None, undated: Optional[list] = None) -> Dict[tuple, dict]:
+    """Index 10-K and 10-Q filings by (fiscal year, period) from their reportDate.
+
+    Periods are 'Q1'-'Q3' for 10-Qs and 'FY' for the 10-K, which also answers 'Q4'.
+    When a period was filed more than once the original (earliest) filing is kept.
+    10-Ks and 10-Qs without a reportDate are appended to undated when it is given.
+    """
+    index = {} if index is None else index
+    forms = columns.get('form', [])
+    report_dates = columns.get('reportDate', [])
+    filing_dates = columns.get('filingDate', [])
+    accession_numbers = columns.get('accessionNumber', [])
+    primary_documents = columns.get('primaryDocument', [])
+    for i, form in enumerate(forms):
+        if form not in ('10-K', '10-Q'):
+            continue
+        if i >= len(report_dates) or not report_dates[i]:
+            if undated is not None:
+                undated.append({'form': form, 'filing_date': filing_dates[i],
+                                'url': archive_url(cik, accession_numbers[i], primary_documents[i])})
+            continue
+        fiscal_year, quarter = fiscal_period(report_dates[i], fiscal_year_end)
+        if form == '10-K':
+            periods = ('FY', 'Q4')
+        elif quarter < 4:
+            periods = (f"Q{quarter}",)
+        else:
+            continue
+        entry = {
+            'form': form,
+            'report_date': report_dates[i],
+            'filing_date': filing_dates[i],
+            'accession': accession_numbers[i],
+            'url': archive_url(cik, accession_numbers[i], primary_documents[i]),
+        }
+        for period in periods:
+            current = index.get((fiscal_year, period))
+            if current is None or entry['filing_date'] < current['filing_date']:
+                index[(fiscal_year, period)] = entry
+    return index
+
+
+# Words in EDGAR titles that people leave out when they name a company
+LEGAL_SUFFIXES = frozenset("inc incorporated corp corporation co company ltd limited plc llc lp de the".split())
+
+# Words are lowercase letters/digits ("3.5" stays one word); "&" reads as "and" and possessives are dropped
+COMPANY_TOKEN_PATTERN = re.compile(r"(\$)?([A-Za-z0-9]+(?:\.[0-9]+)?)(?:['’]s\b)?|&")
+
+# Ordinary words that are also tickers ("ON", "ALL", "NOW") or one-word company names ("Target", "Gap",
+# "Block"): a ticker only when written in capitals, a name only when capitalized
+COMMON_WORDS = frozenset("""
+a an and are as at be by did do does for from had has have how in is it its of on or our the their this
+to was were what when which who why will with all am any big can car cash core cost day did fast five
+for free fun gain go good grow has help high hold home hope key life low main man max net new next nice
+now one open out peak plan play post rate real rent risk run safe sale save see shop sign so star tax
+team top true two up us very wave we well work year you
+affirm ball block buckle bumble carnival chord coherent compass crane deluxe dow equity express fox gap
+guess insight interface lemonade mosaic news oracle pool premier progressive root shell snap snowflake
+southern square stride tapestry target toast travelers unity upstart visa waters
+""".split())
+
+# Finance vocabulary written in capitals in questions; only a ticker with a "$" prefix ("$AI")
+TICKER_VOCABULARY = frozenset("ai ceo cfo coo eps esg fy gaap hr ipo it pe q roe roi ttm uk usa usd yoy ytd".split())
+
+CompanyMention = namedtuple('CompanyMention', ['text', 'cik', 'ticker', 'start', 'end', 'kind'])
+
+
+def company_words(text: str, strip_suffixes: bool = False) -> List[str]:
+    """Split a company name, ticker or question into lowercase words"""
+    words = []
+    for match in COMPANY_TOKEN_PATTERN.finditer(text):
+        words.append(match.group(2).lower() if match.group(2) else 'and')
+    if strip_suffixes:
+        # "BANK OF AMERICA CORP /DE/" is named "Bank of America"; "JPMORGAN CHASE & CO" is "JPMorgan Chase"
+        while len(words) > 1 and (words[-1] in LEGAL_SUFFIXES or words[-1] == 'and'):
+            words.pop()
+        if len(words) > 1 and words[0] == 'the':
+            words.pop(0)
+    return words
+
+
+def company_alias(name: str, strip_suffixes: bool = True) -> str:
+    """Normalized form of a company name; "Apple", "APPLE INC" and "Apple Inc." all give apple"""
+    return ' '.join(company_words(name, strip_suffixes))
+
+
+def build_alias_index(name_dict: Dict[str, str]):
+    """Map each normalized name to its CIK, keeping names that normalize alike apart.
+
+    Returns (aliases, collisions). When titles of different companies share an
+    alias it is left out of aliases, and collisions maps it to {full alias: CIK}
+    so a lookup can still tell the companies apart by their legal suffix. An alias
+    found ambiguous stays out of aliases for good, whatever companies follow.
+    """
+    aliases = {}
+    collisions = {}
+    # Tombstones: aliases shared by different companies, never to be entered in aliases again
+    ambiguous = set()
+    for name, cik in name_dict.items():
+        alias = company_alias(name)
+        if not alias:
+            continue
+        if alias in ambiguous:
+            collisions[alias][company_alias(name, strip_suffixes=False)] = cik
+            continue
+        current = aliases.get(alias)
+        if current is None:
+            aliases[alias] = (name, cik)
+        elif current[1] != cik:
+            first_name, first_cik = aliases.pop(alias)
+            ambiguous.add(alias)
+            collisions[alias] = {company_alias(first_name, strip_suffixes=False): first_cik,
+                                 company_alias(name, strip_suffixes=False): cik}
+    return {alias: cik for alias, (name, cik) in aliases.items()}, collisions
+
+
+class CompanyMatcher:
+    """Aho-Corasick automaton over the words of company names and tickers.
+
+    Finds every company mentioned in a question in one pass over its words, instead
+    of testing each of the ~10k EDGAR names against the text. Names win over tickers
+    when both spell the same words, and the longest mention wins when mentions overlap.
+    """
+
+    NAME = 'name'
+    TICKER = 'ticker'
+
+    def __init__(self, name_dict: Dict[str, str], ticker_dict: Dict[str, str], aliases: Optional[Dict[str, str]] = None):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        # First ticker seen for each CIK, used to hand a mention on to Lambda 2
+        self.tickers = {}
+        # Names are matched by alias; aliases shared by several companies are left out rather than guessed
+        if aliases is None:
+            aliases, _ = build_alias_index(name_dict)
+        for alias, cik in aliases.items():
+            self._add(alias.split(), str(cik), self.NAME)
+        for ticker, cik in ticker_dict.items():
+            self._add(company_words(ticker), str(cik), self.TICKER)
+            self.tickers.setdefault(str(cik), ticker.upper())
+        self._link()
+
+    def _add(self, words, cik, kind):
+        if not words:
+            return
+        state = 0
+        for word in words:
+            nxt = self._goto[state].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        if not self._out[state]:
+            self._out[state] = ((len(words), cik, kind),)
+
+    def _link(self):
+        # Breadth-first, so a state's failure link is final before its children use it
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(word, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def _scan(self, words):
+        """Yield (start, end, cik, kind) for every pattern ending at each word"""
+        state = 0
+        for i, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for length, cik, kind in self._out[state]:
+                yield i + 1 - length, i + 1, cik, kind
+
+    @staticmethod
+    def _longest(candidates):
+        """Leftmost-longest mentions that do not overlap"""
+        chosen = []
+        end = 0
+        for candidate in sorted(candidates, key=lambda c: (c[0], -c[1])):
+            if candidate[0] >= end:
+                chosen.append(candidate)
+                end = candidate[1]
+        return chosen
+
+    @staticmethod
+    def _ambiguous(words, kind):
+        if len(words) > 1:
+            return False
+        word = words[0]
+        if kind == CompanyMatcher.TICKER:
+            return len(word) == 1 or word in TICKER_VOCABULARY or word in COMMON_WORDS
+        return word in COMMON_WORDS
+
+    @staticmethod
+    def _skip_suffixes(words, end):
+        """Extend a mention over a trailing "Inc." or "& Co." ("Apple Inc." is one mention)"""
+        while end < len(words):
+            if words[end] in LEGAL_SUFFIXES:
+                end += 1
+            elif words[end] == 'and' and end + 1 < len(words) and words[end + 1] in LEGAL_SUFFIXES:
+                end += 2
+            else:
+                break
+        return end
+
+    def find(self, text: str) -> List[CompanyMention]:
+        """Company mentions in free text, with case used to tell tickers from ordinary words"""
+        tokens = list(COMPANY_TOKEN_PATTERN.finditer(text))
+        words = [match.group(2).lower() if match.group(2) else 'and' for match in tokens]
+        shouting = text.isupper()
+
+        def allowed(start, end, kind):
+            if not self._ambiguous(words[start:end], kind):
+                return True
+            token = tokens[start]
+            if token.group(1):
+                return True
+            original = token.group(2)
+            if kind == self.NAME:
+                return original[0].isupper() and not shouting
+            word = words[start]
+            if len(word) == 1 or word in TICKER_VOCABULARY:
+                return False
+            return original.isupper() and not shouting
+
+        candidates = [c for c in self._scan(words) if allowed(c[0], c[1], c[3])]
+        mentions = []
+        for start, end, cik, kind in self._longest(candidates):
+            end = self._skip_suffixes(words, end)
+            # The "$" of "$AAPL" and a trailing "'s" are not part of the mention
+            first = tokens[start].start(2) if tokens[start].group(2) else tokens[start].start()
+            last = tokens[end - 1].end(2) if tokens[end - 1].group(2) else tokens[end - 1].end()
+            mentions.append(CompanyMention(text[first:last], cik, self.tickers.get(cik), first, last, kind))
+        return mentions
+
+    def replace(self, words: List[str]):
+        """Return (CIKs, remaining words) for lowercase words, with company mentions taken out.
+
+        Without case to go on, tickers and one-word names that are ordinary words are left alone.
+        """
+        candidates = [c for c in self._scan(words) if not self._ambiguous(words[c[0]:c[1]], c[3])]
+        ciks = set()
+        remaining = []
+        i = 0
+        for start, end, cik, kind in self._longest(candidates):
+            remaining.extend(words[i:start])
+            ciks.add(cik)
+            i = self._skip_suffixes(words, end)
+        remaining.extend(words[i:])
+        return ciks, remaining
+
+
+def listing_s3_client(s3_client=None):
+    """The S3 client for the company listing: the one passed in, the Lambda execution role's, or a local profile's"""
+    # A client passed in (e.g. an in-memory stand-in) is used as is
+    if s3_client is not None:
+        print("Using the S3 client passed in")
+        return s3_client
+    # Check if running in Lambda or local environment
+    if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        # Running in Lambda - use execution role
+        print("Detected Lambda environment, using execution role")
+        return boto3.client('s3')
+    # Running locally - try profile first, fallback to default
+    print("Detected local environment, trying profile configuration")
+    try:
+        session = boto3.Session(profile_name='mlt-course-730128023791')
+        s3_client = session.client('s3')
+        print("Using profile: mlt-course-730128023791")
+        return s3_client
+    except (ProfileNotFound, NoCredentialsError) as profile_error:
+        print(f"Profile not found ({profile_error}), falling back to default credentials")
+        return boto3.client('s3')
+
+
+def listing_version(s3_client=None, s3_bucket: Optional[str] = None, s3_key: Optional[str] = None) -> Optional[str]:
+    """ETag of the company listing in S3, from a HEAD request instead of a download.
+
+    Equals listing_fingerprint of an SECEdgar loaded from the same object, so a cached
+    miss can be checked against the current listing without loading it. None when
+    the object can't be read.
+    """
+    try:
+        response = listing_s3_client(s3_client).head_object(Bucket=s3_bucket or LISTING_S3_BUCKET,
+                                                            Key=s3_key or LISTING_S3_KEY)
+        return response.get('ETag')
+    except Exception as e:
+        print(f"Could not read the company listing version: {e}")
+        return None
+
 
 '''
 The SECEdgar class is used to parse the public
@@ -19,41 +841,43 @@ retrievable by either the company name or ticker symbol.
 It does not accept incomplete or invalid company names or ticker symbols.
 '''
 class SECEdgar: 
-    def __init__(self, fileurl=None, use_s3=False, s3_bucket=None, s3_key=None):
+    def __init__(self, fileurl=None, use_s3=False, s3_bucket=None, s3_key=None, filing_store=None, base_url=None,
+                 s3_client=None, deadline=None):
         self.fileurl = fileurl
+        # Epoch seconds SEC requests must finish by (e.g. from the Lambda context); None for no limit
+        self.deadline = deadline
+        # SEC requests go here instead of sec.gov when set; returned filing URLs stay canonical
+        self.base_url = base_url or SEC_EDGAR_BASE_URL
+        # Filing metadata from every submissions response is upserted here when set
+        self.filing_store = filing_store if filing_store is not None else default_filing_store()
         # initialize two dictionaries to store CIKs
         self.name_dict = {}
         self.ticker_dict = {}
         # headers used to follow SEC EDGAR Fair Access Policy 
         self.headers = {'User-Agent': 'MLT CP nathanrasfaw@gmail.com'}
+        # Identifies the version of the company listing loaded, so misses cached against an older one are dropped
+        self.listing_fingerprint = None
+        # Time spent and requests made by this instance ("<stage>_ms" and counts), for handler timings
+        self.stats = {}
+        # The same stages as (stage, start, end) perf_counter times, for handler trace spans
+        self.spans = []
+        load_started = time.perf_counter()
 
         if use_s3:
             # Use S3 data source
             if s3_bucket is None:
-                s3_bucket = "nathanasfaw-sec-edgar-files"
+                s3_bucket = LISTING_S3_BUCKET
             if s3_key is None:
-                s3_key = "company_tickers.json"
+                s3_key = LISTING_S3_KEY
             
             try:
-                # Check if running in Lambda or local environment
-                if os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
-                    # Running in Lambda - use execution role
-                    print("Detected Lambda environment, using execution role")
-                    s3_client = boto3.client('s3')
-                else:
-                    # Running locally - try profile first, fallback to default
-                    print("Detected local environment, trying profile configuration")
-                    try:
-                        session = boto3.Session(profile_name='mlt-course-730128023791')
-                        s3_client = session.client('s3')
-                        print("Using profile: mlt-course-730128023791")
-                    except (ProfileNotFound, NoCredentialsError) as profile_error:
-                        print(f"Profile not found ({profile_error}), falling back to default credentials")
-                        s3_client = boto3.client('s3')
+                s3_client = listing_s3_client(s3_client)
                 
                 # Attempt to get the object from S3
                 response = s3_client.get_object(Bucket=s3_bucket, Key=s3_key)
                 self.filejson = json.loads(response['Body'].read().decode('utf-8'))
+                # The object's ETag names this version of the listing; listing_version() reads it without a download
+                self.listing_fingerprint = response.get('ETag')
                 print(f"Successfully loaded data from S3: s3://{s3_bucket}/{s3_key}")
 
             except ClientError as e:
@@ -71,38 +895,79 @@ class SECEdgar:
             if fileurl is None:
                 fileurl = "https://www.sec.gov/files/company_tickers.json"
             # send a GET request to the SEC EDGAR database and stores the response
-            r = requests.get(fileurl, headers=self.headers)
+            r = self.sec_get(fileurl)
             # stores the JSON response in the filejson variable
             self.filejson = r.json()
 
+        if self.listing_fingerprint is None:
+            self.listing_fingerprint = hashlib.sha1(
+                json.dumps(self.filejson, separators=(',', ':')).encode('utf-8')).hexdigest()
         self.cik_json_to_dict()
+        self.record_time('index_load', load_started)
+
+    # Method adds the time since started to a stage in stats and records it as a span
+    def record_time(self, stage: str, started: float):
+        ended = time.perf_counter()
+        key = f"{stage}_ms"
+        self.stats[key] = round(self.stats.get(key, 0) + (ended - started) * 1000, 1)
+        self.spans.append((stage, started, ended))
+
+    # Method adds to a count in stats
+    def record_count(self, name: str, value: int = 1):
+        self.stats[name] = self.stats.get(name, 0) + value
 
     # Method to convert the JSON response to a dictionary 
     def cik_json_to_dict(self):
-        self.name_dict = {}
-        self.ticker_dict = {}
+        # The listing is released once the table is built, so a second call needs it loaded again
+        if self.filejson is None:
+            raise RuntimeError("cik_json_to_dict needs the company listing in filejson; it was released "
+                               "after the company table was built, so load the listing again first")
+        # One row per CIK with all of its tickers; name_dict and ticker_dict are views of
+        # lowercase names/tickers to CIK strings over the same table
+        self.companies = CompanyTable.from_json(self.filejson)
+        # The table holds everything the raw listing did; don't keep both in memory
+        self.filejson = None
+        self.name_dict = self.companies.name_view()
+        self.ticker_dict = self.companies.ticker_view()
+        self._company_matcher = None
+        # The alias index is built on the first name lookup; ticker hits never need it
+        self._alias_index = None
+
+    # Method returns (alias_dict, alias_collisions), building them from name_dict on first use
+    def alias_index(self):
+        if self._alias_index is None:
+            # Normalized names ("apple" for "Apple Inc.") so variants of a name resolve in one lookup
+            self._alias_index = build_alias_index(self.name_dict)
+            if self._alias_index[1]:
+                logger.info("%d company names normalize to the same alias; resolving those by full name only",
+                            len(self._alias_index[1]))
+        return self._alias_index
 
-        # iterate through each item in the JSON response
-        for value in self.filejson.values():
-            # get the CIK, name, and ticker from the item (strored as a string)
-            cik = str(value['cik_str'])
-            # Both name and ticker are converted to lowercase for case-insensitive matching
-            name = value['title'].lower()
-            ticker = value['ticker'].lower()
+    @property
+    def alias_dict(self) -> Dict[str, str]:
+        return self.alias_index()[0]
 
-            # add the CIK to the name dictionary
-            self.name_dict[name] = cik
-            # add the CIK to the ticker dictionary
-            self.ticker_dict[ticker] = cik
+    @property
+    def alias_collisions(self) -> Dict[str, Dict[str, str]]:
+        return self.alias_index()[1]
 
 
     # Method takes a given company name and returns the CIK number if applicable
+    # Punctuation, case, "&"/"and" and legal suffixes (Inc, Corp, /DE/) are ignored
     def name_to_cik(self, name: str) -> Optional[str]:
-        try:
-            return self.name_dict[name.lower()]
-        except KeyError:
-            print(f"Company name '{name}' not found.")
-            return None
+        alias = company_alias(name)
+        cik = self.alias_dict.get(alias)
+        if cik is not None:
+            return cik
+        if alias in self.alias_collisions:
+            # Several companies share the alias; only the full name tells them apart
+            candidates = self.alias_collisions[alias]
+            cik = candidates.get(company_alias(name, strip_suffixes=False))
+            if cik is None:
+                print(f"Company name '{name}' is ambiguous: {sorted(candidates)}")
+            return cik
+        print(f"Company name '{name}' not found.")
+        return None
             
 
     # Method takes a given ticker symbol and returns the CIK number if applicable        
@@ -114,34 +979,62 @@ class SECEdgar:
             return None
 
 
+    # Method returns the company record (integer CIK, title and all tickers) for a CIK
+    def cik_to_company(self, cik) -> Optional[CompanyRecord]:
+        return self.companies.by_cik(cik)
+
+    # Method returns every ticker listed for a CIK, e.g. ('GOOGL', 'GOOG') for Alphabet
+    def tickers_for_cik(self, cik) -> tuple:
+        company = self.companies.by_cik(cik)
+        return company.tickers if company else ()
+
+    # Method returns the company mention matcher for this index, built on first use
+    def company_matcher(self) -> CompanyMatcher:
+        if self._company_matcher is None:
+            self._company_matcher = CompanyMatcher(self.name_dict, self.ticker_dict, self.alias_dict)
+        return self._company_matcher
+
+    # Method finds every company named in free text, e.g. find_companies("How did Apple and MSFT compare?")
+    def find_companies(self, text: str) -> List[CompanyMention]:
+        return self.company_matcher().find(text)
+
     # (ADDITION) Method to search for company names that contain a given partial string
     def search_names(self, partial: str) -> List[str]:
         # Returns a list of all matching company names
         partial = partial.lower()
         return [name for name in self.name_dict if partial in name] 
 
-    # Method to help find the filing of a companies 10-K form given a CIK number and a year
-    def annual_filing(self, cik: str, year: int) -> Optional[str]:
+    # Method to help find the filing of a companies 10-K form given a CIK number and a year;
+    # response_json is the company's submissions JSON when the caller has already fetched it
+    def annual_filing(self, cik: str, year: int, response_json: Optional[dict] = None) -> Optional[str]:
         # Check if year is an integer and within a valid range
-        current_year = datetime.datetime.now().year
-        if not isinstance(year, int) or year < 1900 or year > current_year + 1:
+        if not valid_filing_year(year):
             print(f"Invalid year: {year}")
             return None
         # Fetch the company's submission JSON data
-        response_json = self.fetch_company_json(cik)
+        if response_json is None:
+            response_json = self.fetch_company_json(cik)
         # Check if the JSON data was successfully retrieved
         if response_json is None:
             print("Could not fetch company JSON data.")
             return None
+        # A recent miss against the same submissions skips the walk through older pages
+        miss_key = ('filing', str(cik), '10-K', year, None)
+        fingerprint = submissions_fingerprint(response_json)
+        if _negative_cache.contains(miss_key, fingerprint):
+            print(f"No 10-K filing found for year {year} (cached miss).")
+            return None
         # Call the method to find the 10-K filing and return the result
         find_10k = self.find_10k_filing(cik, year, response_json)
+        # A search cut short by the deadline isn't a miss
+        if find_10k is None and not self.deadline_passed():
+            _negative_cache.add(miss_key, fingerprint)
         return find_10k
 
     # Method to help find the filing of a companies 10-Q form given a CIK number, year, and quarter
-    def quarterly_filing(self, cik: str, year: int, quarter: int) -> Optional[str]:
+    def quarterly_filing(self, cik: str, year: int, quarter: int, response_json: Optional[dict] = None) -> Optional[str]:
         # Check if year is an integer and within a valid range
-        current_year = datetime.datetime.now().year
-        if not isinstance(year, int) or year < 1900 or year > current_year + 1:
+        if not valid_filing_year(year):
             print(f"Invalid year: {year}")
             return None
         # Check if quarter is an integer between 1 and 4
@@ -149,15 +1042,191 @@ class SECEdgar:
             print(f"Invalid quarter: {quarter}. Must be between 1 and 4.")
             return None
         # Fetch the company's submission JSON data
-        response_json = self.fetch_company_json(cik)
+        if response_json is None:
+            response_json = self.fetch_company_json(cik)
         # Check if the JSON data was successfully retrieved
         if response_json is None:
             print("Could not fetch company JSON data.")
             return None
+        miss_key = ('filing', str(cik), '10-Q', year, quarter)
+        fingerprint = submissions_fingerprint(response_json)
+        if _negative_cache.contains(miss_key, fingerprint):
+            print(f"No 10-Q filing found for year {year} and quarter {quarter} (cached miss).")
+            return None
         # Call the method to find the 10-Q filing and return the result
         find_10q = self.find_10q_filing(cik, year, quarter, response_json)
+        if find_10q is None and not self.deadline_passed():
+            _negative_cache.add(miss_key, fingerprint)
         return find_10q
     
+    # Method to find a filing by fiscal period, e.g. fiscal_period_filing(cik, 2024, 1) for the
+    # 10-Q covering the first quarter of fiscal 2024; quarter 4 (or None) gives that year's 10-K
+    def fiscal_period_filing(self, cik: str, fiscal_year: int, quarter: Optional[int] = None,
+                             response_json: Optional[dict] = None) -> Optional[str]:
+        if response_json is None:
+            response_json = self.fetch_company_json(cik)
+        if response_json is None:
+            print("Could not fetch company JSON data.")
+            return None
+        entry = self.fiscal_period_lookup(cik, fiscal_year, quarter, response_json)
+        return entry['url'] if entry else None
+
+    # Method finds the filing for a fiscal period as Lambda 2 serves it: by fiscal period first, then
+    # by filing date for filings without a reportDate. Returns (url, form), or None. Misses are
+    # remembered against the submissions like annual_filing's, so a repeat skips the older pages
+    def period_filing(self, cik: str, year: int, quarter: Optional[int] = None,
+                      response_json: Optional[dict] = None) -> Optional[Tuple[str, str]]:
+        if not valid_filing_year(year):
+            print(f"Invalid year: {year}")
+            return None
+        if quarter not in (None, 1, 2, 3, 4):
+            print(f"Invalid quarter: {quarter}. Must be between 1 and 4.")
+            return None
+        if response_json is None:
+            response_json = self.fetch_company_json(cik)
+        if response_json is None:
+            print("Could not fetch company JSON data.")
+            return None
+        # Fiscal periods, not the filing years annual_filing and quarterly_filing search by
+        miss_key = ('fiscal_filing', str(cik), year, quarter)
+        fingerprint = submissions_fingerprint(response_json)
+        if _negative_cache.contains(miss_key, fingerprint):
+            print(f"No filing found for fiscal year {year}" + (f" Q{quarter}" if quarter else "") + " (cached miss).")
+            return None
+        filing_url = self.fiscal_period_filing(cik, year, quarter, response_json)
+        if filing_url:
+            return filing_url, '10-K' if quarter in (None, 4) else '10-Q'
+        # The fiscal lookup has read every submissions page by now, unless the deadline cut it short
+        filing_url = self.undated_filing(cik, year, quarter)
+        if filing_url:
+            return filing_url, '10-K' if quarter is None else '10-Q'
+        if not self.deadline_passed():
+            _negative_cache.add(miss_key, fingerprint)
+        return None
+
+    # Method looks up one fiscal period in the company's cached index, reading older
+    # submissions pages only while the period has not been found
+    def fiscal_period_lookup(self, cik: str, fiscal_year: int, quarter: Optional[int], response_json: dict) -> Optional[dict]:
+        period = 'FY' if quarter in (None, 4) else f"Q{int(quarter)}"
+        key = (int(fiscal_year), period)
+        fingerprint = submissions_fingerprint(response_json)
+        cached = _fiscal_index_cache.get(str(cik))
+        if cached is None or cached['fingerprint'] != fingerprint:
+            fiscal_year_end = response_json.get('fiscalYearEnd')
+            recent = response_json.get('filings', {}).get('recent', {})
+            cached = {
+                'fingerprint': fingerprint,
+                'fiscal_year_end': fiscal_year_end,
+                'index': {},
+                # 10-Ks and 10-Qs without a reportDate from the pages read so far, for undated_filing
+                'undated': [],
+                'pages': [f['name'] for f in response_json.get('filings', {}).get('files', [])],
+            }
+            build_fiscal_period_index(cik, recent, fiscal_year_end, cached['index'], cached['undated'])
+            if len(_fiscal_index_cache) >= FISCAL_INDEX_CACHE_SIZE:
+                _fiscal_index_cache.pop(next(iter(_fiscal_index_cache)))
+            _fiscal_index_cache[str(cik)] = cached
+
+        while key not in cached['index'] and cached['pages'] and not self.deadline_passed():
+            # A page leaves the queue only once it has been read, so a failed fetch is retried next time
+            name = cached['pages'][0]
+            columns = self.fetch_submissions_page(cik, name)
+            if columns is None:
+                break
+            if cached['pages'] and cached['pages'][0] == name:
+                cached['pages'].pop(0)
+            build_fiscal_period_index(cik, columns, cached['fiscal_year_end'], cached['index'], cached['undated'])
+
+        entry = cached['index'].get(key)
+        if entry is None:
+            print(f"No filing found for fiscal year {fiscal_year} {period}.")
+        return entry
+
+    # Method finds a filing that has no reportDate (and so no fiscal period) by the filing-date rules
+    # of annual_filing and quarterly_filing: the 10-K filed in the year, or the quarter-th most
+    # recent 10-Q filed in it. Only filings already read by fiscal_period_lookup are searched, so
+    # call it after a fiscal_period_filing miss, which has read every submissions page by then
+    def undated_filing(self, cik: str, year: int, quarter: Optional[int] = None) -> Optional[str]:
+        cached = _fiscal_index_cache.get(str(cik))
+        form = '10-K' if quarter is None else '10-Q'
+        filings = sorted((filing for filing in (cached['undated'] if cached else [])
+                          if filing['form'] == form and filing['filing_date'].startswith(str(year))),
+                         key=lambda filing: filing['filing_date'], reverse=True)
+        position = 1 if quarter is None else int(quarter)
+        if 1 <= position <= len(filings):
+            return filings[position - 1]['url']
+        print(f"No undated {form} filing found for year {year}" + (f" and quarter {quarter}." if quarter else "."))
+        return None
+
+    # Method sends a GET to an SEC URL, through the base URL override when one is set
+    def sec_get(self, url: str):
+        return requests.get(sec_url(url, self.base_url), headers=self.headers, timeout=self.request_timeout())
+
+    # Method returns the timeout for the next SEC request, ending at the deadline when one is set
+    def request_timeout(self) -> float:
+        if self.deadline is None:
+            return SEC_REQUEST_TIMEOUT_SECONDS
+        remaining = self.deadline - time.time()
+        return max(MIN_SEC_REQUEST_TIMEOUT_SECONDS, min(SEC_REQUEST_TIMEOUT_SECONDS, remaining))
+
+    # Method checks whether the deadline has passed, after which older submissions pages are skipped
+    def deadline_passed(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    # Method fetches one older submissions page (the "files" list) and returns its filing columns
+    def fetch_submissions_page(self, cik: str, name: str) -> Optional[dict]:
+        if self.deadline_passed():
+            print(f"Deadline passed, skipping submissions page {name}")
+            self.record_count('deadline_skipped_pages')
+            return None
+        file_url = f"https://data.sec.gov/submissions/{name}"
+        started = time.perf_counter()
+        resp = self.sec_get(file_url)
+        self.record_time('submissions_fetch', started)
+        self.record_count('overflow_pages')
+        if resp.status_code != 200:
+            print(f"Failed to fetch {file_url} (status {resp.status_code})")
+            return None
+        columns = page_columns(resp.json())
+        if self.filing_store is not None:
+            self.filing_store.upsert_page(cik, columns)
+        return columns
+
+    # Method returns stored filings across companies, e.g. every 10-K filed in March 2024 by a watchlist:
+    # query_filings(['AAPL', 'MSFT'], forms='10-K', filed_from='2024-03-01', filed_to='2024-03-31')
+    # Companies are CIKs, tickers or names; only filings already fetched (see refresh_filings) are found
+    def query_filings(self, companies=None, forms=None, filed_from: Optional[str] = None,
+                      filed_to: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        if self.filing_store is None:
+            print("No filing store configured (set FILING_STORE_PATH or pass filing_store).")
+            return []
+        ciks = None
+        if companies is not None:
+            ciks = [cik for cik in (self._resolve_cik(company) for company in companies) if cik is not None]
+        return self.filing_store.query(ciks, forms, filed_from, filed_to, limit)
+
+    # Method fetches submissions for companies whose stored filings are missing or older than max_age_seconds
+    def refresh_filings(self, companies, max_age_seconds: float = 24 * 60 * 60) -> int:
+        if self.filing_store is None:
+            print("No filing store configured (set FILING_STORE_PATH or pass filing_store).")
+            return 0
+        refreshed = 0
+        for company in companies:
+            cik = self._resolve_cik(company)
+            if cik is None:
+                continue
+            updated_at = self.filing_store.updated_at(cik)
+            if updated_at is None or time.time() - updated_at > max_age_seconds:
+                if self.fetch_company_json(cik) is not None:
+                    refreshed += 1
+        return refreshed
+
+    def _resolve_cik(self, company) -> Optional[str]:
+        company = str(company)
+        if company.isdigit():
+            return company
+        return self.ticker_dict.get(company.lower()) or self.name_to_cik(company)
+
     # Method pads the CIK with leading zeros to ensure it is 10 digits long
     def cik_extender(self, cik: str) -> str:
         return cik.zfill(10)
@@ -168,14 +1237,20 @@ class SECEdgar:
             return None
         padded_cik = self.cik_extender(cik)
         submissions_url = f"https://data.sec.gov/submissions/CIK{padded_cik}.json"
-        response = requests.get(submissions_url, headers=self.headers)
+        started = time.perf_counter()
+        response = self.sec_get(submissions_url)
+        self.record_time('submissions_fetch', started)
+        self.record_count('submissions_requests')
         # Checks if the request was successful
         if response.status_code == 200:
             try:
-                return response.json()
+                response_json = response.json()
             except Exception as e:
                 print(f"Error parsing JSON: {e}")
                 return None
+            if self.filing_store is not None:
+                self.filing_store.upsert_submissions(cik, response_json)
+            return response_json
         else:
             print(f"Failed to fetch data. Status code: {response.status_code}")
             return None
@@ -183,41 +1258,20 @@ class SECEdgar:
     # Method to find the most recent 10-K filing for a given CIK number and year
     def find_10k_filing(self, cik: str, year: int, response_json) -> Optional[str]:
         # 1. Search in recent filings
-        recent = response_json.get('filings', {}).get('recent', {})
-        forms = recent.get('form', [])
-        filing_dates = recent.get('filingDate', [])
-        accession_numbers = recent.get('accessionNumber', [])
-        primary_documents = recent.get('primaryDocument', [])
-
-        for i, form in enumerate(forms):
-            if form == '10-K' and i < len(filing_dates):
-                if filing_dates[i].startswith(str(year)):
-                    acc_num = accession_numbers[i].replace('-', '')
-                    doc = primary_documents[i].strip().rstrip('\\/')
-                    filing_url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_num}/{doc}"
-                    return filing_url
+        recent = filing_columns(cik, response_json)
+        rows = recent.select('10-K', year)
+        if rows.size:
+            return recent.url(cik, rows[0])
 
         # 2. If not found, check each file in "files" (no recursion)
         files = response_json.get('filings', {}).get('files', [])
         for file_info in files:
-            file_url = f"https://data.sec.gov/submissions/{file_info['name']}"
-            resp = requests.get(file_url, headers=self.headers)
-            if resp.status_code == 200:
-                file_json = resp.json()
-                recent = file_json.get('filings', {}).get('recent', {})
-                forms = recent.get('form', [])
-                filing_dates = recent.get('filingDate', [])
-                accession_numbers = recent.get('accessionNumber', [])
-                primary_documents = recent.get('primaryDocument', [])
-                for i, form in enumerate(forms):
-                    if form == '10-K' and i < len(filing_dates):
-                        if filing_dates[i].startswith(str(year)):
-                            acc_num = accession_numbers[i].replace('-', '')
-                            doc = primary_documents[i].strip().rstrip('\\/')
-                            filing_url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_num}/{doc}"
-                            return filing_url
-            else:
-                print(f"Failed to fetch {file_url} (status {resp.status_code})")
+            columns = self.fetch_submissions_page(cik, file_info['name'])
+            if columns is not None:
+                page = FilingColumns(columns)
+                rows = page.select('10-K', year)
+                if rows.size:
+                    return page.url(cik, rows[0])
 
         print(f"No 10-K filing found for year {year}.")
         return None
@@ -228,45 +1282,18 @@ class SECEdgar:
             return None
 
         # Collect all 10-Q filings for the year from recent filings
-        quarterly_filings = []
-        
         # 1. Search in recent filings
-        recent = response_json.get('filings', {}).get('recent', {})
-        forms = recent.get('form', [])
-        filing_dates = recent.get('filingDate', [])
-        accession_numbers = recent.get('accessionNumber', [])
-        primary_documents = recent.get('primaryDocument', [])
-
-        for i, form in enumerate(forms):
-            if form == '10-Q' and i < len(filing_dates):
-                if filing_dates[i].startswith(str(year)):
-                    acc_num = accession_numbers[i].replace('-', '')
-                    doc = primary_documents[i].strip().rstrip('\\/')
-                    filing_url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_num}/{doc}"
-                    quarterly_filings.append((filing_dates[i], filing_url))
+        recent = filing_columns(cik, response_json)
+        quarterly_filings = [(recent.filing_date(row), recent.url(cik, row)) for row in recent.select('10-Q', year)]
 
         # 2. If not enough filings found, check each file in "files"
         if len(quarterly_filings) < quarter:
             files = response_json.get('filings', {}).get('files', [])
             for file_info in files:
-                file_url = f"https://data.sec.gov/submissions/{file_info['name']}"
-                resp = requests.get(file_url, headers=self.headers)
-                if resp.status_code == 200:
-                    file_json = resp.json()
-                    recent = file_json.get('filings', {}).get('recent', {})
-                    forms = recent.get('form', [])
-                    filing_dates = recent.get('filingDate', [])
-                    accession_numbers = recent.get('accessionNumber', [])
-                    primary_documents = recent.get('primaryDocument', [])
-                    for i, form in enumerate(forms):
-                        if form == '10-Q' and i < len(filing_dates):
-                            if filing_dates[i].startswith(str(year)):
-                                acc_num = accession_numbers[i].replace('-', '')
-                                doc = primary_documents[i].strip().rstrip('\\/')
-                                filing_url = f"https://www.sec.gov/Archives/edgar/data/{int(cik)}/{acc_num}/{doc}"
-                                quarterly_filings.append((filing_dates[i], filing_url))
-                else:
-                    print(f"Failed to fetch {file_url} (status {resp.status_code})")
+                columns = self.fetch_submissions_page(cik, file_info['name'])
+                if columns is not None:
+                    page = FilingColumns(columns)
+                    quarterly_filings += [(page.filing_date(row), page.url(cik, row)) for row in page.select('10-Q', year)]
 
         # Sort filings by date (most recent first)
         quarterly_filings.sort(key=lambda x: x[0], reverse=True)
@@ -285,10 +1312,92 @@ class SECEdgar:
         if not filing_url:
             return None
         try:
-            response = requests.get(filing_url, headers=self.headers)
+            response = self.sec_get(filing_url)
             if response.status_code == 200:
                 return response.text
             return None
         except Exception as e:
             print(f"Error getting filing content: {e}")
             return None
+
+    # Method fetches a company's XBRL facts and returns them indexed by (concept, fiscal year, fiscal period)
+    def company_facts_index(self, cik: str) -> Optional[Dict[tuple, dict]]:
+        """Return the cached companyfacts index for a CIK, refreshing it after the TTL."""
+        if cik is None:
+            return None
+        key = str(int(cik))
+        cached = cached_company_facts(key)
+        if cached is not None:
+            return cached
+        facts_url = f"https://data.sec.gov/api/xbrl/companyfacts/CIK{self.cik_extender(key)}.json"
+        facts_json = self._fetch_facts_json(facts_url)
+        if facts_json is None:
+            return None
+        index = build_company_facts_index(facts_json)
+        cache_company_facts(key, index)
+        return index
+
+    # Method fetches a single concept (smaller than companyfacts) when only one metric is needed
+    def company_concept_index(self, cik: str, concept: str) -> Optional[Dict[tuple, dict]]:
+        """Return the cached companyconcept index for one concept of a CIK."""
+        if cik is None:
+            return None
+        concept = self._qualify_concept(concept)
+        key = str(int(cik))
+        # A fresh full companyfacts index already covers every concept
+        cached = cached_company_facts(key)
+        if cached is None:
+            cached = cached_company_facts((key, concept))
+        if cached is not None:
+            return cached
+        taxonomy, tag = concept.split(':', 1)
+        concept_url = f"https://data.sec.gov/api/xbrl/companyconcept/CIK{self.cik_extender(key)}/{taxonomy}/{tag}.json"
+        concept_json = self._fetch_facts_json(concept_url)
+        if concept_json is None:
+            return None
+        index = build_company_facts_index(concept_json)
+        cache_company_facts((key, concept), index)
+        return index
+
+    # Method looks up one reported metric, e.g. lookup_metric(cik, 'Revenues', 2023) for the FY2023 value
+    def lookup_metric(self, cik: str, concept: str, fiscal_year: int, fiscal_period: str = 'FY') -> Optional[dict]:
+        index = self.company_facts_index(cik)
+        if index is None:
+            return None
+        return index.get((self._qualify_concept(concept), int(fiscal_year), fiscal_period.upper()))
+
+    # Method returns a metric for several fiscal years at once, for trend questions
+    def metric_history(self, cik: str, concept: str, fiscal_years: List[int], fiscal_period: str = 'FY') -> Dict[int, Optional[dict]]:
+        index = self.company_facts_index(cik)
+        if index is None:
+            return {int(year): None for year in fiscal_years}
+        concept = self._qualify_concept(concept)
+        return {int(year): index.get((concept, int(year), fiscal_period.upper())) for year in fiscal_years}
+
+    # Concepts default to the us-gaap taxonomy when no prefix is given
+    def _qualify_concept(self, concept: str) -> str:
+        return concept if ':' in concept else f"us-gaap:{concept}"
+
+    def _fetch_facts_json(self, url: str) -> Optional[dict]:
+        response = self.sec_get(url)
+        if response.status_code != 200:
+            print(f"Failed to fetch {url} (status {response.status_code})")
+            return None
+        try:
+            return response.json()
+        except Exception as e:
+            print(f"Error parsing JSON: {e}")
+            return None
+
+
+def clear_company_facts_cache():
+    _company_facts_cache.clear()
+
+
+def clear_negative_cache():
+    _negative_cache.clear()
+
+
+def clear_fiscal_period_cache():
+    _fiscal_index_cache.clear()
+    _filing_columns_cache.clear()
@@ -0,0 +1,76 @@
+# deadline.py - The invocation's deadline, from the Lambda context's remaining time
+import contextvars
+import math
+import os
+import time
+
+# Kept back from the Lambda timeout to build and return the response
+DEADLINE_RESERVE_MS = int(os.environ.get('DEADLINE_RESERVE_MS', 500))
+# Shortest timeout handed to a network call, so a nearly spent budget still fails fast rather than at once
+MIN_TIMEOUT_SECONDS = 1.0
+
+
+class Deadline:
+    """A point in time (epoch seconds, or None for no deadline) every stage should finish by.
+
+    Epoch time rather than a monotonic clock, so the deadline can be passed to another
+    Lambda as "deadline_ms" and mean the same moment there.
+    """
+
+    def __init__(self, at=None):
+        self.at = at
+
+    @classmethod
+    def from_context(cls, context, deadline_ms=None, reserve_ms=DEADLINE_RESERVE_MS):
+        """The earlier of the Lambda's own timeout (less reserve_ms) and a caller's "deadline_ms" """
+        candidates = []
+        remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        if callable(remaining):
+            candidates.append(time.time() + (remaining() - reserve_ms) / 1000)
+        try:
+            if deadline_ms:
+                candidates.append(float(deadline_ms) / 1000)
+        except (TypeError, ValueError):
+            print(f"Ignoring invalid deadline_ms: {deadline_ms}")
+        return cls(min(candidates) if candidates else None)
+
+    def remaining_ms(self):
+        if self.at is None:
+            return math.inf
+        return max(0.0, (self.at - time.time()) * 1000)
+
+    def expired(self):
+        return self.remaining_ms() <= 0
+
+    def timeout(self, seconds):
+        """A network timeout of at most seconds that ends at the deadline"""
+        if self.at is None:
+            return seconds
+        return max(MIN_TIMEOUT_SECONDS, min(seconds, self.remaining_ms() / 1000))
+
+    def child(self, reserve_ms):
+        """The deadline for a downstream call: reserve_ms earlier, so the work after the call
+        still has time, but leaving the call at least half of the time left"""
+        if self.at is None:
+            return Deadline()
+        now = time.time()
+        return Deadline(max(self.at - reserve_ms / 1000, now + (self.at - now) / 2))
+
+    def epoch_ms(self):
+        return None if self.at is None else int(self.at * 1000)
+
+
+# The invocation's deadline, so helpers deep in a handler can size their work without passing it around
+_current_deadline = contextvars.ContextVar('deadline', default=Deadline())
+
+
+def start_deadline(context, deadline_ms=None):
+    """Set the deadline for a new invocation from its Lambda context and an optional caller deadline"""
+    deadline = Deadline.from_context(context, deadline_ms)
+    _current_deadline.set(deadline)
+    return deadline
+
+
+def current_deadline():
+    """The current invocation's deadline (one that never passes outside an invocation)"""
+    return _current_deadline.get()
@@ -5,7 +5,7 @@ Processes JSON requests for 10-K (Annual) and 10-Q (Quarterly) documents.
 This Lambda function integrates perfectly with your existing CIK module:
 - Uses your Lambda 1 S3 data via CIK module's S3 integration
 - Leverages all existing CIK lookup methods (ticker_to_cik, name_to_cik)
-- Utilizes existing filing retrieval methods (annual_filing, quarterly_filing)
+- Utilizes existing filing retrieval methods (period_filing: by fiscal period, with the filing date for filings without a reportDate)
 - Returns filing URL instead of full document content to avoid Lambda size limits
 
 Author: Nathan Asfaw
@@ -13,8 +13,25 @@ Date: 2025-09-27
 """
 
 import json
-from CIK_module import SECEdgar
+from CIK_module import NegativeCache, SECEdgar, company_alias, listing_version, valid_filing_year
+from deadline import start_deadline
+from metrics import start_timings, with_timings
+from profiling import profiled
 
+# Companies that were not in the ticker listing, remembered per container so a retried
+# bad request doesn't load the whole listing again
+_unknown_companies = NegativeCache()
+
+# S3 client for the company listing; None lets SECEdgar create one. Set with set_s3_client()
+# to run against a stand-in such as the in-memory S3 in benchmarks/aws_stubs.py
+_s3_client = None
+
+def set_s3_client(client):
+    """Load the company listing with this S3 client; None restores the default"""
+    global _s3_client
+    _s3_client = client
+
+@profiled('lambda2')
 def lambda_handler(event, context):
     """
     AWS Lambda handler for processing SEC document requests.
@@ -22,7 +39,8 @@ def lambda_handler(event, context):
     This function integrates with your existing CIK module methods:
     1. Uses SECEdgar with S3 integration
     2. Looks up CIK using ticker_to_cik() or name_to_cik() methods
-    3. Gets filing URLs using annual_filing() or quarterly_filing() methods  
+    3. Gets filing URLs by fiscal period with period_filing(), which falls back to the
+       filing-date search only for filings without a reportDate
     4. Returns the filing URL for direct access to SEC documents
     
     Expected JSON input:
@@ -33,30 +51,68 @@ def lambda_handler(event, context):
         "quarter": "Q1" (required only for Quarter requests)
     }
     
-    Returns JSON response with filing URL or error message.
-    """
+    Returns JSON response with filing URL or error message. Every response body has a
+    "timings" block (index load, CIK lookup, filing lookup, submissions fetch, overflow
+    pages) that is also printed as an EMF metrics record, and a "trace" span tree. A
+    "trace": {"trace_id", "parent_span_id"} context from the caller (Lambda 3) joins
+    those spans to the caller's trace. "profile": true profiles the invocation (see profiling.py).
     
+    SEC requests end by the earlier of this Lambda's timeout and the caller's "deadline_ms"
+    (epoch milliseconds); older submissions pages are skipped once it passes.
+    """
+    timings = start_timings('lambda2', event.get('trace'))
+    deadline = start_deadline(context, event.get('deadline_ms'))
+    response = process_request(event, timings, deadline)
+    timings.emit({'Handler': 'lambda2'})
+    return with_timings(response, timings)
+
+def process_request(event, timings, deadline):
+    """Look up the filing URL for a request event, recording stage timings"""
     try:
+        # The caller has already given up on an answer this late
+        if deadline.expired():
+            return {'statusCode': 504, 'body': json.dumps({'error': 'Deadline passed before the lookup started'})}
+        
         # Extract parameters from the incoming JSON event
         request_type = event.get('request_type')  # 'Annual' or 'Quarter'
         company = event.get('company')            # Ticker symbol or company name
         year = int(event.get('year'))             # Filing year as integer
+        if not valid_filing_year(year):
+            return {'statusCode': 400, 'body': json.dumps({'error': f'Invalid year: {year}'})}
+        
+        # A company that was just looked up and not found is answered without loading the listing,
+        # as long as the listing in S3 is still the version it was missing from (a HEAD request)
+        company_key = ('company', company_alias(str(company)) or str(company).lower())
+        if _unknown_companies.contains(company_key):
+            version = listing_version(_s3_client)
+            if version is not None and _unknown_companies.contains(company_key, version):
+                print(f"Company {company} not found (cached miss)")
+                return {'statusCode': 404, 'body': json.dumps({'error': f'Company {company} not found'})}
         
         # Initialize CIK module with S3 integration
         # Uses Lambda 1's daily SEC data from S3 bucket
-        sec_edgar = SECEdgar(use_s3=True)
+        sec_edgar = SECEdgar(use_s3=True, s3_client=_s3_client, deadline=deadline.at)
+        # The listing load and SEC requests are timed by SECEdgar itself
+        timings.include(sec_edgar.stats, sec_edgar.spans)
+        # Misses recorded against an older listing may have been added since
+        _unknown_companies.discard_stale('company', sec_edgar.listing_fingerprint)
         
         # Look up CIK using your existing methods
         # Try ticker first (AAPL), then company name (Apple Inc.)
-        cik = sec_edgar.ticker_to_cik(company) or sec_edgar.name_to_cik(company)
+        with timings.stage('cik_lookup'):
+            cik = sec_edgar.ticker_to_cik(company) or sec_edgar.name_to_cik(company)
         if not cik:
+            _unknown_companies.add(company_key, sec_edgar.listing_fingerprint)
             return {'statusCode': 404, 'body': json.dumps({'error': f'Company {company} not found'})}
         
         # Get SEC filing URL using your existing methods
         if request_type == 'Annual':
-            # Use your annual_filing method to get 10-K URL
-            filing_url = sec_edgar.annual_filing(cik, year)
-            document_type = '10-K'
+            # Look the 10-K up by fiscal year. Only filings without a reportDate fall back to the
+            # filing-date search, over the submissions pages the fiscal lookup already read
+            with timings.stage('filing_lookup'):
+                response_json = sec_edgar.fetch_company_json(cik)
+                found = sec_edgar.period_filing(cik, year, None, response_json) if response_json is not None else None
+            filing_url, document_type = found or (None, '10-K')
         elif request_type == 'Quarter':
             # Check if quarter is provided for quarterly requests
             quarter_input = event.get('quarter')
@@ -80,12 +136,19 @@ def lambda_handler(event, context):
                     'body': json.dumps({'error': 'Invalid quarter format'})
                 }
                 
-            filing_url = sec_edgar.quarterly_filing(cik, year, quarter)
-            document_type = '10-Q'
+            # The fiscal period index maps (fiscal year, quarter) to one filing; Q4 is the 10-K
+            with timings.stage('filing_lookup'):
+                response_json = sec_edgar.fetch_company_json(cik)
+                found = sec_edgar.period_filing(cik, year, quarter, response_json) if response_json is not None else None
+            filing_url, document_type = found or (None, '10-Q')
         else:
             return {'statusCode': 400, 'body': json.dumps({'error': 'Invalid request_type'})}
         
-        # Check if filing URL was found
+        # Check if filing URL was found (a search cut short by the deadline isn't a miss)
+        if not filing_url and sec_edgar.deadline_passed():
+            return {'statusCode': 504, 'body': json.dumps({'error': f'Deadline passed while searching for the {document_type}'})}
+        if response_json is None:
+            return {'statusCode': 502, 'body': json.dumps({'error': 'Could not fetch SEC submissions'})}
         if not filing_url:
             return {'statusCode': 404, 'body': json.dumps({'error': f'No {document_type} found'})}
         
@@ -13,9 +13,13 @@ This test validates:
 import json
 import sys
 import os
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
 
 # Add parent directory to path to import Lambda 2
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lambda2_module import lambda_2
 from lambda2_module.lambda_2 import lambda_handler
 
 def test_lambda_2_integration():
@@ -68,5 +72,162 @@ def test_lambda_2_integration():
     print("✅ Perfect S3 integration from Lambda 1")
     print("✅ Super simple and clean code")
 
+def test_unknown_company_skips_listing_reload():
+    """A company that was just not found is answered without loading the listing again."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[], ticker_to_cik=lambda c: None, name_to_cik=lambda c: None)
+    event = {"request_type": "Annual", "company": "Nonexistent Corp", "year": "2023"}
+
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing) as mock_edgar, \
+            patch.object(lambda_2, 'listing_version', return_value='listing-1') as version:
+        assert lambda_handler(event, None)['statusCode'] == 404
+        assert lambda_handler(dict(event, company="NONEXISTENT"), None)['statusCode'] == 404
+        assert mock_edgar.call_count == 1
+        # Only the cached miss checks the listing version
+        assert version.call_count == 1
+
+        # A new listing drops misses recorded against the old one
+        listing.listing_fingerprint = 'listing-2'
+        lambda_handler(dict(event, company="Other Unknown"), None)
+        assert not lambda_2._unknown_companies.contains(('company', 'nonexistent'))
+    lambda_2._unknown_companies.clear()
+
+def test_unknown_company_rechecked_when_listing_changes():
+    """A cached miss isn't served once the listing in S3 has changed, even before another load."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[], ticker_to_cik=lambda c: None, name_to_cik=lambda c: None)
+    event = {"request_type": "Annual", "company": "NEWCO", "year": "2023"}
+
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing) as mock_edgar, \
+            patch.object(lambda_2, 'listing_version', return_value='listing-1') as version:
+        assert lambda_handler(event, None)['statusCode'] == 404
+        # The company was added to the listing; the next request loads it again and finds it
+        version.return_value = 'listing-2'
+        listing.listing_fingerprint = 'listing-2'
+        listing.ticker_to_cik = lambda c: None if c != 'NEWCO' else '1'
+        listing.fetch_company_json = lambda cik: None
+        listing.deadline_passed = lambda: False
+        assert lambda_handler(event, None)['statusCode'] == 502
+        assert mock_edgar.call_count == 2
+        # Without a version to check against, the miss isn't trusted either
+        version.return_value = None
+        lambda_2._unknown_companies.add(('company', 'newco'), 'listing-2')
+        lambda_handler(event, None)
+        assert mock_edgar.call_count == 3
+    lambda_2._unknown_companies.clear()
+
+def test_fiscal_period_lookup():
+    """Filings are found by fiscal period with the submissions fetched once; Q4 may be the 10-K."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[], deadline_passed=lambda: False,
+                              ticker_to_cik=lambda c: '320193', name_to_cik=lambda c: None)
+    submissions = {'filings': {}}
+    fetched = []
+    listing.fetch_company_json = lambda cik: fetched.append(cik) or submissions
+
+    def period_filing(cik, year, quarter, response_json):
+        assert response_json is submissions
+        if year < 2010:
+            return (f"legacy/{year}/{quarter}", '10-Q') if quarter else None
+        return f"fiscal/{year}/{quarter}", '10-K' if quarter in (None, 4) else '10-Q'
+    listing.period_filing = period_filing
+
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing):
+        q4 = json.loads(lambda_handler({"request_type": "Quarter", "company": "AAPL", "year": "2023", "quarter": "Q4"}, None)['body'])
+        old_q = json.loads(lambda_handler({"request_type": "Quarter", "company": "AAPL", "year": "2005", "quarter": "4"}, None)['body'])
+        missing = lambda_handler({"request_type": "Annual", "company": "AAPL", "year": "2005"}, None)
+
+    assert (q4['filing_url'], q4['document_type']) == ("fiscal/2023/4", '10-K')
+    assert (old_q['filing_url'], old_q['document_type']) == ("legacy/2005/4", '10-Q')
+    assert (missing['statusCode'], json.loads(missing['body'])['error']) == (404, 'No 10-K found')
+    assert len(fetched) == 3
+
+def test_invalid_year_is_rejected_before_lookup():
+    """A year no filing can have is a 400 without loading the listing."""
+    with patch.object(lambda_2, 'SECEdgar') as mock_edgar:
+        for year in ("1850", "9999"):
+            result = lambda_handler({"request_type": "Annual", "company": "AAPL", "year": year}, None)
+            assert result['statusCode'] == 400
+    assert mock_edgar.call_count == 0
+
+def test_injected_s3_client():
+    """An S3 client set with set_s3_client is handed to SECEdgar for the listing."""
+    lambda_2._unknown_companies.clear()
+    stand_in = object()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[], ticker_to_cik=lambda c: None, name_to_cik=lambda c: None)
+    lambda_2.set_s3_client(stand_in)
+    try:
+        with patch.object(lambda_2, 'SECEdgar', return_value=listing) as mock_edgar:
+            lambda_handler({"request_type": "Annual", "company": "Nonexistent Corp", "year": "2023"}, None)
+        assert mock_edgar.call_args.kwargs == {'use_s3': True, 's3_client': stand_in, 'deadline': None}
+    finally:
+        lambda_2.set_s3_client(None)
+        lambda_2._unknown_companies.clear()
+
+def test_response_timings():
+    """Responses carry a timings block with the lookup stages and SECEdgar's own stats."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={'index_load_ms': 3.0, 'overflow_pages': 1}, spans=[],
+                              ticker_to_cik=lambda c: '320193', name_to_cik=lambda c: None)
+    listing.fetch_company_json = lambda cik: {}
+    listing.period_filing = lambda cik, year, quarter, response_json: (f"fiscal/{year}/{quarter}", '10-K')
+
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing):
+        body = json.loads(lambda_handler({"request_type": "Annual", "company": "AAPL", "year": "2023"}, None)['body'])
+
+    timings = body['timings']
+    assert timings['index_load_ms'] == 3.0
+    assert timings['overflow_pages'] == 1
+    assert 'cik_lookup_ms' in timings and 'total_ms' in timings
+    lambda_2._unknown_companies.clear()
+
+def test_trace_context_joins_caller():
+    """A trace context in the event parents Lambda 2's spans, including SECEdgar's, to the caller's span."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[],
+                              ticker_to_cik=lambda c: '320193', name_to_cik=lambda c: None)
+
+    listing.fetch_company_json = lambda cik: {}
+
+    def period_filing(cik, year, quarter, response_json):
+        listing.spans.append(('submissions_fetch', time.perf_counter(), time.perf_counter()))
+        return f"fiscal/{year}/{quarter}", '10-K'
+    listing.period_filing = period_filing
+
+    event = {"request_type": "Annual", "company": "AAPL", "year": "2023",
+             "trace": {"trace_id": "c" * 32, "parent_span_id": "lambda3-invoke"}}
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing):
+        trace = json.loads(lambda_handler(event, None)['body'])['trace']
+
+    assert (trace['name'], trace['trace_id'], trace['parent_id']) == ('lambda2', "c" * 32, "lambda3-invoke")
+    lookup = [span for span in trace['children'] if span['name'] == 'filing_lookup'][0]
+    assert [span['name'] for span in lookup['children']] == ['submissions_fetch']
+    lambda_2._unknown_companies.clear()
+
+def test_deadline_from_caller_and_context():
+    """The caller's deadline_ms or the Lambda's own time left bounds the SEC lookups."""
+    lambda_2._unknown_companies.clear()
+    listing = SimpleNamespace(listing_fingerprint='listing-1', stats={}, spans=[], deadline_passed=lambda: True,
+                              ticker_to_cik=lambda c: '320193', name_to_cik=lambda c: None)
+    listing.fetch_company_json = lambda cik: {}
+    listing.period_filing = lambda cik, year, quarter, response_json: None
+    event = {"request_type": "Annual", "company": "AAPL", "year": "2023"}
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 20000)
+
+    with patch.object(lambda_2, 'SECEdgar', return_value=listing) as mock_edgar:
+        # Already past the caller's deadline: answered without loading the listing
+        late = dict(event, deadline_ms=int((time.time() - 1) * 1000))
+        assert lambda_handler(late, context)['statusCode'] == 504
+        assert mock_edgar.call_count == 0
+
+        # A search cut short by the deadline is a 504, not a 404
+        soon = dict(event, deadline_ms=int((time.time() + 5) * 1000))
+        assert lambda_handler(soon, context)['statusCode'] == 504
+        deadline = mock_edgar.call_args.kwargs['deadline']
+        assert 4 < deadline - time.time() <= 5
+        lambda_handler(event, context)
+        assert 19 < mock_edgar.call_args.kwargs['deadline'] - time.time() <= 20
+    lambda_2._unknown_companies.clear()
+
 if __name__ == "__main__":
     test_lambda_2_integration()
\ No newline at end of file
@@ -0,0 +1,266 @@
+# answer_cache.py - Reuse answers to repeated questions about the same filing
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+
+import boto3
+
+from CIK_module import company_words
+from metrics import emit_metrics
+
+# Backend is one of "memory" (per container), "tmp" (survives handler restarts in a
+# warm container), "s3" (shared by every container) or "off"
+ANSWER_CACHE_BACKEND = os.environ.get('ANSWER_CACHE_BACKEND', 'memory')
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 24 * 60 * 60))
+ANSWER_CACHE_DIR = os.environ.get('ANSWER_CACHE_DIR', '/tmp/answer_cache')
+ANSWER_CACHE_BUCKET = os.environ.get('ANSWER_CACHE_BUCKET', 'nathanasfaw-sec-edgar-files')
+ANSWER_CACHE_PREFIX = os.environ.get('ANSWER_CACHE_PREFIX', 'answer-cache/')
+MEMORY_CACHE_SIZE = 512
+
+# Lambda 2 answers (company, year, filing type, quarter) with the same URL until a new filing lands
+FILING_URL_TTL_SECONDS = 6 * 60 * 60
+
+YEAR_PATTERN = re.compile(r"^(?:19|20)\d{2}$")
+
+# Filler words dropped from cache keys. Far smaller than retrieval's stop list, which drops
+# interrogatives and negations that change what a question asks ("why" vs "what", "not")
+QUESTION_STOP_WORDS = frozenset("""
+a an the of in on at to for by from with and or is are was were be been its it this that their please
+""".split())
+
+
+class CompanyNames:
+    """Company names and tickers found in questions, built from an SECEdgar index"""
+
+    def __init__(self, sec_edgar):
+        # The index's own matcher, over the alias index it already holds
+        self.matcher = sec_edgar.company_matcher()
+
+    def replace(self, words):
+        """Return (ciks, remaining words) with the longest company mentions taken out"""
+        return self.matcher.replace(words)
+
+    def find(self, question):
+        """Company mentions in the question text, in order"""
+        return self.matcher.find(question)
+
+
+def normalize_question(question, companies=None):
+    """Reduce a question to a canonical form: lowercase words without punctuation or stop
+    words, company names and tickers replaced by CIKs, and years listed separately"""
+    words = company_words(question)
+    years = sorted({word for word in words if YEAR_PATTERN.match(word)})
+    words = [word for word in words if not YEAR_PATTERN.match(word)]
+    ciks = set()
+    if companies is not None:
+        ciks, words = companies.replace(words)
+    words = [word for word in words if word not in QUESTION_STOP_WORDS]
+    parts = [' '.join(words)]
+    parts += [f"cik:{cik}" for cik in sorted(ciks)]
+    parts += [f"fy:{year}" for year in years]
+    return '|'.join(parts)
+
+
+def answer_key(normalized_question, accession, model_id, context_strategy=None, max_tokens=None):
+    """Cache key for one answer: the same question about the same filing from the same model,
+    given the same kind of context (retrieval or cached_prefix) and answer length (max_tokens)"""
+    raw = f"{accession}\n{model_id}\n{context_strategy}\n{max_tokens}\n{normalized_question}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """Least recently used entries held in the Lambda container"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=MEMORY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class TmpBackend:
+    """One JSON file per entry under /tmp, the only writable path in Lambda"""
+
+    name = 'tmp'
+
+    def __init__(self, directory=ANSWER_CACHE_DIR):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading answer cache file: {e}")
+            return None
+
+    def put(self, key, entry):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write a file unique to this writer, then rename it, so a concurrent reader
+            # never sees half a file and concurrent writers (threads too) never share one
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.directory,
+                                             suffix='.part', delete=False) as f:
+                partial = f.name
+                json.dump(entry, f)
+            os.replace(partial, self._path(key))
+        except Exception as e:
+            print(f"Error writing answer cache file: {e}")
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.json'):
+                    os.remove(os.path.join(self.directory, filename))
+
+
+class S3Backend:
+    """Entries stored as S3 objects so every Lambda container shares them"""
+
+    name = 's3'
+
+    def __init__(self, bucket=ANSWER_CACHE_BUCKET, prefix=ANSWER_CACHE_PREFIX, s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = s3_client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client('s3')
+        return self._client
+
+    def get(self, key):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+            return json.loads(response['Body'].read())
+        except Exception as e:
+            # NoSuchKey is the normal miss; anything else is logged but never fails the request
+            if 'NoSuchKey' not in str(e):
+                print(f"Error reading answer cache from S3: {e}")
+            return None
+
+    def put(self, key, entry):
+        try:
+            self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json",
+                                   Body=json.dumps(entry).encode('utf-8'), ContentType='application/json')
+        except Exception as e:
+            print(f"Error writing answer cache to S3: {e}")
+
+    def delete(self, key):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+        except Exception as e:
+            print(f"Error deleting answer cache entry from S3: {e}")
+
+    def clear(self):
+        # Shared entries are left to expire (or to an S3 lifecycle rule)
+        pass
+
+
+BACKENDS = {'memory': MemoryBackend, 'tmp': TmpBackend, 's3': S3Backend}
+
+
+class AnswerCache:
+    """TTL answer cache over a pluggable backend, reporting its hit rate as EMF metrics"""
+
+    def __init__(self, backend, ttl_seconds=ANSWER_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key):
+        """Return the cached entry for a key, or None if it is missing or expired"""
+        entry = self.backend.get(key)
+        if entry is not None and entry.get('expires_at', 0) <= time.time():
+            self.backend.delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        emit_metrics({
+            'AnswerCacheHit': (1 if entry is not None else 0, 'Count'),
+            'AnswerCacheHitRate': (round(self.hit_rate * 100, 1), 'Percent'),
+        }, {'Backend': self.backend.name})
+        return entry
+
+    def put(self, key, entry):
+        now = time.time()
+        self.backend.put(key, dict(entry, cached_at=now, expires_at=now + self.ttl_seconds))
+
+
+def create_answer_cache(backend=ANSWER_CACHE_BACKEND):
+    """Build the cache selected by ANSWER_CACHE_BACKEND; None when caching is off"""
+    backend_class = BACKENDS.get(backend)
+    if backend_class is None:
+        return None
+    return AnswerCache(backend_class())
+
+
+_answer_cache = create_answer_cache()
+_filing_urls = MemoryBackend()
+
+
+def get_answer_cache():
+    return _answer_cache
+
+
+def recall_filing_url(company, year, filing_type, quarter):
+    """Return the filing URL Lambda 2 gave for this request earlier, if still fresh"""
+    entry = _filing_urls.get((company.lower(), int(year), filing_type, quarter))
+    if entry is None or entry[0] <= time.time():
+        return None
+    return entry[1]
+
+
+def remember_filing_url(company, year, filing_type, quarter, filing_url):
+    _filing_urls.put((company.lower(), int(year), filing_type, quarter),
+                     (time.time() + FILING_URL_TTL_SECONDS, filing_url))
+
+
+def clear_answer_cache():
+    """Forget cached answers and filing URLs held in memory and reset the hit counters"""
+    _filing_urls.clear()
+    if _answer_cache is not None:
+        _answer_cache.backend.clear()
+        _answer_cache.hits = _answer_cache.misses = 0
@@ -0,0 +1,22 @@
+# conftest.py - Shared test setup for Lambda 3
+import sys
+import os
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import answer_cache
+import retrieval
+import token_budget
+import xbrl_facts
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test without the indexes, facts, answers, filing URLs or token calibration of earlier ones"""
+    retrieval.clear_index_cache()
+    xbrl_facts.clear_fact_cache()
+    answer_cache.clear_answer_cache()
+    token_budget.reset_calibration()
+    yield
@@ -1,37 +1,101 @@
 # lambda_3.py - Simplified SEC Question Answering Lambda with Claude Sonnet 4
+import contextvars
 import json
+import re
+import threading
+import time
+import os
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 import requests
+from botocore.config import Config
 from bs4 import BeautifulSoup
 
-def determine_filing_type(question):
+import answer_cache
+import model_router
+import question_parser
+import retrieval
+import table_compaction
+import token_budget
+import xbrl_facts
+from CIK_module import SECEdgar, sec_url
+from deadline import current_deadline, start_deadline
+from metrics import (TRACE_EXPORT_DIR, count, current_timings, emit_metrics, export_trace, start_timings,
+                     timed, with_timings)
+from profiling import profiled
+
+# Defaults; model_router.py picks the model and max_tokens for each question
+MODEL_ID = model_router.SONNET
+MAX_TOKENS = 3000
+
+# How the filing context is chosen: "retrieval" sends the passages most relevant to each
+# question; "cached_prefix" sends the same leading part of the filing for every question
+# so Bedrock prompt caching can reuse it across questions about one filing
+CONTEXT_STRATEGY = os.environ.get('CONTEXT_STRATEGY', 'retrieval')
+# The cached prefix must not vary by question, so it always gets the largest tier
+CACHED_PREFIX_TIER = 'thorough'
+
+# Legacy cut-off used when callers ask download_sec_document for truncated text
+MAX_DOCUMENT_CHARS = 100000
+
+# Time budget (see deadline.py): Lambda 2 must answer this long before our deadline so the
+# download and Bedrock call still have time; network calls never wait past the deadline
+LAMBDA2_DEADLINE_RESERVE_MS = int(os.environ.get('LAMBDA2_DEADLINE_RESERVE_MS', 10000))
+SEC_DOCUMENT_TIMEOUT_SECONDS = 30
+LAMBDA2_READ_TIMEOUT_SECONDS = 60
+BEDROCK_READ_TIMEOUT_SECONDS = 60
+# Filing passages returned in place of an answer when there is no time left to ask Claude
+PARTIAL_ANSWER_TOKENS = 400
+
+# Batch requests ("questions": [...]) share one filing; "concurrent" asks Bedrock once per
+# question in parallel, "single_call" asks every question in one structured prompt
+BATCH_MAX_QUESTIONS = 25
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 8))
+BATCH_MODE = os.environ.get('BATCH_MODE', 'concurrent')
+
+ACCESSION_PATTERN = re.compile(r'/Archives/edgar/data/\d+/(\d{18})/')
+
+# Company names and tickers used to canonicalize questions for the answer cache;
+# loaded once per container, and retried after a while if the load fails
+COMPANY_INDEX_RETRY_SECONDS = 300
+_company_names = None
+_company_names_failed_at = None
+
+# Builds the AWS clients (Lambda, Bedrock, API Gateway); None means boto3.client.
+# Set with set_client_factory() to run the handler against stand-ins such as benchmarks/aws_stubs.py
+_client_factory = None
+# boto3's default session isn't safe to build clients from on several threads at once
+_client_lock = threading.Lock()
+
+def aws_client(service_name, **kwargs):
+    """Create an AWS client through the configured factory"""
+    with _client_lock:
+        return (_client_factory or boto3.client)(service_name, **kwargs)
+
+def set_client_factory(factory):
+    """Use factory(service_name, **kwargs) for every AWS client; None restores boto3.client"""
+    global _client_factory
+    _client_factory = factory
+
+def deadline_client(service_name, read_timeout):
+    """An AWS client whose calls give up at the invocation's deadline instead of retrying past it"""
+    deadline = current_deadline()
+    if deadline.at is None:
+        return aws_client(service_name)
+    config = Config(read_timeout=deadline.timeout(read_timeout), retries={'total_max_attempts': 1})
+    return aws_client(service_name, config=config)
+
+def determine_filing_type(question, intent=None):
     """Analyze question to determine if it needs annual or quarterly data"""
-    question_lower = question.lower()
-    
-    # Check for specific quarters
-    if 'q1' in question_lower or 'first quarter' in question_lower:
-        return "Quarter", "1"
-    elif 'q2' in question_lower or 'second quarter' in question_lower:
-        return "Quarter", "2"
-    elif 'q3' in question_lower or 'third quarter' in question_lower:
-        return "Quarter", "3"
-    elif 'q4' in question_lower or 'fourth quarter' in question_lower:
-        return "Quarter", "4"
-    
-    # Check for quarterly keywords
-    quarterly_keywords = ['quarter', 'quarterly', 'q1', 'q2', 'q3', 'q4', '10-q']
-    if any(keyword in question_lower for keyword in quarterly_keywords):
-        return "Quarter", "1"  # Default to Q1
-    
-    # Default to annual
-    return "Annual", None
-
-def get_sec_document_url(company, year, question):
+    intent = intent or question_parser.parse_question(question)
+    return intent.filing_type, intent.quarter
+
+def get_sec_document_url(company, year, question, intent=None):
     """Get SEC document URL using Lambda 2"""
-    filing_type, quarter = determine_filing_type(question)
+    filing_type, quarter = determine_filing_type(question, intent)
     print(f"📋 DEBUG: Detected filing type: {filing_type}, quarter: {quarter}")  # ADD THIS LINE
 
-    lambda_client = boto3.client('lambda')
+    lambda_client = deadline_client('lambda', LAMBDA2_READ_TIMEOUT_SECONDS)
     lambda2_request = {
         "request_type": filing_type,
         "company": company,
@@ -41,6 +105,15 @@ def get_sec_document_url(company, year, question):
     if filing_type == "Quarter" and quarter:
         lambda2_request["quarter"] = quarter
     
+    # Lambda 2's spans join this question's trace, under the stage making the call
+    timings = current_timings()
+    if timings is not None:
+        lambda2_request["trace"] = timings.trace_context()
+    # Lambda 2 stops its SEC requests in time to leave us the download and Bedrock call
+    deadline_ms = current_deadline().child(LAMBDA2_DEADLINE_RESERVE_MS).epoch_ms()
+    if deadline_ms is not None:
+        lambda2_request["deadline_ms"] = deadline_ms
+    
     print(f"📤 DEBUG: Sending to Lambda 2: {lambda2_request}")  # ADD THIS LINE
 
     try:
@@ -52,8 +125,14 @@ def get_sec_document_url(company, year, question):
         result = json.loads(response['Payload'].read())
         print(f"📥 DEBUG: Lambda 2 response: {result}")  # ADD THIS LINE
         
+        body = json.loads(result.get('body') or '{}')
+        # Lambda 2 reports its own stages and spans; keep them with this invocation's timings
+        if timings is not None:
+            if body.get('timings'):
+                timings.nested['lambda2'] = body['timings']
+            timings.graft(body.get('trace'))
+        
         if result['statusCode'] == 200:
-            body = json.loads(result['body'])
             print(f"✅ DEBUG: Extracted filing URL: {body['filing_url']}")  # ADD THIS
             return body['filing_url']
         print(f"❌ DEBUG: Lambda 2 returned status: {result['statusCode']}")  # ADD THIS
@@ -63,79 +142,809 @@ def get_sec_document_url(company, year, question):
         print(f"Error calling Lambda 2: {e}")
         return None
 
-def download_sec_document(filing_url):
-    """Download and clean SEC document"""
+def company_names():
+    """Return the SECEdgar name/ticker index for question normalization and company lookup, or None if unavailable"""
+    global _company_names, _company_names_failed_at
+    if _company_names is not None:
+        return _company_names
+    if _company_names_failed_at is not None and time.time() - _company_names_failed_at < COMPANY_INDEX_RETRY_SECONDS:
+        return None
+    try:
+        # SECEdgar picks its own S3 credentials unless a client factory was injected
+        s3_client = aws_client('s3') if _client_factory else None
+        _company_names = answer_cache.CompanyNames(SECEdgar(use_s3=True, s3_client=s3_client))
+    except Exception as e:
+        print(f"Error loading company index, caching without name canonicalization: {e}")
+        _company_names_failed_at = time.time()
+    return _company_names
+
+def company_from_question(question):
+    """Return the ticker of the first company named in the question, or None"""
+    names = company_names()
+    if names is None:
+        return None
+    mentions = names.find(question)
+    if not mentions:
+        return None
+    mention = mentions[0]
+    print(f"🏢 DEBUG: Found company in question: '{mention.text}' -> {mention.ticker or mention.cik}")
+    return mention.ticker or mention.text
+
+def accession_from_url(filing_url):
+    """Extract the accession number from an EDGAR archive URL (falls back to the URL)"""
+    match = ACCESSION_PATTERN.search(filing_url or '')
+    return match.group(1) if match else filing_url
+
+def html_to_text(soup, compact_tables=True):
+    """Flatten a parsed filing to text, keeping financial tables as compact tab-separated rows"""
+    # ix:header holds the hidden XBRL contexts, which are noise in the text
+    for element in soup(['script', 'style', 'nav', 'header', 'footer', 'ix:header']):
+        element.decompose()
+    
+    tables = table_compaction.replace_tables(soup) if compact_tables else []
+    clean_text = ' '.join(soup.get_text().split())
+    if tables:
+        clean_text = table_compaction.restore_tables(clean_text, tables)
+    return clean_text
+
+def download_sec_document(filing_url, max_chars=MAX_DOCUMENT_CHARS, base_url=None):
+    """Download and clean SEC document (pass max_chars=None for the full text).
+    
+    base_url (or SEC_EDGAR_BASE_URL) fetches the document from a stand-in for sec.gov,
+    such as the local replay server; the filing URL itself is unchanged.
+    """
     try:
         headers = {'User-Agent': 'nathanrasfaw@gmail.com SEC Analysis'}
-        response = requests.get(filing_url, headers=headers, timeout=30)
+        with timed('document_download'):
+            timeout = current_deadline().timeout(SEC_DOCUMENT_TIMEOUT_SECONDS)
+            response = requests.get(sec_url(filing_url, base_url), headers=headers, timeout=timeout)
         
         if response.status_code != 200:
             return None
+        count('document_bytes', len(response.content), 'Bytes')
         
-        # Convert HTML to clean text
-        soup = BeautifulSoup(response.content, 'html.parser')
-        for element in soup(['script', 'style', 'nav', 'header', 'footer']):
-            element.remove()
-        
-        text = soup.get_text()
-        clean_text = ' '.join(text.split())
+        with timed('extraction'):
+            # Convert HTML to clean text
+            soup = BeautifulSoup(response.content, 'html.parser')
+            
+            # Pull the tagged inline XBRL facts out of the same parse before the text is flattened
+            xbrl_facts.cache_facts(accession_from_url(filing_url), xbrl_facts.extract_facts(soup))
+            
+            clean_text = html_to_text(soup)
         
-        # Increase size limit to capture financial statements
-        return clean_text[:100000] if len(clean_text) > 100000 else clean_text  # Increased from 40000
+        if max_chars is not None and len(clean_text) > max_chars:
+            return clean_text[:max_chars]
+        return clean_text
         
     except Exception as e:
         print(f"Error downloading document: {e}")
         return None
 
-def ask_claude_question(question, document_text, company, year, filing_type, quarter=None):
-    """Ask Claude 3.5 Sonnet to answer the question using the SEC document"""
+def build_claude_request(question, document_text, company, year, filing_type, quarter=None, cache_prefix=False, max_tokens=MAX_TOKENS):
+    """
+    Build the Bedrock messages request body shared by buffered and streaming calls.
+    
+    The prompt is split into a stable prefix (system prompt + filing text) and a
+    question suffix. With cache_prefix the filing block is marked for Bedrock
+    prompt caching, so later questions about the same filing reuse it.
+    """
+    # Create filing description
+    filing_desc = f"{filing_type} filing"
+    if filing_type == "Quarter" and quarter:
+        filing_desc = f"Q{quarter} quarterly (10-Q) filing"
+    elif filing_type == "Annual":
+        filing_desc = "annual (10-K) filing"
+    
+    document_block = {
+        "type": "text",
+        "text": f"SEC Document excerpts:\n{document_text}"
+    }
+    if cache_prefix:
+        document_block["cache_control"] = {"type": "ephemeral"}
+    
+    # Modern Claude 3.5 Sonnet request format (messages API)
+    return {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens,
+        "temperature": 0.1,
+        "system": f"You are a financial analyst. Answer questions about {company} ({year}) based on their {filing_desc}.",
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    document_block,
+                    {
+                        "type": "text",
+                        "text": f"Question: {question}\n\nAnswer based only on the document provided. Be specific and cite relevant details."
+                    }
+                ]
+            }
+        ]
+    }
+
+def prompt_text(request_body):
+    """All the prompt text in a Bedrock request body, for token estimates"""
+    parts = [request_body.get('system', '')]
+    for message in request_body.get('messages', []):
+        parts.extend(block.get('text', '') for block in message.get('content', []))
+    return '\n'.join(parts)
+
+def record_usage(usage, request_body=None, model_id=MODEL_ID):
+    """Emit token usage, including prompt cache reads and writes, as EMF metrics.
+    
+    With the request body, the reported prompt size also calibrates the local token estimator.
+    """
+    metrics = {
+        name: (usage[key], 'Count') for key, name in (
+            ('input_tokens', 'InputTokens'),
+            ('output_tokens', 'OutputTokens'),
+            ('cache_read_input_tokens', 'PromptCacheReadTokens'),
+            ('cache_creation_input_tokens', 'PromptCacheWriteTokens'),
+        ) if usage.get(key) is not None
+    }
+    emit_metrics(metrics, {'Model': model_id})
+    for key in ('input_tokens', 'output_tokens'):
+        if usage.get(key) is not None:
+            count(key, usage[key])
+    if request_body is not None:
+        prompt_tokens = sum(usage.get(key) or 0 for key in (
+            'input_tokens', 'cache_read_input_tokens', 'cache_creation_input_tokens'))
+        token_budget.calibrate(prompt_text(request_body), prompt_tokens)
+
+def ask_claude_question(question, document_text, company, year, filing_type, quarter=None, cache_prefix=False,
+                        max_tokens=MAX_TOKENS, model_id=MODEL_ID, usage=None, bedrock=None):
+    """Ask Claude to answer the question using the SEC document (usage dict receives token counts)"""
     try:
-        bedrock = boto3.client('bedrock-runtime')
-        
-        # Create filing description
-        filing_desc = f"{filing_type} filing"
-        if filing_type == "Quarter" and quarter:
-            filing_desc = f"Q{quarter} quarterly (10-Q) filing"
-        elif filing_type == "Annual":
-            filing_desc = "annual (10-K) filing"
+        bedrock = bedrock or deadline_client('bedrock-runtime', BEDROCK_READ_TIMEOUT_SECONDS)
+        request_body = build_claude_request(question, document_text, company, year, filing_type, quarter, cache_prefix, max_tokens)
+
+        with timed('bedrock'):
+            response = bedrock.invoke_model(
+                modelId=model_id,
+                body=json.dumps(request_body),
+                contentType='application/json'
+            )
+            response_body = json.loads(response['body'].read())
+        if usage is not None:
+            usage.update(response_body.get('usage', {}))
+        record_usage(response_body.get('usage', {}), request_body, model_id)
+        return response_body['content'][0]['text']
         
-        # Modern Claude 3.5 Sonnet format (messages API)
-        prompt = f"""You are a financial analyst. Answer this question about {company} ({year}) based on their {filing_desc}:
-
-Question: {question}
-
-SEC Document:
-{document_text}
-
-Answer based only on the document provided. Be specific and cite relevant details."""
-
-        # Modern Claude 3.5 Sonnet request format
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 3000,
-            "temperature": 0.1,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        }
+    except Exception as e:
+        print(f"Error asking Claude: {e}")
+        return f"Sorry, I couldn't process your question. Error: {e}"
 
-        # Use Claude 3.5 Sonnet (modern, non-legacy)
-        response = bedrock.invoke_model(
-            modelId="us.anthropic.claude-3-5-sonnet-20241022-v2:0",
+def stream_claude_answer(question, document_text, company, year, filing_type, quarter=None, cache_prefix=False,
+                         max_tokens=MAX_TOKENS, model_id=MODEL_ID, stats=None):
+    """Stream Claude's answer chunk by chunk with invoke_model_with_response_stream.
+
+    Yields text as it arrives. If a stats dict is passed it is filled with
+    time_to_first_token_ms, output_tokens, tokens_per_second and total_ms, plus
+    the input and prompt cache token counts. At the invocation's deadline the stream
+    is cut short, keeping what has arrived, and stats['deadline_truncated'] is set;
+    stats['completed'] is only set once Claude's message_stop arrives.
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    first_token_at = None
+    request_body = None
+    try:
+        bedrock = deadline_client('bedrock-runtime', BEDROCK_READ_TIMEOUT_SECONDS)
+        request_body = build_claude_request(question, document_text, company, year, filing_type, quarter, cache_prefix, max_tokens)
+        deadline = current_deadline()
+        response = bedrock.invoke_model_with_response_stream(
+            modelId=model_id,
             body=json.dumps(request_body),
             contentType='application/json'
         )
         
-        response_body = json.loads(response['body'].read())
-        return response_body['content'][0]['text']
-        
+        for event in response['body']:
+            if deadline.expired():
+                stats['deadline_truncated'] = True
+                yield "\n\n[Answer cut short: the request ran out of time]"
+                break
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            message = json.loads(chunk['bytes'])
+            if message.get('type') == 'message_start':
+                stats.update(message.get('message', {}).get('usage', {}))
+            elif message.get('type') == 'content_block_delta':
+                text = message.get('delta', {}).get('text', '')
+                if text:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        stats['time_to_first_token_ms'] = round((first_token_at - start) * 1000, 1)
+                    yield text
+            elif message.get('type') == 'message_delta':
+                stats['output_tokens'] = message.get('usage', {}).get('output_tokens')
+            elif message.get('type') == 'message_stop':
+                stats['completed'] = True
+                
     except Exception as e:
-        print(f"Error asking Claude: {e}")
-        return f"Sorry, I couldn't process your question. Error: {e}"
+        print(f"Error streaming from Claude: {e}")
+        stats['completed'] = False
+        yield f"Sorry, I couldn't process your question. Error: {e}"
+        
+    end = time.perf_counter()
+    stats['total_ms'] = round((end - start) * 1000, 1)
+    timings = current_timings()
+    if timings is not None:
+        timings.add_ms('bedrock', stats['total_ms'])
+        if stats.get('time_to_first_token_ms') is not None:
+            timings.add_ms('bedrock_first_token', stats['time_to_first_token_ms'])
+    record_usage(stats, request_body, model_id)
+    if first_token_at is not None and stats.get('output_tokens') and end > first_token_at:
+        stats['tokens_per_second'] = round(stats['output_tokens'] / (end - first_token_at), 1)
+    emit_metrics({
+        name: (stats[key], unit) for key, name, unit in (
+            ('time_to_first_token_ms', 'TimeToFirstToken', 'Milliseconds'),
+            ('tokens_per_second', 'OutputTokensPerSecond', 'Count/Second'),
+            ('total_ms', 'BedrockStreamDuration', 'Milliseconds'),
+        ) if stats.get(key) is not None
+    }, {'Model': model_id})
+
+def websocket_relay(websocket):
+    """Return a callable that pushes chunks to an API Gateway WebSocket connection, or None"""
+    if not websocket or not websocket.get('endpoint_url') or not websocket.get('connection_id'):
+        return None
+    client = aws_client('apigatewaymanagementapi', endpoint_url=websocket['endpoint_url'])
+    connection_id = websocket['connection_id']
+    
+    def relay(chunk):
+        try:
+            client.post_to_connection(ConnectionId=connection_id, Data=chunk.encode('utf-8'))
+        except Exception as e:
+            print(f"Error relaying chunk to WebSocket: {e}")
+    return relay
+
+def resolve_filing(event):
+    """
+    Validate the event and find the filing (Steps 1-2).
+    
+    Returns (error_response, None) or (None, request) with the question details and
+    filing URL filled in; the index, context and answer are added by later steps.
+    """
+    # Step 1: Get the inputs
+    question = event.get('question')
+    company = event.get('ticker') or event.get('company')
+    year = event.get('year')
+    
+    # Optional: User can specify filing type directly
+    explicit_filing_type = event.get('filing_type')
+    explicit_quarter = event.get('quarter')
+    
+    # Check if we have everything we need
+    if not question:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Please provide a question'})
+        }, None
+    
+    if not company:
+        # No ticker field: look for a company name or ticker in the question itself
+        with timed('company_lookup'):
+            company = company_from_question(question)
+    
+    if not company:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Please provide a company ticker (like AAPL)'})
+        }, None
+    
+    if not year:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Please provide a year (like 2023)'})
+        }, None
+    
+    # Convert year to number
+    try:
+        year = int(year)
+    except:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Year must be a number'})
+        }, None
+    
+    print(f"Processing: {question} for {company} in {year}")
+    
+    # Step 2: Get SEC document URL from Lambda 2 (remembered for repeat questions)
+    intent = question_parser.parse_question(question)
+    lookup_type, lookup_quarter = determine_filing_type(question, intent)
+    filing_url = answer_cache.recall_filing_url(company, year, lookup_type, lookup_quarter)
+    if filing_url:
+        print(f"♻️ DEBUG: Reusing filing URL from an earlier request: {filing_url}")
+    else:
+        with timed('lambda2_invoke'):
+            filing_url = get_sec_document_url(company, year, question, intent)
+        print(f"🔍 DEBUG: Filing URL received from Lambda 2: {filing_url}")  # ADD THIS LINE
+        if not filing_url and current_deadline().expired():
+            return {
+                'statusCode': 504,
+                'body': json.dumps({'error': 'Ran out of time looking up the SEC filing'})
+            }, None
+        if not filing_url:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({'error': f'Could not find SEC filing for {company} in {year}'})
+            }, None
+        answer_cache.remember_filing_url(company, year, lookup_type, lookup_quarter, filing_url)
+    
+    # Determine what filing type was used
+    if explicit_filing_type:
+        filing_type = explicit_filing_type
+        quarter = explicit_quarter
+    else:
+        filing_type, quarter = lookup_type, lookup_quarter
+    
+    request = {
+        'question': question,
+        'company': company,
+        'year': year,
+        'filing_type': filing_type,
+        'quarter': quarter,
+        'intent': intent,
+        'filing_url': filing_url,
+        'accession': accession_from_url(filing_url),
+        'index': None,
+        'document_size': None,
+        'document_text': '',
+        'answer': None,
+        'answer_source': None,
+        'context_tokens': 0,
+        'cache_prefix': False,
+        'cache_key': None,
+        'degraded': (),
+    }
+    apply_route(request, event.get('latency_tier'))
+    return None, request
+
+def apply_route(request, latency_tier=None):
+    """Set the model, max_tokens and latency tier for the request's question from the routing table"""
+    route = model_router.route_question(request['question'], intent=request.get('intent'))
+    request.update(route=route.name, model_id=route.model_id, model_used=route.label,
+                   max_tokens=route.max_tokens, latency_tier=latency_tier or route.latency_tier)
 
+def lookup_cached_answer(request, use_cache=True, context_strategy=None):
+    """Step 3: fill in the answer from the answer cache; returns True on a hit"""
+    cache = answer_cache.get_answer_cache() if use_cache else None
+    if cache is None:
+        return False
+    normalized = answer_cache.normalize_question(request['question'], company_names())
+    request['cache_key'] = answer_cache.answer_key(normalized, request['accession'], request['model_id'],
+                                                   context_strategy or CONTEXT_STRATEGY, request['max_tokens'])
+    cached = cache.get(request['cache_key'])
+    if not cached:
+        return False
+    request.update(answer=cached['answer'], answer_source='answer_cache',
+                   model_used=cached['model_used'], document_size=cached.get('document_size'))
+    print(f"⚡ DEBUG: Answer cache hit for '{normalized}' on accession {request['accession']}")
+    return True
+
+def load_filing(request):
+    """Step 4: download, clean and index the filing (reused for follow-up questions); returns an error response or None"""
+    accession = request['accession']
+    index = retrieval.get_cached_index(accession)
+    if index is None:
+        document_text = download_sec_document(request['filing_url'], max_chars=None)
+        print(f"📄 DEBUG: Document downloaded, length: {len(document_text) if document_text else 'None'}")
+        if not document_text and current_deadline().expired():
+            return {
+                'statusCode': 504,
+                'body': json.dumps({'error': 'Ran out of time downloading the SEC document'})
+            }
+        if not document_text:
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'error': 'Could not download SEC document'})
+            }
+        with timed('index_build'):
+            index = retrieval.build_index(accession, document_text)
+    else:
+        print(f"♻️ DEBUG: Reusing cached index for accession {accession}")
+    request.update(index=index, document_size=index.document_chars)
+    return None
+
+def plan_context(request, context_strategy=None):
+    """Step 5: answer from XBRL facts when possible, otherwise choose the context for Claude.
+    
+    The filing context is sized in estimated tokens from the model's window, the
+    reserved max_tokens and the latency tier (given in the event or set by the
+    question's route), then shrunk to fit the time left before the deadline. With
+    no time left for Claude the answer is the most relevant passages instead.
+    """
+    question, index = request['question'], request['index']
+    
+    # Answer numeric lookups straight from the filing's XBRL facts when possible
+    facts = xbrl_facts.get_cached_facts(request['accession']) or []
+    answer = xbrl_facts.direct_answer(question, facts, request['filing_type'], request['year'])
+    if answer:
+        request.update(answer=answer, answer_source='xbrl_fact', model_used='Inline XBRL facts')
+        print(f"⚡ DEBUG: Answered from {len(facts)} XBRL facts, skipping Bedrock")
+        return
+    
+    # Comparison questions only need the matching facts; everything else gets the top passages
+    document_text = xbrl_facts.facts_context(question, facts, request['filing_type'])
+    request['answer_source'] = 'xbrl_prompt' if document_text else 'filing'
+    if not document_text:
+        if (context_strategy or CONTEXT_STRATEGY) == 'cached_prefix':
+            # Same filing text for every question, so Bedrock can serve it from the prompt cache
+            request['latency_tier'] = CACHED_PREFIX_TIER
+            budget = token_budget.plan_context_tokens(request['model_id'], request['max_tokens'], CACHED_PREFIX_TIER)
+            budget = fit_to_deadline(request, budget)
+            document_text = index.document_prefix(budget)
+            request['cache_prefix'] = True
+        else:
+            budget = token_budget.plan_context_tokens(request['model_id'], request['max_tokens'], request['latency_tier'])
+            budget = fit_to_deadline(request, budget)
+            document_text = index.build_context(question, token_budget=budget)
+    else:
+        fit_to_deadline(request, token_budget.estimate_tokens(document_text))
+    if 'no_time_for_model' in request['degraded']:
+        answer_with_passages(request)
+    request['document_text'] = document_text
+    request['context_tokens'] = token_budget.estimate_tokens(document_text)
+    print(f"🔎 DEBUG: Selected context length: {len(document_text)} of {index.document_chars} "
+          f"(~{request['context_tokens']} tokens, {request['latency_tier'] or 'facts'} tier)")
+
+def answer_with_passages(request):
+    """Answer with the filing's most relevant passages when there is no time left to ask Claude"""
+    passages = request['index'].build_context(request['question'], token_budget=PARTIAL_ANSWER_TOKENS)
+    request.update(answer_source='deadline_partial', model_used='None (out of time)',
+                   answer="There wasn't enough time left to ask Claude. The most relevant passages "
+                          f"from the filing are:\n\n{passages}")
+    print(f"⏱️ DEBUG: {current_deadline().remaining_ms():.0f} ms left, answering with passages only")
+
+def refit_context(request):
+    """Fit a planned request to the time left now, for a call that waited behind others.
+
+    Shrinks the filing context and max_tokens as plan_context would; returns False, with
+    the passages as the answer, when there is no longer time to ask Claude.
+    """
+    budget = fit_to_deadline(request, request['context_tokens'])
+    if 'no_time_for_model' in request['degraded']:
+        answer_with_passages(request)
+        return False
+    # XBRL fact contexts are already as small as they get
+    if budget < request['context_tokens'] and request['answer_source'] == 'filing':
+        index = request['index']
+        if request['cache_prefix']:
+            request['document_text'] = index.document_prefix(budget)
+        else:
+            request['document_text'] = index.build_context(request['question'], token_budget=budget)
+        request['context_tokens'] = token_budget.estimate_tokens(request['document_text'])
+    return True
+
+def degrade(request, cut):
+    """Record a cut made to fit the deadline, once however often the request is fitted"""
+    if cut not in request['degraded']:
+        request['degraded'] += (cut,)
+
+def fit_to_deadline(request, budget):
+    """Shrink the context budget and max_tokens so Claude should answer before the deadline.
+    
+    Records what was cut in request['degraded'] and returns the budget to use.
+    """
+    remaining_ms = current_deadline().remaining_ms()
+    fitted = token_budget.fit_to_time(budget, request['max_tokens'], remaining_ms)
+    if fitted is None:
+        degrade(request, 'no_time_for_model')
+        return budget
+    context_tokens, max_tokens = fitted
+    if fitted != (budget, request['max_tokens']):
+        print(f"⏱️ DEBUG: {remaining_ms:.0f} ms left, context {budget} -> {context_tokens} tokens, "
+              f"max_tokens {request['max_tokens']} -> {max_tokens}")
+    if context_tokens < budget:
+        degrade(request, 'smaller_context')
+    if max_tokens < request['max_tokens']:
+        degrade(request, 'shorter_answer')
+        request['max_tokens'] = max_tokens
+    return context_tokens
+
+def prepare_question(event):
+    """
+    Validate the event and do everything up to the Bedrock call.
+    
+    Returns (error_response, None) when the request cannot be answered, otherwise
+    (None, request) where request holds the question details, the filing URL and
+    index, the context for Claude, and the answer if the answer cache or XBRL
+    facts already provide it.
+    """
+    error, request = resolve_filing(event)
+    if error:
+        return error, None
+    if lookup_cached_answer(request, event.get('use_cache', True), event.get('context_strategy')):
+        return None, request
+    error = load_filing(request)
+    if error:
+        return error, None
+    with timed('context_planning'):
+        plan_context(request, event.get('context_strategy'))
+    return None, request
+
+def answer_response(request, extra=None):
+    """Build the standard success response for a prepared and answered request"""
+    body = {
+        'question': request['question'],
+        'company': request['company'],
+        'year': request['year'],
+        'filing_type': request['filing_type'],
+        'quarter': request['quarter'] if request['filing_type'] == "Quarter" else None,
+        'answer': request['answer'],
+        'sec_document_url': request['filing_url'],
+        'document_size': request['document_size'],
+        'context_size': len(request['document_text']),
+        'context_tokens': request['context_tokens'],
+        'latency_tier': request['latency_tier'],
+        'answer_source': request['answer_source'],
+        'model_used': request['model_used'],
+        'route': request['route'],
+        'degraded': list(request['degraded']),
+        'success': True
+    }
+    body.update(extra or {})
+    return {
+        'statusCode': 200,
+        'body': json.dumps(body)
+    }
+
+def store_answer(request, answered):
+    """Cache a freshly produced answer; answered is False when Bedrock returned an error
+    or a streamed answer didn't finish"""
+    cache = answer_cache.get_answer_cache()
+    if cache is None or not request['cache_key'] or not answered:
+        return
+    # Cached answers are already stored, and out-of-time passages aren't answers worth keeping
+    if request['answer_source'] in ('answer_cache', 'deadline_partial'):
+        return
+    # Nor are answers cut down to fit the deadline, which a later request with more time would improve on
+    if request['degraded']:
+        return
+    cache.put(request['cache_key'], {
+        'answer': request['answer'],
+        'model_used': request['model_used'],
+        'document_size': request['document_size'],
+    })
+
+def claude_args(request):
+    return (request['question'], request['document_text'], request['company'], request['year'], request['filing_type'],
+            request['quarter'], request['cache_prefix'], request['max_tokens'], request['model_id'])
+
+def record_route(request, latency_ms, usage=None):
+    model_router.record_route(model_router.ROUTES[request['route']], latency_ms, usage)
+
+def stream_answer(event, stats=None):
+    """
+    Local generator API: yields the answer as Claude produces it.
+    
+    Accepts the same event as lambda_handler. If a stats dict is passed it
+    receives the statusCode plus the streaming metrics; on errors the error
+    message is yielded as the only chunk.
+    """
+    stats = stats if stats is not None else {}
+    # No Lambda context here, so only a deadline_ms in the event limits the time
+    start_deadline(None, event.get('deadline_ms'))
+    error, request = prepare_question(event)
+    if error:
+        stats['statusCode'] = error['statusCode']
+        yield json.loads(error['body'])['error']
+        return
+    stats['statusCode'] = 200
+    if request['answer']:
+        yield request['answer']
+        store_answer(request, True)
+        return
+    chunks = []
+    for chunk in stream_claude_answer(*claude_args(request), stats=stats):
+        chunks.append(chunk)
+        yield chunk
+    request['answer'] = ''.join(chunks)
+    record_route(request, stats.get('total_ms'), stats)
+    store_answer(request, stream_completed(stats))
+
+def stream_completed(stats):
+    """True when a streamed answer ran to Claude's message_stop, not cut short by the deadline or an error"""
+    return bool(stats.get('completed')) and not stats.get('deadline_truncated')
+
+def elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def batch_prompt(questions):
+    """Ask several questions in one prompt, with the answers returned as a JSON array"""
+    numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(questions, 1))
+    return (f"Answer each of these {len(questions)} questions.\n{numbered}\n\n"
+            f"Reply with only a JSON array of {len(questions)} strings, one answer per question, in the same order.")
+
+def parse_batch_answers(text, count):
+    """Pull the JSON array of answers out of a single-call reply, or None if it is malformed"""
+    start, end = text.find('['), text.rfind(']')
+    try:
+        answers = json.loads(text[start:end + 1]) if start != -1 else None
+    except ValueError:
+        return None
+    if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+        return None
+    return answers
+
+def merge_contexts(texts, token_limit):
+    """Interleave the passages chosen for each question, dropping repeats, up to the token budget"""
+    passage_lists = [text.split(retrieval.PASSAGE_SEPARATOR) for text in texts if text]
+    seen = set()
+    merged = []
+    used = 0
+    for rank in range(max((len(passages) for passages in passage_lists), default=0)):
+        for passages in passage_lists:
+            if rank >= len(passages) or passages[rank] in seen:
+                continue
+            size = token_budget.estimate_tokens(passages[rank] + retrieval.PASSAGE_SEPARATOR)
+            if used + size > token_limit:
+                continue
+            seen.add(passages[rank])
+            merged.append(passages[rank])
+            used += size
+    return retrieval.PASSAGE_SEPARATOR.join(merged)
+
+def ask_single_call(pending):
+    """Answer every pending question with one structured Bedrock call; returns False if the reply is unusable
+    or the time left can't fit an answer to every question"""
+    # The most demanding route in the batch decides the model for the shared call
+    lead = max(pending, key=lambda request: request['max_tokens'])
+    # The shared call is fitted to the deadline like a single question's
+    call = {'max_tokens': token_budget.output_tokens(lead['model_id'], lead['max_tokens'] * len(pending)), 'degraded': ()}
+    budget = fit_to_deadline(call, token_budget.plan_context_tokens(lead['model_id'], call['max_tokens'], CACHED_PREFIX_TIER))
+    if 'no_time_for_model' in call['degraded'] or call['max_tokens'] < token_budget.MIN_OUTPUT_TOKENS * len(pending):
+        print(f"⏱️ DEBUG: {current_deadline().remaining_ms():.0f} ms left, too little for one call answering "
+              f"{len(pending)} questions, asking them separately")
+        return False
+    max_tokens = call['max_tokens']
+    bedrock = deadline_client('bedrock-runtime', BEDROCK_READ_TIMEOUT_SECONDS)
+    document_text = merge_contexts([request['document_text'] for request in pending], budget)
+    started = time.perf_counter()
+    usage = {}
+    reply = ask_claude_question(batch_prompt([request['question'] for request in pending]), document_text,
+                                lead['company'], lead['year'], lead['filing_type'], lead['quarter'],
+                                all(request['cache_prefix'] for request in pending), max_tokens, lead['model_id'],
+                                usage=usage, bedrock=bedrock)
+    call_ms = elapsed_ms(started)
+    record_route(lead, call_ms, usage)
+    answers = parse_batch_answers(reply, len(pending)) if usage else None
+    if answers is None:
+        print("⚠️ DEBUG: Single-call batch reply could not be parsed, asking questions separately")
+        return False
+    # Not cached: each request's key names its own model and max_tokens, but these answers came
+    # from the lead model with the batch prompt, merged context and shared token budget
+    for request, answer in zip(pending, answers):
+        request.update(answer=answer, document_text=document_text, context_tokens=token_budget.estimate_tokens(document_text),
+                       model_id=lead['model_id'], model_used=lead['model_used'])
+        for cut in call['degraded']:
+            degrade(request, cut)
+        request['elapsed_ms'] += call_ms
+    return True
+
+def ask_concurrently(pending):
+    """Answer each pending question with its own Bedrock call, several at a time"""
+    def answer(request):
+        started = time.perf_counter()
+        # The question was planned with all of the time left, but may have waited for a worker since
+        if not refit_context(request):
+            request['elapsed_ms'] += elapsed_ms(started)
+            return
+        usage = {}
+        # Each call gets a client whose read timeout ends at the deadline as it stands now
+        bedrock = deadline_client('bedrock-runtime', BEDROCK_READ_TIMEOUT_SECONDS)
+        request['answer'] = ask_claude_question(*claude_args(request), usage=usage, bedrock=bedrock)
+        call_ms = elapsed_ms(started)
+        request['elapsed_ms'] += call_ms
+        record_route(request, call_ms, usage)
+        store_answer(request, bool(usage))
+    
+    # With a cached filing prefix the first call writes the prompt cache, so the rest can read it
+    if pending and pending[0]['cache_prefix']:
+        answer(pending[0])
+        pending = pending[1:]
+    if pending:
+        # Each worker runs in a copy of this context, so it sees the invocation's deadline and timings
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(pending))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, answer, request) for request in pending]
+            for future in futures:
+                future.result()
+
+def answer_batch(event):
+    """
+    Answer a list of questions about one filing.
+    
+    The filing is resolved, downloaded and indexed once. Questions found in the
+    answer cache or answerable from XBRL facts skip Bedrock; the rest are asked
+    concurrently (default) or in one structured call ("batch_mode": "single_call").
+    """
+    started = time.perf_counter()
+    questions = event.get('questions')
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) and q.strip() for q in questions):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Please provide questions as a list of non-empty strings'})
+        }
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'Please send at most {BATCH_MAX_QUESTIONS} questions per batch'})
+        }
+    
+    # Every question is about the same filing, so it is looked up from all of them at once
+    error, base = resolve_filing(dict(event, question=' '.join(questions)))
+    if error:
+        return error
+    timings = current_timings() or start_timings()
+    timings.add_ms('resolve', elapsed_ms(started))
+    
+    # Questions share the filing prefix unless the caller asks for per-question retrieval
+    context_strategy = event.get('context_strategy') or 'cached_prefix'
+    batch = []
+    for question in questions:
+        question_started = time.perf_counter()
+        request = dict(base, question=question, intent=question_parser.parse_question(question))
+        apply_route(request, event.get('latency_tier'))
+        lookup_cached_answer(request, event.get('use_cache', True), context_strategy)
+        request['elapsed_ms'] = elapsed_ms(question_started)
+        batch.append(request)
+    
+    pending = [request for request in batch if request['answer'] is None]
+    if pending:
+        load_started = time.perf_counter()
+        error = load_filing(base)
+        if error:
+            return error
+        timings.add_ms('load', elapsed_ms(load_started))
+        for request in pending:
+            question_started = time.perf_counter()
+            request.update(index=base['index'], document_size=base['document_size'])
+            plan_context(request, context_strategy)
+            request['elapsed_ms'] += elapsed_ms(question_started)
+            if request['answer'] is not None:
+                store_answer(request, True)
+        pending = [request for request in pending if request['answer'] is None]
+    
+    batch_mode = event.get('batch_mode') or BATCH_MODE
+    answer_started = time.perf_counter()
+    if pending:
+        if not (batch_mode == 'single_call' and len(pending) > 1 and ask_single_call(pending)):
+            batch_mode = 'concurrent'
+            ask_concurrently(pending)
+    timings.add_ms('answer', elapsed_ms(answer_started))
+    emit_metrics({
+        'BatchQuestions': (len(questions), 'Count'),
+        'BatchBedrockQuestions': (len(pending), 'Count'),
+        'BatchDuration': (elapsed_ms(started), 'Milliseconds'),
+    }, {'BatchMode': batch_mode})
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'company': base['company'],
+            'year': base['year'],
+            'filing_type': base['filing_type'],
+            'quarter': base['quarter'] if base['filing_type'] == "Quarter" else None,
+            'sec_document_url': base['filing_url'],
+            'document_size': base['document_size'],
+            'batch_mode': batch_mode,
+            'answers': [{
+                'question': request['question'],
+                'answer': request['answer'],
+                'answer_source': request['answer_source'],
+                'model_used': request['model_used'],
+                'route': request['route'],
+                'context_size': len(request['document_text']),
+                'context_tokens': request['context_tokens'],
+                'degraded': list(request['degraded']),
+                'timings': {'total_ms': request['elapsed_ms']},
+            } for request in batch],
+            'timings': timings.as_dict(),
+            'success': True
+        })
+    }
+
+@profiled('lambda3')
 def lambda_handler(event, context):
     """
     Main Lambda function - this is what AWS calls when someone uses your Lambda
@@ -155,93 +964,85 @@ def lambda_handler(event, context):
         "filing_type": "Quarter",
         "quarter": "3"
     }
+    
+    Each question is routed (numeric lookup, comparison or explanation) to a model,
+    max_tokens and latency tier from model_router.py; the response names the route.
+    Optional "latency_tier": "fast", "standard" or "thorough" overrides how much
+    filing text is sent.
+    
+    Optional "context_strategy": "retrieval" (default, top passages per question) or
+    "cached_prefix" (stable filing prefix reused through Bedrock prompt caching).
+    
+    Batch: send "questions": [...] instead of "question" to ask up to 25 questions about
+    one filing. It is downloaded once; "batch_mode" is "concurrent" (default) or
+    "single_call". The response lists each answer with its own timings.
+    
+    Repeated questions are answered from the answer cache (see answer_cache.py);
+    "use_cache": false skips the lookup and does not store the answer.
+    
+    Optional streaming: "stream": true uses Bedrock response streaming and adds
+    time-to-first-token metrics. With "websocket": {"endpoint_url": ..., "connection_id": ...}
+    each chunk is also pushed to the caller's API Gateway WebSocket as it arrives.
+    The buffered response below is returned either way.
+    
+    Every response has a "timings" block and a "trace" span tree that includes Lambda 2's
+    spans; set TRACE_EXPORT_DIR to also write each tree to <trace_id>.json.
+    
+    "profile": true (or "cpu" / "memory") writes a cProfile/tracemalloc report for this
+    invocation; PROFILE_MODE and PROFILE_SAMPLE_RATE do the same for a sample (see profiling.py).
     """
     print("Lambda 3 started - SEC Question Answering")
     
+    # Every stage below records into this invocation's timings and trace (see metrics.py)
+    timings = start_timings('lambda3', event.get('trace'))
+    # ... and sizes its work to the time left (see deadline.py)
+    start_deadline(context, event.get('deadline_ms'))
+    response = answer_event(event)
+    timings.emit({'Handler': 'lambda3'})
+    trace = timings.trace()
+    if TRACE_EXPORT_DIR:
+        export_trace(trace, os.path.join(TRACE_EXPORT_DIR, f"{timings.trace_id}.json"))
+    return with_timings(response, timings, trace)
+
+def answer_event(event):
+    """Answer a single question or a batch; the body of lambda_handler"""
     try:
-        # Step 1: Get the inputs
-        question = event.get('question')
-        company = event.get('ticker') or event.get('company')
-        year = event.get('year')
-        
-        # Optional: User can specify filing type directly
-        explicit_filing_type = event.get('filing_type')
-        explicit_quarter = event.get('quarter')
-        
-        # Check if we have everything we need
-        if not question:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Please provide a question'})
-            }
-        
-        if not company:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Please provide a company ticker (like AAPL)'})
-            }
+        if 'questions' in event:
+            return answer_batch(event)
         
-        if not year:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Please provide a year (like 2023)'})
-            }
-        
-        # Convert year to number
-        try:
-            year = int(year)
-        except:
-            return {
-                'statusCode': 400,
-                'body': json.dumps({'error': 'Year must be a number'})
-            }
-        
-        print(f"Processing: {question} for {company} in {year}")
-        
-        # Step 2: Get SEC document URL from Lambda 2
-        filing_url = get_sec_document_url(company, year, question)
-        print(f"🔍 DEBUG: Filing URL received from Lambda 2: {filing_url}")  # ADD THIS LINE
-        if not filing_url:
-            return {
-                'statusCode': 404,
-                'body': json.dumps({'error': f'Could not find SEC filing for {company} in {year}'})
-            }
-        
-        # Step 3: Download and clean the SEC document
-        document_text = download_sec_document(filing_url)
-        print(f"📄 DEBUG: Document downloaded, length: {len(document_text) if document_text else 'None'}")  # ADD THIS LINE
-        if not document_text:
-            return {
-                'statusCode': 500,
-                'body': json.dumps({'error': 'Could not download SEC document'})
-            }
-        
-        # Step 4: Determine what filing type was used
-        if explicit_filing_type:
-            filing_type = explicit_filing_type
-            quarter = explicit_quarter
-        else:
-            filing_type, quarter = determine_filing_type(question)
+        error, request = prepare_question(event)
+        if error:
+            return error
         
-        # Step 5: Ask Claude Sonnet 4 to answer the question
-        answer = ask_claude_question(question, document_text, company, year, filing_type, quarter)
+        extra = {}
+        answered = request['answer'] is not None
+        if request['answer'] is None:
+            if event.get('stream'):
+                # Stream from Bedrock, relaying chunks to the caller if a WebSocket is attached
+                relay = websocket_relay(event.get('websocket'))
+                stats = {}
+                chunks = []
+                for chunk in stream_claude_answer(*claude_args(request), stats=stats):
+                    chunks.append(chunk)
+                    if relay:
+                        relay(chunk)
+                request['answer'] = ''.join(chunks)
+                extra['stream_metrics'] = stats
+                record_route(request, stats.get('total_ms'), stats)
+                answered = stream_completed(stats)
+            else:
+                # Ask the routed Claude model to answer the question
+                started = time.perf_counter()
+                usage = {}
+                request['answer'] = ask_claude_question(*claude_args(request), usage=usage)
+                record_route(request, elapsed_ms(started), usage)
+                if usage:
+                    extra['usage'] = usage
+                answered = bool(usage)
+        store_answer(request, answered)
         
         # Step 6: Return the answer
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'question': question,
-                'company': company,
-                'year': year,
-                'filing_type': filing_type,
-                'quarter': quarter if filing_type == "Quarter" else None,
-                'answer': answer,
-                'sec_document_url': filing_url,
-                'document_size': len(document_text),
-                'model_used': 'Claude 3.5 Sonnet',
-                'success': True
-            })
-        }
+        return answer_response(request, extra)
         
     except Exception as e:
         print(f"Lambda error: {e}")
@@ -0,0 +1,78 @@
+# model_router.py - Pick the Bedrock model, max_tokens and context tier for each question
+import json
+import os
+import re
+from collections import namedtuple
+
+import xbrl_facts
+from metrics import emit_metrics
+
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+HAIKU = "us.anthropic.claude-3-5-haiku-20241022-v1:0"
+
+Route = namedtuple('Route', ['name', 'model_id', 'label', 'max_tokens', 'latency_tier'])
+
+# Single-number lookups need a sentence back, so a smaller model with a small
+# prompt answers them fastest; comparisons and explanations keep Sonnet
+DEFAULT_ROUTES = {
+    'numeric_lookup': {'model_id': HAIKU, 'label': 'Claude 3.5 Haiku', 'max_tokens': 500, 'latency_tier': 'fast'},
+    'comparison': {'model_id': SONNET, 'label': 'Claude 3.5 Sonnet', 'max_tokens': 1500, 'latency_tier': 'standard'},
+    'explanation': {'model_id': SONNET, 'label': 'Claude 3.5 Sonnet', 'max_tokens': 3000, 'latency_tier': 'standard'},
+}
+DEFAULT_ROUTE = 'explanation'
+
+NUMERIC_PATTERN = re.compile(r'\b(?:how much|how many|what (?:was|were|is|are) (?:the )?(?:total|amount|number))\b')
+YEAR_PATTERN = re.compile(r'\b(?:19|20)\d{2}\b')
+
+
+def load_routes(overrides=None):
+    """Default routing table with overrides from MODEL_ROUTES (JSON: {route: {field: value}})"""
+    if overrides is None:
+        try:
+            overrides = json.loads(os.environ.get('MODEL_ROUTES') or '{}')
+        except ValueError as e:
+            print(f"Ignoring invalid MODEL_ROUTES: {e}")
+            overrides = {}
+    routes = {}
+    for name in set(DEFAULT_ROUTES) | set(overrides):
+        fields = dict(DEFAULT_ROUTES.get(name, DEFAULT_ROUTES[DEFAULT_ROUTE]))
+        override = overrides.get(name) or {}
+        if 'model_id' in override and 'label' not in override:
+            # The default label names the default model
+            fields.pop('label')
+        fields.update(override)
+        routes[name] = Route(name, fields['model_id'], fields.get('label', fields['model_id']),
+                             int(fields['max_tokens']), fields['latency_tier'])
+    return routes
+
+
+ROUTES = load_routes()
+
+
+def classify_question(question, intent=None):
+    """Return 'explanation', 'comparison' or 'numeric_lookup' for a question"""
+    question_lower = question.lower()
+    if xbrl_facts.EXPLANATION_PATTERN.search(question_lower):
+        return 'explanation'
+    years = intent.years if intent else set(YEAR_PATTERN.findall(question_lower))
+    if xbrl_facts.COMPARISON_PATTERN.search(question_lower) or len(years) > 1:
+        return 'comparison'
+    if NUMERIC_PATTERN.search(question_lower) or (xbrl_facts.match_metric(question_lower)
+                                                   and xbrl_facts.LOOKUP_PATTERN.search(question_lower)):
+        return 'numeric_lookup'
+    return DEFAULT_ROUTE
+
+
+def route_question(question, routes=None, intent=None):
+    routes = routes or ROUTES
+    return routes.get(classify_question(question, intent)) or routes[DEFAULT_ROUTE]
+
+
+def record_route(route, latency_ms, usage=None):
+    """Emit per-route latency and token usage so the routing table can be tuned from data"""
+    usage = usage or {}
+    metrics = {'RouteLatency': (latency_ms, 'Milliseconds')}
+    for key, name in (('input_tokens', 'RouteInputTokens'), ('output_tokens', 'RouteOutputTokens')):
+        if usage.get(key) is not None:
+            metrics[name] = (usage[key], 'Count')
+    emit_metrics(metrics, {'Route': route.name, 'Model': route.model_id})
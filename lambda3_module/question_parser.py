@@ -0,0 +1,115 @@
+# question_parser.py - One-pass extraction of form type, quarter and fiscal year, with company mentions on demand
+import re
+from collections import namedtuple
+
+QUARTER_WORDS = {'first': '1', '1st': '1', 'second': '2', '2nd': '2', 'third': '3', '3rd': '3', 'fourth': '4', '4th': '4'}
+
+# Upper-case words in questions that are finance vocabulary rather than tickers
+NOT_TICKERS = frozenset("""
+A I Q FY YOY YTD TTM SEC GAAP EPS EBIT EBITDA CEO CFO COO CTO US USA USD EU UK AI IT HR
+R D RD IPO ETF LLC INC CO CORP LTD PLC Q1 Q2 Q3 Q4 H1 H2 K
+""".split())
+
+# Question words that start a capitalised run without being part of a name
+LEADING_WORDS = frozenset("""
+What How Why When Where Which Who Whose Did Does Do Is Are Was Were Has Have Show Give List Tell
+Compare Describe Explain Summarize Summarise Find Please In For The Of And Between Versus Vs
+""".split())
+
+# Capitalised words without digits (so "FY23" is left to the fiscal year rule), allowing
+# lower-case connectors inside a name ("Bank of America", "Procter & Gamble")
+NAME_WORD = r"[A-Z][A-Za-z&.\-]*\b"
+NAME = NAME_WORD + r"(?:\s+(?:(?:of|the|de|&)\s+)?" + NAME_WORD + r")*"
+
+# Filing vocabulary (fiscal years, quarters, 10-K/10-Q, years). Every alternative starts
+# a word with a digit or one of the letters f, q, s and t, so one shared check up front
+# lets the scan skip the middle of words and most other words instead of trying each
+# alternative there. Alternatives are tried left to right, so specific forms come first.
+VOCABULARY = r"""
+    (?i:(?:fy|fiscal(?:\s+year)?)\s*'?(?P<fiscal_year>(?:19|20)\d{2}|\d{2})\b)
+  | (?i:q(?P<quarter_number>[1-4])\b)
+  | (?i:(?P<quarter_word>first|second|third|fourth|1st|2nd|3rd|4th)\s+(?:fiscal\s+)?quarter\b)
+  | (?i:(?P<quarterly>quarter(?:ly|s)?\b|10-?q\b))
+  | (?i:(?P<annual>10-?k\b))
+  | (?P<year>(?:19|20)\d{2}\b)
+"""
+QUESTION_PATTERN = re.compile(r"\b(?=[1-4fqstFQST])(?:" + VOCABULARY + ")", re.VERBOSE)
+
+# Company mentions rely on capitalisation. The vocabulary is tried first, so that
+# "Fourth Quarter" or "FY23" isn't read as a name
+MENTION_PATTERN = re.compile(r"""
+  \$?\b(?=[A-Z1-4fqst])(?:""" + VOCABULARY + r"""
+  | (?P<ticker>[A-Z]{1,5}(?:[.\-][A-Z])?\b)(?!['’]s\b|\s+(?:(?:of|the|de|&)\s+)?[A-Z])
+  | (?P<name>""" + NAME + r""")(?P<possessive>['’]s\b)?
+  )
+""", re.VERBOSE)
+SENTENCE_START = re.compile(r'(?:^|[.?!:]\s+)$')
+
+
+def _mention(match):
+    """Clean up a capitalised run; None when it is only question words or vocabulary"""
+    value = match.group('ticker')
+    if value:
+        return None if value in NOT_TICKERS else value
+    value = match.group('name')
+    words = value.split()
+    while words and words[0] in LEADING_WORDS:
+        words.pop(0)
+    if not words or (len(words) == 1 and words[0] in NOT_TICKERS):
+        return None
+    # A lone capitalised word opening a sentence is usually just the first word
+    if not match.group('possessive') and len(words) == 1 and words[0] == value and SENTENCE_START.search(match.string, 0, match.start()):
+        return None
+    return ' '.join(words)
+
+
+class QuestionIntent(namedtuple('QuestionIntent', ['form', 'filing_type', 'quarter', 'fiscal_year', 'years', 'question'])):
+    """What a question asks for: the filing's form, quarter and fiscal years"""
+    __slots__ = ()
+
+    @property
+    def company_mentions(self):
+        """Capitalised runs that may name companies, found only when asked for (Lambda 3 uses CompanyMatcher)"""
+        mentions = []
+        for match in MENTION_PATTERN.finditer(self.question):
+            if match.lastgroup in ('ticker', 'name', 'possessive'):
+                mention = _mention(match)
+                if mention and mention not in mentions:
+                    mentions.append(mention)
+        return tuple(mentions)
+
+
+def parse_question(question):
+    """Scan the question once and return its QuestionIntent.
+
+    The first quarter mentioned wins; a question about quarters without naming
+    one defaults to Q1, and anything else is treated as an annual (10-K) question.
+    """
+    quarter = None
+    quarterly = False
+    fiscal_year = None
+    years = []
+    for match in QUESTION_PATTERN.finditer(question or ''):
+        group = match.lastgroup
+        value = match.group(group)
+        if group == 'fiscal_year':
+            year = int(value) if len(value) == 4 else 2000 + int(value)
+            fiscal_year = fiscal_year or year
+            if year not in years:
+                years.append(year)
+        elif group == 'year':
+            if int(value) not in years:
+                years.append(int(value))
+        elif group == 'quarter_number':
+            quarter = quarter or value
+        elif group == 'quarter_word':
+            quarter = quarter or QUARTER_WORDS[value.lower()]
+        elif group == 'quarterly':
+            quarterly = True
+
+    if quarter or quarterly:
+        form, filing_type, quarter = '10-Q', 'Quarter', quarter or '1'
+    else:
+        form, filing_type = '10-K', 'Annual'
+    return QuestionIntent(form, filing_type, quarter, fiscal_year or (years[0] if years else None),
+                          tuple(years), question or '')
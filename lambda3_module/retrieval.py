@@ -0,0 +1,181 @@
+# retrieval.py - Lexical (BM25) passage retrieval over cleaned SEC filing text
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from token_budget import calibration_scale, raw_token_estimate
+
+# Passages are ~1,500 characters with a small overlap so figures that straddle
+# a boundary still appear whole in at least one passage
+CHUNK_CHARS = 1500
+CHUNK_OVERLAP = 200
+
+# Default context size handed to Claude; lambda_3 plans a budget per request (token_budget.py).
+# The budget alone decides how many passages are picked unless a top_k is given
+CONTEXT_TOKEN_BUDGET = 12000
+
+# Keep indexes for a handful of filings alive across warm Lambda invocations
+INDEX_CACHE_SIZE = 8
+
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+STOP_WORDS = frozenset("""
+a an and are as at be by did do does for from had has have how in is it its of on or
+our the their this to was were what when which who why will with
+""".split())
+
+_index_cache = OrderedDict()
+
+
+def tokenize(text):
+    """Lowercase text and split it into BM25 terms, dropping stop words"""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def chunk_text(text, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """Split text into overlapping passages, breaking on whitespace where possible"""
+    passages = []
+    start = 0
+    length = len(text)
+    while start < length:
+        end = min(start + chunk_chars, length)
+        if end < length:
+            # Back up to the last space so words are not cut in half
+            space = text.rfind(' ', start + overlap + 1, end)
+            if space != -1:
+                end = space
+        passages.append(text[start:end].strip())
+        if end >= length:
+            break
+        next_start = end - overlap
+        # Start the next passage on a word boundary too
+        space = text.find(' ', next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return [passage for passage in passages if passage]
+
+
+class BM25Index:
+    """In-memory BM25 index over the passages of a single filing"""
+
+    def __init__(self, passages, k1=1.5, b=0.75, text=None):
+        self.passages = passages
+        self.text = text
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+
+        # Flatten every (passage, term) occurrence into two parallel arrays
+        doc_ids = []
+        term_ids = []
+        for doc_id, passage in enumerate(passages):
+            for term in tokenize(passage):
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc_id)
+
+        n_docs = len(passages)
+        n_terms = len(self.vocab)
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+
+        # Count term frequencies per passage; sorting by term gives CSR-style postings
+        keys, counts = np.unique(term_ids * max(n_docs, 1) + doc_ids, return_counts=True)
+        posting_terms = keys // max(n_docs, 1)
+        self.posting_docs = keys % max(n_docs, 1)
+        self.posting_tf = counts.astype(np.float64)
+        self.posting_ptr = np.searchsorted(posting_terms, np.arange(n_terms + 1))
+
+        # Uncalibrated token estimates; the current calibration is applied when a context is picked
+        self.passage_tokens = np.array([raw_token_estimate(passage) for passage in passages])
+        self.separator_tokens = raw_token_estimate(PASSAGE_SEPARATOR)
+
+        self.doc_len = np.bincount(doc_ids, minlength=n_docs).astype(np.float64)
+        self.avg_doc_len = self.doc_len.mean() if n_docs else 0.0
+        doc_freq = np.diff(self.posting_ptr).astype(np.float64)
+        self.idf = np.log(1.0 + (n_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    @property
+    def document_chars(self):
+        if self.text is not None:
+            return len(self.text)
+        return sum(len(passage) for passage in self.passages)
+
+    def document_prefix(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Return the start of the filing up to the budget; identical for every question"""
+        text = self.text if self.text is not None else PASSAGE_SEPARATOR.join(self.passages)
+        # Cut by the filing's own characters-per-token, without calibration: a cut that moved
+        # as the estimator learns would change the prefix and miss Bedrock's prompt cache
+        document_tokens = raw_token_estimate(text)
+        if document_tokens <= token_budget:
+            return text
+        char_budget = int(len(text) * token_budget / document_tokens)
+        if len(text) <= char_budget:
+            return text
+        cut = text.rfind(' ', 0, char_budget)
+        return text[:cut if cut > 0 else char_budget]
+
+    def score(self, question):
+        """Return a BM25 score for every passage against the question"""
+        scores = np.zeros(len(self.passages))
+        if not self.passages:
+            return scores
+        norm = self.k1 * (1.0 - self.b + self.b * self.doc_len / self.avg_doc_len)
+        for term in set(tokenize(question)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.posting_ptr[term_id], self.posting_ptr[term_id + 1]
+            docs = self.posting_docs[start:end]
+            tf = self.posting_tf[start:end]
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1.0) / (tf + norm[docs])
+        return scores
+
+    def top_passages(self, question, top_k=None, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Pick the highest scoring passages that fit the token budget (at most top_k of them
+        when given), in document order"""
+        scores = self.score(question)
+        # Fall back to the start of the filing when nothing in the question matches
+        if not scores.any():
+            order = np.arange(len(self.passages))
+        else:
+            order = np.argsort(-scores, kind='stable')
+
+        raw_budget = token_budget / calibration_scale()
+        selected = []
+        used = 0.0
+        for doc_id in order:
+            if top_k is not None and len(selected) >= top_k:
+                break
+            passage_tokens = self.passage_tokens[doc_id] + self.separator_tokens
+            if used + passage_tokens > raw_budget:
+                continue
+            selected.append(int(doc_id))
+            used += passage_tokens
+        return [self.passages[doc_id] for doc_id in sorted(selected)]
+
+    def build_context(self, question, top_k=None, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Join the selected passages into the document text sent to Claude"""
+        return PASSAGE_SEPARATOR.join(self.top_passages(question, top_k, token_budget))
+
+
+def get_cached_index(accession):
+    """Return the cached index for a filing, or None if it has not been built yet"""
+    index = _index_cache.get(accession)
+    if index is not None:
+        _index_cache.move_to_end(accession)
+    return index
+
+
+def build_index(accession, document_text):
+    """Chunk and index a filing's text, caching the result by accession number"""
+    index = BM25Index(chunk_text(document_text), text=document_text)
+    _index_cache[accession] = index
+    _index_cache.move_to_end(accession)
+    while len(_index_cache) > INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+
+def clear_index_cache():
+    _index_cache.clear()
@@ -0,0 +1,161 @@
+# table_compaction.py - Turn filing <table> elements into dense tab-separated rows for prompts
+import re
+
+# Private-use characters survive whitespace collapsing, so tables can be swapped back in afterwards
+PLACEHOLDER = "\ue000{}\ue001"
+PLACEHOLDER_PATTERN = re.compile(" ?\ue000(\\d+)\ue001 ?")
+
+# Cells that only hold currency signs or closing punctuation belong to a neighbouring number
+CURRENCY_CELLS = {'$', '€', '£', '¥'}
+CLOSING_CELLS = {')', '%', ')%', '%)'}
+# Rough BPE-style token count (words, digit groups and punctuation) used to report savings
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]')
+NUMBER_PATTERN = re.compile(r'^\(?[-$€£¥]?\s?\d[\d,]*(\.\d+)?\)?%?$')
+
+
+def _cell_text(cell):
+    text = ' '.join(cell.get_text(' ').split())
+    # Figures are often split across spans, e.g. <span>(</span><span>184</span>
+    return re.sub(r'\s+([)%])', r'\1', re.sub(r'([($])\s+', r'\1', text))
+
+
+def _table_rows(table):
+    """Return each row as a list of (cell text, colspan) pairs"""
+    rows = []
+    for tr in table.find_all('tr'):
+        # Skip rows of tables nested inside this one; they are compacted on their own
+        if tr.find_parent('table') is not table:
+            continue
+        row = []
+        for cell in tr.find_all(['td', 'th'], recursive=False):
+            try:
+                span = max(1, min(int(cell.get('colspan', 1)), 50))
+            except ValueError:
+                span = 1
+            row.append((_cell_text(cell), span))
+        rows.append(row)
+    return rows
+
+
+def _expand(row):
+    """Lay a row out on the column grid, repeating each cell across its colspan"""
+    grid = []
+    for text, span in row:
+        grid.extend([text] * span)
+    return grid
+
+
+def _merge_symbols(row):
+    """Fold '$', '(' and ')' / '%' fragments into the numbers they belong to"""
+    merged = list(row)
+    for i, text in enumerate(merged):
+        if text in CURRENCY_CELLS:
+            merged[i] = ''
+        elif text in CLOSING_CELLS:
+            # Attach to the nearest non-empty cell on the left
+            for j in range(i - 1, -1, -1):
+                if merged[j]:
+                    merged[j] += text
+                    break
+            merged[i] = ''
+        elif text == '(':
+            for j in range(i + 1, len(merged)):
+                if merged[j]:
+                    merged[j] = '(' + merged[j]
+                    break
+            merged[i] = ''
+    return [text.lstrip('$€£¥ ') if NUMBER_PATTERN.match(text) else text for text in merged]
+
+
+def _project_header(row, keep):
+    """Map a header row onto the kept columns; a label over spacer columns only moves to the next value column"""
+    cells = [''] * len(keep)
+    start = 0
+    for text, span in row:
+        end = start + span
+        covered = [k for k, col in enumerate(keep) if start <= col < end]
+        if not covered:
+            covered = [k for k, col in enumerate(keep) if col >= end][:1]
+        for k in covered:
+            if text and not cells[k]:
+                cells[k] = text
+        start = end
+    return cells
+
+
+def compact_table(table):
+    """Render a table as tab-separated rows with spacer columns removed and header rows merged"""
+    raw_rows = [row for row in _table_rows(table) if any(text for text, _ in row)]
+    rows = [_merge_symbols(_expand(row)) for row in raw_rows]
+    if not rows:
+        return ''
+    width = max(len(row) for row in rows)
+    rows = [row + [''] * (width - len(row)) for row in rows]
+
+    # Header rows are the leading rows with labels over the value columns but no figures;
+    # a row with only a first-column label ("Revenue:") already belongs to the body
+    header_count = 0
+    for row in rows:
+        if not any(row[1:]) or any(NUMBER_PATTERN.match(text) and not re.fullmatch(r'(19|20)\d{2}', text) for text in row[1:]):
+            break
+        header_count += 1
+    headers, body = raw_rows[:header_count], rows[header_count:]
+    if not body:
+        body, headers = rows, []
+
+    # A column is a spacer when no body row has content in it
+    keep = [col for col in range(width) if any(row[col] for row in body)]
+    if not keep:
+        return ''
+
+    lines = []
+    column_headers = [[] for _ in keep]
+    for row in headers:
+        cells = _project_header(row, keep)
+        values = cells[1:]
+        # A label spanning every value column ("Three Months Ended ...") is written once as a caption
+        if len(values) > 1 and values[0] and all(value == values[0] for value in values):
+            lines.append('\t'.join([cells[0], values[0]]).strip('\t'))
+            continue
+        for parts, text in zip(column_headers, cells):
+            if text and text not in parts:
+                parts.append(text)
+    if any(column_headers):
+        lines.append('\t'.join(' '.join(parts) for parts in column_headers).rstrip('\t'))
+    for row in body:
+        # Drop repeated values left behind by colspan expansion in body rows
+        cells = []
+        for col in keep:
+            cells.append('' if cells and row[col] == cells[-1] and row[col] and not NUMBER_PATTERN.match(row[col]) else row[col])
+        lines.append('\t'.join(cells).rstrip('\t'))
+    return '\n'.join(lines)
+
+
+def replace_tables(soup):
+    """Swap every table in the soup for a placeholder and return the compacted tables"""
+    compacted = []
+    # Innermost tables first so nested layout tables do not swallow their children
+    for table in reversed(soup.find_all('table')):
+        compacted.append(compact_table(table))
+        table.replace_with(PLACEHOLDER.format(len(compacted) - 1))
+    return compacted
+
+
+def restore_tables(text, compacted):
+    """Put compacted tables back in place of their placeholders, each on its own lines.
+
+    An outer table's cells hold the placeholders of the tables nested in it, so substitution
+    repeats until none are left (at most once per nesting level).
+    """
+    def substitute(match):
+        table = compacted[int(match.group(1))]
+        return f"\n{table}\n" if table else ' '
+    for _ in range(len(compacted)):
+        if not PLACEHOLDER_PATTERN.search(text):
+            break
+        text = PLACEHOLDER_PATTERN.sub(substitute, text)
+    return text
+
+
+def count_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
@@ -0,0 +1,169 @@
+# test_answer_cache.py - Tests for question normalization and the answer cache backends
+import io
+import json
+import threading
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from CIK_module import CompanyMatcher
+from answer_cache import (AnswerCache, CompanyNames, MemoryBackend, S3Backend, TmpBackend,
+                          answer_key, normalize_question)
+from lambda_3 import lambda_handler
+
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+FILING_TEXT = "Total net sales were $383.3 billion. The Company faces supply chain risks. " * 100
+
+COMPANIES = CompanyNames(SimpleNamespace(company_matcher=lambda: CompanyMatcher(
+    {'apple inc.': '320193', 'bank of america corp /de/': '70858',
+     'agilent technologies, inc.': '1090872', 'jpmorgan chase & co': '19617'},
+    {'aapl': '320193', 'bac': '70858', 'a': '1090872', 'jpm': '19617'},
+)))
+
+
+class TestNormalization:
+    """Test that trivially reworded questions share a key"""
+
+    def test_company_names_reuse_the_index_matcher(self):
+        # One listing load builds one matcher, shared with SECEdgar.find_companies
+        edgar = SimpleNamespace(company_matcher=Mock(return_value=COMPANIES.matcher))
+        assert CompanyNames(edgar).matcher is COMPANIES.matcher
+        edgar.company_matcher.assert_called_once_with()
+
+    def test_ticker_and_possessive_name_match(self):
+        assert (normalize_question("What was AAPL revenue 2023?", COMPANIES)
+                == normalize_question("what was apple's revenue in 2023", COMPANIES)
+                == 'what revenue|cik:320193|fy:2023')
+
+    def test_legal_suffixes_and_ampersands(self):
+        assert normalize_question("Bank of America Corp net income", COMPANIES) == 'net income|cik:70858'
+        assert normalize_question("BAC net income?", COMPANIES) == 'net income|cik:70858'
+        assert normalize_question("JPMorgan Chase & Co. risks", COMPANIES) == 'risks|cik:19617'
+
+    def test_years_and_stop_word_tickers(self):
+        assert normalize_question("Revenue in 2022", COMPANIES) != normalize_question("Revenue in 2023", COMPANIES)
+        # "a" is Agilent's ticker but also an ordinary word
+        assert normalize_question("What was a key risk?", COMPANIES) == 'what key risk'
+
+    def test_without_company_index(self):
+        assert normalize_question("What was AAPL revenue 2023?") == 'what aapl revenue|fy:2023'
+
+    def test_interrogatives_and_negations_kept(self):
+        assert normalize_question("Why did revenue grow?") != normalize_question("How did revenue grow?")
+        assert normalize_question("Which segments did not grow?") != normalize_question("Which segments did grow?")
+
+    def test_key_includes_accession_and_model(self):
+        key = answer_key('revenue|fy:2023', '000032019323000106', 'model-a')
+        assert key != answer_key('revenue|fy:2023', '000032019324000123', 'model-a')
+        assert key != answer_key('revenue|fy:2023', '000032019323000106', 'model-b')
+        assert key != answer_key('revenue|fy:2023', '000032019323000106', 'model-a', 'cached_prefix')
+        assert key != answer_key('revenue|fy:2023', '000032019323000106', 'model-a', None, 500)
+
+
+class TestBackends:
+    """Test TTL handling and each storage backend"""
+
+    def test_memory_ttl_and_hit_rate(self, capsys):
+        cache = AnswerCache(MemoryBackend(), ttl_seconds=60)
+        with patch('answer_cache.time.time', return_value=1000.0):
+            assert cache.get('k') is None
+            cache.put('k', {'answer': 'cached'})
+            assert cache.get('k')['answer'] == 'cached'
+        with patch('answer_cache.time.time', return_value=1061.0):
+            assert cache.get('k') is None
+        assert (cache.hits, cache.misses) == (1, 2)
+
+        emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        assert [record['AnswerCacheHit'] for record in emf] == [0, 1, 0]
+        assert emf[1]['AnswerCacheHitRate'] == 50.0
+        assert emf[1]['Backend'] == 'memory'
+
+    def test_memory_evicts_least_recently_used(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.put('a', 1)
+        backend.put('b', 2)
+        backend.get('a')
+        backend.put('c', 3)
+        assert backend.get('b') is None and backend.get('a') == 1
+
+    def test_tmp_round_trip(self, tmp_path):
+        cache = AnswerCache(TmpBackend(str(tmp_path / 'answers')))
+        cache.put('k', {'answer': 'from disk'})
+        assert AnswerCache(TmpBackend(str(tmp_path / 'answers'))).get('k')['answer'] == 'from disk'
+
+    def test_tmp_concurrent_writers(self, tmp_path):
+        backend = TmpBackend(str(tmp_path / 'answers'))
+        threads = [threading.Thread(target=backend.put, args=('k', {'answer': str(i)})) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert backend.get('k')['answer'] in {str(i) for i in range(8)}
+        assert os.listdir(tmp_path / 'answers') == ['k.json']
+
+    def test_s3_round_trip_and_missing_key(self):
+        objects = {}
+        client = Mock()
+        client.put_object.side_effect = lambda Bucket, Key, Body, ContentType: objects.__setitem__(Key, Body)
+
+        def get_object(Bucket, Key):
+            if Key not in objects:
+                raise Exception("An error occurred (NoSuchKey) when calling the GetObject operation")
+            return {'Body': io.BytesIO(objects[Key])}
+        client.get_object.side_effect = get_object
+
+        cache = AnswerCache(S3Backend('bucket', 'answers/', s3_client=client))
+        assert cache.get('k') is None
+        cache.put('k', {'answer': 'shared'})
+        assert 'answers/k.json' in objects
+        assert cache.get('k')['answer'] == 'shared'
+
+
+class TestHandlerCache:
+    """Test that repeat questions skip Lambda 2, the download and Bedrock"""
+
+    @patch('lambda_3.company_names', return_value=COMPANIES)
+    @patch('lambda_3.ask_claude_question')
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_reworded_question_is_served_from_cache(self, mock_url, mock_download, mock_claude, mock_names):
+        mock_claude.side_effect = lambda *args, usage=None: usage.update(output_tokens=9) or "Net sales were $383.3 billion."
+
+        first = json.loads(lambda_handler({"question": "What was AAPL revenue 2023?", "ticker": "AAPL", "year": "2023"}, None)['body'])
+        second = json.loads(lambda_handler({"question": "what was apple's revenue in 2023", "ticker": "AAPL", "year": "2023"}, None)['body'])
+
+        assert mock_url.call_count == 1
+        assert mock_download.call_count == 1
+        assert mock_claude.call_count == 1
+        assert first['answer_source'] == 'filing'
+        assert second['answer_source'] == 'answer_cache'
+        assert second['answer'] == first['answer']
+        assert second['document_size'] == first['document_size']
+
+    @patch('lambda_3.company_names', return_value=COMPANIES)
+    @patch('lambda_3.ask_claude_question', return_value="Sorry, I couldn't process your question. Error: throttled")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_errors_and_opt_out_are_not_cached(self, mock_url, mock_download, mock_claude, mock_names):
+        event = {"question": "What were the supply chain risks?", "ticker": "AAPL", "year": "2023"}
+        lambda_handler(event, None)
+        lambda_handler(event, None)
+        assert mock_claude.call_count == 2
+
+        mock_claude.side_effect = lambda *args, usage=None: usage.update(output_tokens=9) or "Supplier concentration."
+        lambda_handler(dict(event, use_cache=False), None)
+        lambda_handler(event, None)
+        assert mock_claude.call_count == 4
+
+    @patch('lambda_3.company_names', return_value=COMPANIES)
+    @patch('lambda_3.ask_claude_question', return_value="Net income was $26.5 billion.")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_company_found_in_question(self, mock_url, mock_download, mock_claude, mock_names):
+        result = lambda_handler({"question": "What was Bank of America's net income?", "year": "2023"}, None)
+        assert result['statusCode'] == 200
+        assert mock_url.call_args[0][0] == 'BAC'
+        assert lambda_handler({"question": "What was a key risk?", "year": "2023"}, None)['statusCode'] == 400
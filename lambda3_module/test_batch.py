@@ -0,0 +1,166 @@
+# test_batch.py - Tests for multi-question batches over a single filing
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lambda_3
+import retrieval
+from lambda_3 import lambda_handler, merge_contexts, parse_batch_answers
+from token_budget import estimate_tokens
+from test_prompt_cache import FILING_TEXT, FILING_URL, StubBedrock
+
+QUESTIONS = [
+    "What were the main supply chain risks?",
+    "How much was spent on research and development?",
+    "What were total net sales?",
+]
+
+
+class StructuredBedrock(StubBedrock):
+    """Bedrock stub that answers a single-call batch prompt with a JSON array"""
+
+    def __init__(self, reply=None):
+        super().__init__()
+        self.reply = reply
+
+    def invoke_model(self, modelId, body, contentType):
+        request = json.loads(body)
+        self.requests.append(request)
+        count = request['messages'][0]['content'][1]['text'].count('?')
+        reply = self.reply if self.reply is not None else json.dumps([f"Answer {i}" for i in range(1, count + 1)])
+        payload = {'content': [{'text': reply}], 'usage': {'input_tokens': 900, 'output_tokens': 60}}
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+
+def run_batch(**fields):
+    event = {"questions": QUESTIONS, "ticker": "AAPL", "year": "2023"}
+    event.update(fields)
+    result = lambda_handler(event, None)
+    return result['statusCode'], json.loads(result['body'])
+
+
+class TestBatchHelpers:
+    """Test prompt parsing and context merging"""
+
+    def test_parse_batch_answers(self):
+        assert parse_batch_answers('Here you go:\n["a", "b"]', 2) == ["a", "b"]
+        assert parse_batch_answers('["a"]', 2) is None
+        assert parse_batch_answers('no json here', 1) is None
+
+    def test_merge_contexts_interleaves_and_dedupes(self):
+        sep = retrieval.PASSAGE_SEPARATOR
+        merged = merge_contexts([sep.join(["p1", "p2"]), sep.join(["p1", "p3"])], 1000)
+        assert merged.split(sep) == ["p1", "p2", "p3"]
+        assert merge_contexts([sep.join(["p1", "p2"])], estimate_tokens("p1" + sep)) == "p1"
+
+
+class TestBatchHandler:
+    """Test that a batch resolves and downloads the filing once"""
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_concurrent_batch_shares_filing_and_prompt_cache(self, mock_boto, mock_url, mock_download):
+        bedrock = StubBedrock()
+        mock_boto.return_value = bedrock
+
+        status, body = run_batch()
+
+        assert status == 200
+        assert mock_url.call_count == 1
+        assert mock_download.call_count == 1
+        assert len(bedrock.requests) == 3
+        assert body['batch_mode'] == 'concurrent'
+        assert [item['question'] for item in body['answers']] == QUESTIONS
+        assert all(item['answer'].startswith('Answer ') for item in body['answers'])
+        assert all(item['timings']['total_ms'] >= 0 for item in body['answers'])
+        assert {'resolve_ms', 'load_ms', 'answer_ms', 'total_ms'} <= set(body['timings'])
+        # One prompt cache write, then the other questions read the same filing prefix
+        assert len(bedrock.cached_prefixes) == 1
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_concurrent_workers_see_deadline_and_timings(self, mock_url, mock_download):
+        seen = []
+
+        def ask(*args, **kwargs):
+            seen.append((lambda_3.current_deadline().at, lambda_3.current_timings()))
+            return "An answer."
+
+        context = SimpleNamespace(get_remaining_time_in_millis=lambda: 600000, aws_request_id='req-1')
+        with patch('lambda_3.ask_claude_question', side_effect=ask), patch('lambda_3.boto3.client'):
+            result = lambda_handler({"questions": QUESTIONS, "ticker": "AAPL", "year": "2023"}, context)
+
+        assert result['statusCode'] == 200
+        assert len(seen) == len(QUESTIONS)
+        assert all(at is not None and timings is not None for at, timings in seen)
+        assert len({id(timings) for _, timings in seen}) == 1
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_single_call_batch(self, mock_boto, mock_url, mock_download):
+        bedrock = StructuredBedrock()
+        mock_boto.return_value = bedrock
+
+        status, body = run_batch(batch_mode='single_call', context_strategy='retrieval')
+
+        assert status == 200
+        assert len(bedrock.requests) == 1
+        assert bedrock.requests[0]['max_tokens'] == 8192
+        assert body['batch_mode'] == 'single_call'
+        assert [item['answer'] for item in body['answers']] == ["Answer 1", "Answer 2", "Answer 3"]
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_single_call_answers_are_not_cached(self, mock_boto, mock_url, mock_download):
+        bedrock = StructuredBedrock()
+        mock_boto.return_value = bedrock
+
+        run_batch(batch_mode='single_call', context_strategy='retrieval')
+        # The same question on its own must come from its own model, not the batch reply
+        result = lambda_handler({"question": QUESTIONS[0], "ticker": "AAPL", "year": "2023",
+                                 "context_strategy": "retrieval"}, None)
+
+        assert len(bedrock.requests) == 2
+        assert json.loads(result['body'])['answer_source'] != 'answer_cache'
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_malformed_single_call_falls_back_to_concurrent(self, mock_boto, mock_url, mock_download):
+        bedrock = StructuredBedrock(reply="I cannot answer in JSON.")
+        mock_boto.return_value = bedrock
+
+        status, body = run_batch(batch_mode='single_call')
+
+        assert status == 200
+        assert len(bedrock.requests) == 4
+        assert body['batch_mode'] == 'concurrent'
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_repeat_batch_is_served_from_answer_cache(self, mock_boto, mock_url, mock_download):
+        bedrock = StubBedrock()
+        mock_boto.return_value = bedrock
+
+        run_batch()
+        status, body = run_batch()
+
+        assert status == 200
+        assert len(bedrock.requests) == 3
+        assert mock_download.call_count == 1
+        assert {item['answer_source'] for item in body['answers']} == {'answer_cache'}
+        assert 'load_ms' not in body['timings']
+
+    def test_invalid_batches(self):
+        assert run_batch(questions=[])[0] == 400
+        assert run_batch(questions=["What was revenue?", ""])[0] == 400
+        assert run_batch(questions=["What was revenue?"] * 26)[0] == 400
@@ -0,0 +1,183 @@
+# test_deadline.py - Tests for deadline-aware execution in Lambda 3
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import lambda_3
+from deadline import Deadline
+from lambda_3 import get_sec_document_url, lambda_handler, stream_claude_answer
+from test_batch import QUESTIONS, StructuredBedrock
+from test_prompt_cache import StubBedrock
+
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+FILING_TEXT = ("Supply chain risks increased because of concentration in a few outsourcing partners. "
+               "Total net sales were $383.3 billion, compared with $394.3 billion a year earlier. ") * 400
+
+
+def lambda_context(remaining_ms):
+    return SimpleNamespace(get_remaining_time_in_millis=lambda: remaining_ms, aws_request_id='req-1')
+
+
+class TestDeadline:
+    """Test the deadline from the Lambda context and a caller's deadline_ms"""
+
+    def test_from_context(self):
+        assert Deadline.from_context(None).remaining_ms() == float('inf')
+        assert Deadline.from_context(None).timeout(30) == 30
+        deadline = Deadline.from_context(lambda_context(10000), reserve_ms=500)
+        assert 9000 < deadline.remaining_ms() <= 9500
+        # A caller's earlier deadline wins; a later one doesn't extend the Lambda's own
+        soon = int((time.time() + 2) * 1000)
+        assert Deadline.from_context(lambda_context(10000), soon).remaining_ms() <= 2000
+        later = int((time.time() + 60) * 1000)
+        assert Deadline.from_context(lambda_context(10000), later).remaining_ms() <= 9500
+        assert Deadline.from_context(None, 'soon').at is None
+
+    def test_timeout_and_child(self):
+        deadline = Deadline(time.time() + 5)
+        assert 4 < deadline.timeout(30) <= 5
+        assert deadline.timeout(2) == 2
+        assert Deadline(time.time() - 1).timeout(30) == 1.0
+        assert Deadline(time.time() - 1).expired()
+        # The child keeps the reserve for later stages but never gets less than half the time left
+        assert 2.9 < Deadline(time.time() + 5).child(2000).remaining_ms() / 1000 <= 3
+        assert 2.4 < Deadline(time.time() + 5).child(10000).remaining_ms() / 1000 <= 2.5
+        assert Deadline().child(1000).at is None
+
+
+class TestDeadlineHandler:
+    """Test that Lambda 3 sizes its work to the time left instead of timing out"""
+
+    def test_lambda2_payload_carries_deadline(self):
+        lambda_client = Mock()
+        lambda_client.invoke.return_value = {'Payload': Mock(read=Mock(return_value=json.dumps(
+            {'statusCode': 200, 'body': json.dumps({'filing_url': FILING_URL})})))}
+        with patch('lambda_3.boto3.client', return_value=lambda_client) as mock_boto, \
+                patch('deadline._current_deadline') as current:
+            current.get.return_value = Deadline(time.time() + 20)
+            assert get_sec_document_url('AAPL', 2023, "What was revenue?") == FILING_URL
+
+        payload = json.loads(lambda_client.invoke.call_args.kwargs['Payload'])
+        # 10 s are kept back for the download and Bedrock call
+        assert 9000 < payload['deadline_ms'] - time.time() * 1000 <= 10000
+        assert mock_boto.call_args.kwargs['config'].read_timeout <= 20
+
+    @patch('lambda_3.ask_claude_question', return_value="An answer.")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_short_deadline_shrinks_context_and_answer(self, mock_url, mock_download, mock_claude):
+        event = {"question": "Why did supply chain risks increase?", "ticker": "AAPL", "year": "2023"}
+        full = json.loads(lambda_handler(event, lambda_context(600000))['body'])
+        short = json.loads(lambda_handler(dict(event, use_cache=False), lambda_context(6000))['body'])
+
+        assert full['degraded'] == []
+        assert short['degraded'] == ['smaller_context', 'shorter_answer']
+        assert short['context_tokens'] < full['context_tokens']
+        assert mock_claude.call_args.args[7] < 3000
+
+    @patch('lambda_3.ask_claude_question')
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_degraded_answer_not_cached(self, mock_url, mock_download, mock_claude):
+        def ask(*args, usage=None, **kwargs):
+            usage.update(input_tokens=900, output_tokens=40)
+            return "An answer."
+        mock_claude.side_effect = ask
+        event = {"question": "Why did supply chain risks increase?", "ticker": "AAPL", "year": "2023"}
+        assert json.loads(lambda_handler(event, lambda_context(6000))['body'])['degraded']
+        assert json.loads(lambda_handler(event, lambda_context(600000))['body'])['answer_source'] == 'filing'
+        assert mock_claude.call_count == 2
+
+    @patch('lambda_3.ask_claude_question', return_value="An answer.")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_no_time_for_bedrock_returns_passages(self, mock_url, mock_download, mock_claude):
+        event = {"question": "Why did supply chain risks increase?", "ticker": "AAPL", "year": "2023"}
+        body = json.loads(lambda_handler(event, lambda_context(1500))['body'])
+
+        assert body['answer_source'] == 'deadline_partial'
+        assert body['degraded'] == ['no_time_for_model']
+        assert "Supply chain risks increased" in body['answer']
+        mock_claude.assert_not_called()
+        # The passages aren't cached as the answer
+        assert json.loads(lambda_handler(event, lambda_context(600000))['body'])['answer'] == "An answer."
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_single_call_batch_fits_deadline(self, mock_boto, mock_url, mock_download):
+        bedrock = StructuredBedrock()
+        mock_boto.return_value = bedrock
+        event = {"questions": QUESTIONS, "ticker": "AAPL", "year": "2023", "batch_mode": "single_call",
+                 "context_strategy": "retrieval", "use_cache": False}
+
+        body = json.loads(lambda_handler(event, lambda_context(60000))['body'])
+        assert body['batch_mode'] == 'single_call'
+        assert bedrock.requests[0]['max_tokens'] < 8192
+        assert all('shorter_answer' in item['degraded'] for item in body['answers'])
+
+        # Too little time for one call to answer all three: each question gets its own call
+        body = json.loads(lambda_handler(event, lambda_context(8000))['body'])
+        assert body['batch_mode'] == 'concurrent'
+        assert len(bedrock.requests) == 1 + len(QUESTIONS)
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_concurrent_calls_refit_to_time_left(self, mock_boto, mock_url, mock_download):
+        class SlowBedrock(StubBedrock):
+            """The first call (the prompt cache write) uses up all but left_ms of the time"""
+            def __init__(self, left_ms):
+                super().__init__()
+                self.left_ms = left_ms
+
+            def invoke_model(self, **kwargs):
+                if not self.requests:
+                    lambda_3.current_deadline().at = time.time() + self.left_ms / 1000
+                return super().invoke_model(**kwargs)
+
+        event = {"questions": QUESTIONS, "ticker": "AAPL", "year": "2023", "use_cache": False}
+        mock_boto.return_value = bedrock = SlowBedrock(8000)
+        body = json.loads(lambda_handler(event, lambda_context(600000))['body'])
+        first, *rest = body['answers']
+        assert first['degraded'] == []
+        assert all('smaller_context' in item['degraded'] for item in rest)
+        assert all(item['context_tokens'] < first['context_tokens'] for item in rest)
+        assert len(bedrock.requests) == len(QUESTIONS)
+        # Each call's client times out at the deadline as it stood when the call started
+        assert [call.kwargs['config'].read_timeout <= 8 for call in mock_boto.call_args_list[-2:]] == [True, True]
+
+        mock_boto.return_value = bedrock = SlowBedrock(1500)
+        body = json.loads(lambda_handler(event, lambda_context(600000))['body'])
+        assert len(bedrock.requests) == 1
+        assert [item['answer_source'] for item in body['answers'][1:]] == ['deadline_partial', 'deadline_partial']
+        assert "Supply chain risks increased" in body['answers'][1]['answer']
+
+    @patch('lambda_3.download_sec_document', return_value=None)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_download_out_of_time_is_504(self, mock_url, mock_download):
+        result = lambda_handler({"question": "Why?", "ticker": "AAPL", "year": "2023"}, lambda_context(100))
+        assert result['statusCode'] == 504
+
+    @patch('lambda_3.boto3.client')
+    def test_stream_cut_short_at_deadline(self, mock_boto):
+        messages = [{'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': text}} for text in ("Net", " sales")]
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.return_value = {
+            'body': [{'chunk': {'bytes': json.dumps(m).encode()}} for m in messages]}
+        mock_boto.return_value = bedrock
+        # The deadline passes after the first chunk
+        deadline = SimpleNamespace(at=None, expired=Mock(side_effect=[False, True]))
+
+        stats = {}
+        with patch('lambda_3.current_deadline', return_value=deadline):
+            chunks = list(stream_claude_answer("Q?", "text", "AAPL", 2023, "Annual", stats=stats))
+
+        assert chunks[0] == "Net" and "ran out of time" in chunks[-1]
+        assert " sales" not in chunks
+        assert stats['deadline_truncated'] is True
@@ -1,4 +1,5 @@
 # test_lambda_3.py - Comprehensive tests for Lambda 3 (SEC Question Answering)
+import io
 import json
 import pytest
 from unittest.mock import Mock, patch, MagicMock
@@ -8,6 +9,7 @@ import os
 # Add the current directory to Python path so we can import lambda_3
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+import lambda_3
 from lambda_3 import (
     determine_filing_type,
     get_sec_document_url,
@@ -69,6 +71,20 @@ class TestFilingTypeDetection:
 class TestLambdaIntegration:
     """Test Lambda 2 integration"""
     
+    def test_client_factory(self):
+        """Test that an injected client factory replaces boto3.client"""
+        fake_lambda = Mock()
+        fake_lambda.invoke.return_value = {'Payload': io.BytesIO(json.dumps({
+            'statusCode': 200, 'body': json.dumps({'filing_url': 'https://stand-in-url.com'})}).encode())}
+        services = []
+        lambda_3.set_client_factory(lambda service_name, **kwargs: services.append(service_name) or fake_lambda)
+        try:
+            with patch('lambda_3.boto3.client', side_effect=AssertionError('boto3 used')):
+                assert get_sec_document_url("AAPL", 2023, "What was revenue in 2023?") == 'https://stand-in-url.com'
+        finally:
+            lambda_3.set_client_factory(None)
+        assert services == ['lambda']
+
     @patch('lambda_3.boto3.client')
     def test_get_sec_document_url_success(self, mock_boto):
         """Test successful SEC document URL retrieval"""
@@ -174,22 +190,37 @@ class TestDocumentDownload:
         
         result = download_sec_document("https://invalid-url.com")
         assert result is None
-    
+
+    @patch('lambda_3.requests.get')
+    def test_download_sec_document_base_url(self, mock_get):
+        """Test that a base URL override fetches SEC documents from the stand-in server"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = b'<html><body>Replayed filing</body></html>'
+        mock_get.return_value = mock_response
+
+        filing_url = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+        assert download_sec_document(filing_url, base_url="http://127.0.0.1:8765/") == "Replayed filing"
+        assert mock_get.call_args[0][0] == \
+            "http://127.0.0.1:8765/www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+
     @patch('lambda_3.requests.get')
     def test_download_sec_document_large_content(self, mock_get):
         """Test that large documents are truncated"""
         mock_response = Mock()
         mock_response.status_code = 200
-        # Create content larger than 40000 characters
-        large_content = "<html><body>" + "A" * 50000 + "</body></html>"
+        # Create content larger than MAX_DOCUMENT_CHARS
+        large_content = "<html><body>" + "A" * (lambda_3.MAX_DOCUMENT_CHARS + 10000) + "</body></html>"
         mock_response.content = large_content.encode()
         mock_get.return_value = mock_response
         
         result = download_sec_document("https://large-doc.com")
         
-        # Should be truncated to 40000 characters or less
+        # Should be truncated to MAX_DOCUMENT_CHARS
         assert result is not None
-        assert len(result) <= 40000
+        assert len(result) == lambda_3.MAX_DOCUMENT_CHARS
+        # The indexed path asks for the full text
+        assert len(download_sec_document("https://large-doc.com", max_chars=None)) == lambda_3.MAX_DOCUMENT_CHARS + 10000
 
 class TestClaudeIntegration:
     """Test Claude Sonnet 4 integration"""
@@ -223,7 +254,7 @@ class TestClaudeIntegration:
         # Verify the model call
         mock_bedrock.invoke_model.assert_called_once()
         call_args = mock_bedrock.invoke_model.call_args
-        assert call_args[1]['modelId'] == "anthropic.claude-4-sonnet-20241022-v1:0"
+        assert call_args[1]['modelId'] == lambda_3.MODEL_ID
     
     @patch('lambda_3.boto3.client')
     def test_ask_claude_question_quarterly(self, mock_boto):
@@ -311,7 +342,9 @@ class TestLambdaHandler:
         assert body['company'] == 'AAPL'
         assert body['year'] == 2023
         assert body['filing_type'] == 'Annual'
-        assert body['model_used'] == 'Claude Sonnet 4 v1'
+        # Numeric lookups are routed to the smaller model
+        assert body['model_used'] == 'Claude 3.5 Haiku'
+        assert body['route'] == 'numeric_lookup'
         assert 'Apple\'s revenue' in body['answer']
     
     @patch('lambda_3.get_sec_document_url')
@@ -0,0 +1,172 @@
+# test_metrics.py - Tests for per-stage timings and their EMF output
+import json
+from unittest.mock import Mock, patch
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+from lambda_3 import lambda_handler
+from metrics import Timings, count, export_trace, start_timings, timed, trace_events, with_timings
+
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/789019/000095017023054855/msft-20230930.htm"
+
+
+class TestTimings:
+    """Test stage timers, counters and the timings block"""
+
+    def test_stages_counters_and_sources(self):
+        timings = Timings()
+        timings.add_ms('lookup', 1.25)
+        timings.add_ms('lookup', 2.0)
+        timings.count('document_bytes', 2048, 'Bytes')
+        timings.include({'index_load_ms': 4.0, 'overflow_pages': 2})
+        timings.nested['lambda2'] = {'total_ms': 9.0}
+
+        block = timings.as_dict()
+        assert block['lookup_ms'] == 3.2
+        assert block['index_load_ms'] == 4.0
+        assert block['document_bytes'] == 2048
+        assert block['overflow_pages'] == 2
+        assert block['lambda2'] == {'total_ms': 9.0}
+        assert 'total_ms' in block
+
+    def test_helpers_outside_an_invocation_do_nothing(self):
+        token = metrics._current_timings.set(None)
+        try:
+            with timed('anything'):
+                pass
+            count('anything')
+        finally:
+            metrics._current_timings.reset(token)
+
+    def test_emit_and_with_timings(self, capsys):
+        timings = start_timings()
+        with timed('document_download'):
+            pass
+        count('input_tokens', 1200)
+
+        record = timings.emit({'Handler': 'lambda3'})
+        names = [metric['Name'] for metric in record['_aws']['CloudWatchMetrics'][0]['Metrics']]
+        assert names == ['DocumentDownloadDuration', 'InputTokens', 'TotalDuration']
+        assert json.loads(capsys.readouterr().out)['Handler'] == 'lambda3'
+
+        response = with_timings({'statusCode': 200, 'body': json.dumps({'answer': 'x'})}, timings)
+        assert json.loads(response['body'])['timings']['input_tokens'] == 1200
+        assert with_timings({'statusCode': 200, 'body': 'not json'}, timings)['body'] == 'not json'
+
+
+class TestTrace:
+    """Test span trees, trace context propagation and export"""
+
+    def test_spans_nest_by_stage_and_time(self):
+        timings = Timings('lambda2', {'trace_id': 'a' * 32, 'parent_span_id': 'caller'})
+        edgar_spans = []
+        with timings.stage('filing_lookup'):
+            started = time.perf_counter()
+            edgar_spans.append(('submissions_fetch', started, time.perf_counter()))
+            context = timings.trace_context()
+        time.sleep(0.002)
+        timings.add_ms('cik_lookup', 0.5)
+        timings.include({}, edgar_spans)
+
+        tree = timings.trace()
+        assert (tree['name'], tree['trace_id'], tree['parent_id']) == ('lambda2', 'a' * 32, 'caller')
+        lookup = tree['children'][0]
+        assert [child['name'] for child in tree['children']] == ['filing_lookup', 'cik_lookup']
+        assert [child['name'] for child in lookup['children']] == ['submissions_fetch']
+        assert context == {'trace_id': 'a' * 32, 'parent_span_id': lookup['span_id']}
+
+    def test_graft_and_export(self, tmp_path):
+        caller = Timings('lambda3')
+        with caller.stage('lambda2_invoke'):
+            callee = Timings('lambda2', caller.trace_context())
+            with callee.stage('cik_lookup'):
+                pass
+            caller.graft(callee.trace())
+        caller.graft(Timings('other').trace())
+
+        tree = caller.trace()
+        invoke = tree['children'][0]
+        assert [child['name'] for child in invoke['children']] == ['lambda2']
+        assert len(tree['children']) == 1
+
+        path = export_trace(tree, str(tmp_path / 'traces' / f"{caller.trace_id}.json"))
+        exported = json.load(open(path))
+        assert exported['spans']['trace_id'] == caller.trace_id
+        threads = {event['name']: event['tid'] for event in trace_events(tree)}
+        assert threads == {'lambda3': 'lambda3', 'lambda2_invoke': 'lambda3', 'lambda2': 'lambda2', 'cik_lookup': 'lambda2'}
+
+
+class TestHandlerTimings:
+    """Test the timings block and EMF record of Lambda 3 responses"""
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_handler_reports_stages(self, mock_boto, mock_url, mock_download, capsys):
+        bedrock = Mock()
+        bedrock.invoke_model.return_value = {'body': Mock(read=Mock(return_value=json.dumps({
+            'content': [{'text': "$56.5 billion"}],
+            'usage': {'input_tokens': 900, 'output_tokens': 12},
+        })))}
+        mock_boto.return_value = bedrock
+
+        result = lambda_handler({"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023"}, None)
+
+        timings = json.loads(result['body'])['timings']
+        for key in ('lambda2_invoke_ms', 'index_build_ms', 'context_planning_ms', 'bedrock_ms', 'total_ms'):
+            assert key in timings
+        assert (timings['input_tokens'], timings['output_tokens']) == (900, 12)
+
+        records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        handler_record = [record for record in records if record.get('Handler') == 'lambda3'][-1]
+        assert handler_record['BedrockDuration'] == timings['bedrock_ms']
+        assert handler_record['OutputTokens'] == 12
+        assert handler_record['TraceId'] == json.loads(result['body'])['trace']['trace_id']
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.boto3.client')
+    def test_lambda2_joins_the_trace(self, mock_boto, mock_download):
+        lambda2_body = {'filing_url': FILING_URL}
+
+        def invoke(FunctionName, Payload):
+            context = json.loads(Payload)['trace']
+            callee = Timings('lambda2', context)
+            with callee.stage('cik_lookup'):
+                pass
+            body = dict(lambda2_body, trace=callee.trace())
+            return {'Payload': Mock(read=Mock(return_value=json.dumps({'statusCode': 200, 'body': json.dumps(body)})))}
+
+        lambda_client = Mock()
+        lambda_client.invoke.side_effect = invoke
+        bedrock = Mock()
+        bedrock.invoke_model.return_value = {'body': Mock(read=Mock(return_value=json.dumps({
+            'content': [{'text': "$56.5 billion"}], 'usage': {'input_tokens': 900, 'output_tokens': 12},
+        })))}
+        mock_boto.side_effect = lambda service, **kwargs: {'lambda': lambda_client, 'bedrock-runtime': bedrock}[service]
+
+        event = {"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023",
+                 "trace": {"trace_id": "b" * 32, "parent_span_id": "api"}}
+        trace = json.loads(lambda_handler(event, None)['body'])['trace']
+
+        assert (trace['trace_id'], trace['parent_id']) == ("b" * 32, "api")
+        invoke_span = [child for child in trace['children'] if child['name'] == 'lambda2_invoke'][0]
+        assert [child['name'] for child in invoke_span['children']] == ['lambda2']
+        assert invoke_span['children'][0]['parent_id'] == invoke_span['span_id']
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.ask_claude_question', return_value="$56.5 billion")
+    def test_trace_export_dir(self, mock_claude, mock_url, mock_download, tmp_path):
+        with patch('lambda_3.TRACE_EXPORT_DIR', str(tmp_path)):
+            result = lambda_handler({"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023"}, None)
+        trace_id = json.loads(result['body'])['trace']['trace_id']
+        assert json.load(open(tmp_path / f"{trace_id}.json"))['spans']['trace_id'] == trace_id
+
+    def test_error_responses_carry_timings(self):
+        result = lambda_handler({"ticker": "MSFT", "year": "2023"}, None)
+        assert result['statusCode'] == 400
+        assert 'total_ms' in json.loads(result['body'])['timings']
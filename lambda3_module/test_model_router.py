@@ -0,0 +1,97 @@
+# test_model_router.py - Tests for question classification and model routing
+import io
+import json
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import model_router
+from model_router import HAIKU, SONNET, classify_question, load_routes, route_question
+from lambda_3 import lambda_handler
+from test_prompt_cache import FILING_TEXT, FILING_URL
+
+
+class RecordingBedrock:
+    """Bedrock stub that records the model and max_tokens of each call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke_model(self, modelId, body, contentType):
+        self.calls.append((modelId, json.loads(body)['max_tokens']))
+        payload = {'content': [{'text': "An answer."}], 'usage': {'input_tokens': 2000, 'output_tokens': 12}}
+        return {'body': io.BytesIO(json.dumps(payload).encode())}
+
+
+class TestClassification:
+    """Test the three question classes"""
+
+    def test_classes(self):
+        assert classify_question("What was total revenue in 2023?") == 'numeric_lookup'
+        assert classify_question("How much did Amazon invest in Anthropic?") == 'numeric_lookup'
+        assert classify_question("How did revenue change compared to last year?") == 'comparison'
+        assert classify_question("What was net income in 2022 and 2023?") == 'comparison'
+        assert classify_question("Why did revenue grow?") == 'explanation'
+        assert classify_question("What are the main risk factors?") == 'explanation'
+
+    def test_routes(self):
+        assert route_question("What was total revenue in 2023?").model_id == HAIKU
+        assert route_question("What was total revenue in 2023?").latency_tier == 'fast'
+        assert route_question("Why did revenue grow?").model_id == SONNET
+
+    def test_overrides(self):
+        routes = load_routes({'numeric_lookup': {'model_id': SONNET, 'max_tokens': 300}, 'summary': {'max_tokens': 4000}})
+        assert routes['numeric_lookup'] == (('numeric_lookup', SONNET, SONNET, 300, 'fast'))
+        assert routes['summary'].model_id == SONNET and routes['summary'].max_tokens == 4000
+        with patch.dict(os.environ, {'MODEL_ROUTES': 'not json'}):
+            assert load_routes() == load_routes({})
+
+
+class TestHandlerRouting:
+    """Test that the routed model and max_tokens reach Bedrock and are recorded"""
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_lookup_goes_to_small_model(self, mock_boto, mock_url, mock_download, capsys):
+        bedrock = RecordingBedrock()
+        mock_boto.return_value = bedrock
+
+        lookup = json.loads(lambda_handler({"question": "What was total revenue in 2023?", "ticker": "AAPL", "year": "2023"}, None)['body'])
+        why = json.loads(lambda_handler({"question": "Why did supply chain risk grow?", "ticker": "AAPL", "year": "2023"}, None)['body'])
+
+        assert bedrock.calls == [(HAIKU, 500), (SONNET, 3000)]
+        assert (lookup['route'], lookup['model_used']) == ('numeric_lookup', 'Claude 3.5 Haiku')
+        assert (why['route'], why['model_used']) == ('explanation', 'Claude 3.5 Sonnet')
+
+        emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        routed = [record for record in emf if 'RouteLatency' in record]
+        assert [(record['Route'], record['RouteOutputTokens']) for record in routed] == [('numeric_lookup', 12), ('explanation', 12)]
+
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_route_table_override(self, mock_boto, mock_url, mock_download):
+        bedrock = RecordingBedrock()
+        mock_boto.return_value = bedrock
+
+        routes = load_routes({'numeric_lookup': {'model_id': SONNET, 'label': 'Claude 3.5 Sonnet', 'max_tokens': 200}})
+        with patch.object(model_router, 'ROUTES', routes):
+            lambda_handler({"question": "What was total revenue in 2023?", "ticker": "AAPL", "year": "2023"}, None)
+
+        assert bedrock.calls == [(SONNET, 200)]
+
+    @patch('lambda_3.ask_claude_question', return_value="An answer.")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT * 40)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_route_latency_tier_sizes_context(self, mock_url, mock_download, mock_claude):
+        event = {"question": "Why did supply chain risk grow?", "ticker": "AAPL", "year": "2023",
+                 "context_strategy": "retrieval", "use_cache": False}
+        context_tokens = {}
+        for tier in ('fast', 'standard', 'thorough'):
+            with patch.object(model_router, 'ROUTES', load_routes({'explanation': {'latency_tier': tier}})):
+                context_tokens[tier] = json.loads(lambda_handler(event, None)['body'])['context_tokens']
+
+        assert context_tokens['fast'] < context_tokens['standard'] < context_tokens['thorough']
@@ -0,0 +1,85 @@
+# test_profiling.py - Tests for the opt-in cProfile/tracemalloc hook
+import json
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import profiling
+from metrics import start_timings
+from profiling import profile_modes, profiled
+
+
+@profiled('test')
+def handler(event, context):
+    start_timings('test')
+    return {'statusCode': 200, 'body': json.dumps({'total': sum(len(str(n)) for n in range(20000))})}
+
+
+@profiled('outer')
+def outer_handler(event, context):
+    return handler(event, context)
+
+
+class TestProfileModes:
+    """Test event flags, PROFILE_MODE and sampling"""
+
+    def test_event_flag(self):
+        assert profile_modes({'profile': True}) == ('cpu', 'memory')
+        assert profile_modes({'profile': 'memory'}) == ('memory',)
+        assert profile_modes({'profile': 'CPU, memory'}) == ('cpu', 'memory')
+        assert profile_modes({}) == ()
+        assert profile_modes(None) == ()
+
+    def test_sampled_environment_mode(self):
+        with patch.object(profiling, 'PROFILE_MODE', 'cpu'), patch.object(profiling, 'PROFILE_SAMPLE_RATE', 0.01):
+            with patch('profiling.random.random', return_value=0.005):
+                assert profile_modes({}) == ('cpu',)
+            with patch('profiling.random.random', return_value=0.5):
+                assert profile_modes({}) == ()
+            # An event flag profiles regardless of the sample
+            with patch('profiling.random.random', return_value=0.5):
+                assert profile_modes({'profile': 'memory'}) == ('memory',)
+
+
+class TestProfiledHandler:
+    """Test the reports written around a handler"""
+
+    def test_report_written_with_request_id(self, tmp_path):
+        context = SimpleNamespace(aws_request_id='req-123')
+        with patch.object(profiling, 'PROFILE_OUTPUT', str(tmp_path)):
+            result = handler({'profile': True}, context)
+
+        assert result['statusCode'] == 200
+        report = json.load(open(tmp_path / 'test' / 'req-123.json'))
+        assert report['modes'] == ['cpu', 'memory']
+        assert report['trace_id']
+        assert report['memory']['peak_bytes'] > 0
+        assert report['memory']['top_allocations']
+        functions = [row['function'] for row in report['cpu']['top_functions']]
+        assert 'handler' in functions
+        assert (tmp_path / 'test' / 'req-123.prof').exists()
+
+    def test_unprofiled_and_nested_calls(self, tmp_path):
+        with patch.object(profiling, 'PROFILE_OUTPUT', str(tmp_path)):
+            handler({}, None)
+            assert not (tmp_path / 'test').exists()
+            # The in-process inner handler isn't profiled a second time
+            outer_handler({'profile': 'cpu'}, SimpleNamespace(aws_request_id='req-1'))
+        assert (tmp_path / 'outer' / 'req-1.json').exists()
+        assert not (tmp_path / 'test').exists()
+
+    def test_s3_output_and_write_errors(self):
+        s3 = Mock()
+        with patch.object(profiling, 'PROFILE_OUTPUT', 's3://profiles-bucket/lambda'), \
+                patch('profiling.boto3.client', return_value=s3):
+            handler({'profile': 'cpu'}, SimpleNamespace(aws_request_id='req-9'))
+        keys = [call.kwargs['Key'] for call in s3.put_object.call_args_list]
+        assert keys == ['lambda/test/req-9.json', 'lambda/test/req-9.prof']
+
+        s3.put_object.side_effect = RuntimeError("denied")
+        with patch.object(profiling, 'PROFILE_OUTPUT', 's3://profiles-bucket'), \
+                patch('profiling.boto3.client', return_value=s3):
+            assert handler({'profile': 'memory'}, None)['statusCode'] == 200
@@ -0,0 +1,55 @@
+# test_question_parser.py - Tests for the one-pass question parser
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from model_router import classify_question
+from question_parser import parse_question
+from lambda_3 import determine_filing_type
+
+
+class TestFilingIntent:
+    """Test form type and quarter detection"""
+
+    def test_quarters(self):
+        assert parse_question("What was revenue in Q3 2023?")[:3] == ('10-Q', 'Quarter', '3')
+        assert parse_question("Fourth quarter sales")[:3] == ('10-Q', 'Quarter', '4')
+        assert parse_question("What changed in the 2nd fiscal quarter?").quarter == '2'
+        # The first quarter named wins, as with the old keyword order
+        assert parse_question("Compare Q2 with Q1").quarter == '2'
+        assert parse_question("Summarize the 10-Q").quarter == '1'
+        assert parse_question("What are the quarterly earnings?").quarter == '1'
+        # Capitalised quarter words after a company name aren't swallowed into the name
+        assert parse_question("What was Apple First Quarter revenue?").quarter == '1'
+
+    def test_annual(self):
+        assert parse_question("What was the full year revenue?")[:3] == ('10-K', 'Annual', None)
+        assert parse_question("Summarize the 10-K").form == '10-K'
+        # Substrings of other words no longer look like quarters
+        assert determine_filing_type("Where are the company headquarters?") == ("Annual", None)
+        assert determine_filing_type("What did the HQ1 campus cost?") == ("Annual", None)
+
+
+class TestYearsAndCompanies:
+    """Test fiscal year and company mention extraction"""
+
+    def test_years(self):
+        intent = parse_question("Compare FY23 and FY2022 net income for MSFT")
+        assert intent.fiscal_year == 2023 and intent.years == (2023, 2022)
+        assert parse_question("What was EPS in fiscal year 2021?").fiscal_year == 2021
+        assert parse_question("What was revenue in 2019 and 2020?").fiscal_year == 2019
+        assert parse_question("What was revenue?").fiscal_year is None
+
+    def test_company_mentions(self):
+        assert parse_question("What was Apple's total revenue in 2023?").company_mentions == ('Apple',)
+        assert parse_question("Compare FY23 and FY2022 net income for MSFT").company_mentions == ('MSFT',)
+        assert parse_question("What was Bank of America's EPS?").company_mentions == ('Bank of America',)
+        assert parse_question("Compare JPMorgan Chase & Co and Wells Fargo revenue").company_mentions == \
+            ('JPMorgan Chase & Co', 'Wells Fargo')
+        # Finance vocabulary and question words are not companies
+        assert parse_question("What was the EPS and GAAP net income in Q2?").company_mentions == ()
+
+    def test_router_uses_intent_years(self):
+        question = "How did FY22 and FY23 revenue differ?"
+        assert classify_question(question, parse_question(question)) == 'comparison'
@@ -0,0 +1,110 @@
+# test_retrieval.py - Tests for BM25 passage retrieval used to build Claude's context
+import json
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import retrieval
+from retrieval import PASSAGE_SEPARATOR, BM25Index, chunk_text, tokenize
+from token_budget import estimate_tokens
+from lambda_3 import accession_from_url, lambda_handler
+
+FILLER = "The Company designs, manufactures and markets consumer electronics worldwide. " * 40
+
+SAMPLE_FILING = (
+    FILLER
+    + "Total net sales were $383.3 billion for fiscal 2023, a decrease of 3% from fiscal 2022. "
+    + FILLER
+    + "Research and development expense was $29.9 billion during 2023. "
+    + FILLER
+)
+
+
+class TestChunking:
+    """Test passage splitting"""
+
+    def test_chunks_cover_text_with_overlap(self):
+        passages = chunk_text(SAMPLE_FILING, chunk_chars=500, overlap=100)
+        assert len(passages) > 1
+        assert all(len(p) <= 500 for p in passages)
+        # Every sentence of interest survives chunking intact
+        assert any("$383.3 billion" in p for p in passages)
+        assert any("$29.9 billion" in p for p in passages)
+
+    def test_short_and_empty_text(self):
+        assert chunk_text("") == []
+        assert chunk_text("Revenue grew.") == ["Revenue grew."]
+
+    def test_tokenize_drops_stop_words_and_keeps_numbers(self):
+        assert tokenize("What was the revenue in 2023, $383.3 billion?") == ['revenue', '2023', '383.3', 'billion']
+
+
+class TestBM25Index:
+    """Test scoring and context selection"""
+
+    def test_most_relevant_passage_ranks_first(self):
+        index = BM25Index(chunk_text(SAMPLE_FILING, chunk_chars=500, overlap=100))
+        best = index.top_passages("What were total net sales?", top_k=1)
+        assert len(best) == 1
+        assert "Total net sales" in best[0]
+
+        best = index.top_passages("research and development expense", top_k=1)
+        assert "Research and development" in best[0]
+
+    def test_context_respects_token_budget(self):
+        index = BM25Index(chunk_text(SAMPLE_FILING, chunk_chars=500, overlap=100))
+        context = index.build_context("net sales", top_k=50, token_budget=300)
+        assert estimate_tokens(context) <= 300
+        assert "Total net sales" in context
+
+    def test_large_budget_is_not_capped_at_a_passage_count(self):
+        index = BM25Index(chunk_text(SAMPLE_FILING + FILLER * 40))
+        passages = index.top_passages("net sales", token_budget=25000)
+        assert len(passages) > 16
+        assert estimate_tokens(PASSAGE_SEPARATOR.join(passages)) <= 25000
+        assert len(index.top_passages("net sales", top_k=3, token_budget=25000)) == 3
+
+    def test_unmatched_question_falls_back_to_document_start(self):
+        index = BM25Index(chunk_text(SAMPLE_FILING, chunk_chars=500, overlap=100))
+        passages = index.top_passages("zzzz qqqq", top_k=2)
+        assert passages == index.passages[:2]
+
+    def test_empty_index(self):
+        index = BM25Index([])
+        assert index.build_context("revenue") == ""
+
+
+class TestIndexCache:
+    """Test per-accession caching of filing indexes"""
+
+    def test_accession_from_url(self):
+        url = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+        assert accession_from_url(url) == "000032019323000106"
+        assert accession_from_url("https://test-sec-url.com") == "https://test-sec-url.com"
+
+    def test_cache_evicts_oldest(self):
+        for i in range(retrieval.INDEX_CACHE_SIZE + 1):
+            retrieval.build_index(f"acc-{i}", SAMPLE_FILING)
+        assert retrieval.get_cached_index("acc-0") is None
+        assert retrieval.get_cached_index(f"acc-{retrieval.INDEX_CACHE_SIZE}") is not None
+
+    @patch('lambda_3.ask_claude_question')
+    @patch('lambda_3.download_sec_document')
+    @patch('lambda_3.get_sec_document_url')
+    def test_follow_up_question_skips_download(self, mock_get_url, mock_download, mock_claude):
+        mock_get_url.return_value = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+        mock_download.return_value = SAMPLE_FILING + FILLER * 20
+        mock_claude.return_value = "Net sales were $383.3 billion."
+
+        for question in ["What were total net sales?", "What was research and development expense?"]:
+            result = lambda_handler({"question": question, "ticker": "AAPL", "year": "2023"}, None)
+            assert result['statusCode'] == 200
+
+        mock_download.assert_called_once()
+        body = json.loads(result['body'])
+        assert body['document_size'] > body['context_size']
+        # Claude only sees the selected passages, not the whole filing
+        context_sent = mock_claude.call_args[0][1]
+        assert "Research and development" in context_sent
@@ -0,0 +1,126 @@
+# test_streaming.py - Tests for Bedrock response streaming in Lambda 3
+import json
+from unittest.mock import Mock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from lambda_3 import stream_claude_answer, stream_answer, lambda_handler
+
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/789019/000095017023054855/msft-20230930.htm"
+
+
+def stream_events(chunks, input_tokens=1200, output_tokens=6):
+    """Build the event stream shape returned by invoke_model_with_response_stream"""
+    messages = [{'type': 'message_start', 'message': {'usage': {'input_tokens': input_tokens}}}]
+    messages += [{'type': 'content_block_delta', 'delta': {'type': 'text_delta', 'text': text}} for text in chunks]
+    messages += [{'type': 'message_delta', 'usage': {'output_tokens': output_tokens}}, {'type': 'message_stop'}]
+    return {'body': [{'chunk': {'bytes': json.dumps(m).encode()}} for m in messages]}
+
+
+def mock_clients(bedrock, lambda_client=None, websocket=None):
+    clients = {'bedrock-runtime': bedrock, 'lambda': lambda_client, 'apigatewaymanagementapi': websocket}
+    return lambda service, **kwargs: clients[service]
+
+
+class TestStreamClaudeAnswer:
+    """Test chunk relay and streaming metrics"""
+
+    @patch('lambda_3.boto3.client')
+    def test_yields_chunks_and_records_metrics(self, mock_boto):
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.return_value = stream_events(["Revenue ", "was ", "$56.5 billion."])
+        mock_boto.side_effect = mock_clients(bedrock)
+
+        stats = {}
+        chunks = list(stream_claude_answer("What was revenue?", "context", "MSFT", 2023, "Quarter", "1", stats=stats))
+
+        assert chunks == ["Revenue ", "was ", "$56.5 billion."]
+        assert stats['input_tokens'] == 1200
+        assert stats['output_tokens'] == 6
+        assert stats['time_to_first_token_ms'] >= 0
+        assert 'tokens_per_second' in stats
+        bedrock.invoke_model.assert_not_called()
+
+    @patch('lambda_3.boto3.client')
+    def test_stream_error_yields_message(self, mock_boto):
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.side_effect = Exception("throttled")
+        mock_boto.side_effect = mock_clients(bedrock)
+
+        chunks = list(stream_claude_answer("q", "context", "MSFT", 2023, "Annual"))
+        assert len(chunks) == 1
+        assert "throttled" in chunks[0]
+
+
+class TestStreamingHandler:
+    """Test the generator API and the stream flag on lambda_handler"""
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_generator_api(self, mock_boto, mock_url, mock_download):
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.return_value = stream_events(["$56.5", " billion"])
+        mock_boto.side_effect = mock_clients(bedrock)
+
+        stats = {}
+        event = {"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023"}
+        assert "".join(stream_answer(event, stats)) == "$56.5 billion"
+        assert stats['statusCode'] == 200
+
+        stats = {}
+        assert list(stream_answer({"ticker": "MSFT", "year": "2023"}, stats)) == ["Please provide a question"]
+        assert stats['statusCode'] == 400
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_stream_flag_relays_to_websocket_and_keeps_buffered_shape(self, mock_boto, mock_url, mock_download):
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.return_value = stream_events(["$56.5", " billion"])
+        websocket = Mock()
+        mock_boto.side_effect = mock_clients(bedrock, websocket=websocket)
+
+        event = {
+            "question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023", "stream": True,
+            "websocket": {"endpoint_url": "https://abc.execute-api.us-east-1.amazonaws.com/prod", "connection_id": "conn-1"},
+        }
+        result = lambda_handler(event, None)
+
+        body = json.loads(result['body'])
+        assert result['statusCode'] == 200
+        assert body['answer'] == "$56.5 billion"
+        assert body['stream_metrics']['output_tokens'] == 6
+        relayed = [call[1]['Data'] for call in websocket.post_to_connection.call_args_list]
+        assert relayed == [b"$56.5", b" billion"]
+
+    @patch('lambda_3.ask_claude_question', return_value="Buffered answer")
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_buffered_is_default(self, mock_url, mock_download, mock_claude):
+        result = lambda_handler({"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023"}, None)
+        body = json.loads(result['body'])
+        assert body['answer'] == "Buffered answer"
+        assert 'stream_metrics' not in body
+
+    @patch('lambda_3.download_sec_document', return_value="Total revenue was $56.5 billion for the quarter.")
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    @patch('lambda_3.boto3.client')
+    def test_unfinished_stream_not_cached(self, mock_boto, mock_url, mock_download):
+        def broken_stream():
+            # Bedrock's message_start already reports an output token
+            start = {'type': 'message_start', 'message': {'usage': {'input_tokens': 1200, 'output_tokens': 1}}}
+            yield {'chunk': {'bytes': json.dumps(start).encode()}}
+            yield stream_events(["$56.5"])['body'][1]
+            raise Exception("connection reset")
+
+        bedrock = Mock()
+        bedrock.invoke_model_with_response_stream.side_effect = [{'body': broken_stream()}, stream_events(["$56.5 billion"])]
+        mock_boto.side_effect = mock_clients(bedrock)
+
+        event = {"question": "What was Q1 revenue?", "ticker": "MSFT", "year": "2023", "stream": True}
+        assert "connection reset" in json.loads(lambda_handler(event, None)['body'])['answer']
+        assert json.loads(lambda_handler(event, None)['body'])['answer'] == "$56.5 billion"
+        assert bedrock.invoke_model_with_response_stream.call_count == 2
@@ -0,0 +1,74 @@
+# test_table_compaction.py - Tests for compacting filing tables into tab-separated rows
+import os
+import sys
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import table_compaction
+from lambda_3 import html_to_text
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def load_soup(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return BeautifulSoup(f.read(), 'html.parser')
+
+
+class TestCompactTable:
+    """Test rendering of individual tables"""
+
+    def test_spacer_columns_and_currency_cells_removed(self):
+        table = load_soup('sample_10q_tables.htm').find('table')
+        lines = table_compaction.compact_table(table).splitlines()
+        assert "Product\t15,535\t15,741" in lines
+        assert "Total revenue\t56,517\t50,122" in lines
+        assert "Diluted earnings per share\t2.99\t2.35" in lines
+
+    def test_parentheses_and_percent_fragments_merged(self):
+        table = load_soup('sample_10q_tables.htm').find('table')
+        lines = table_compaction.compact_table(table).splitlines()
+        assert "Other income (expense), net\t(184)\t54" in lines
+        assert "Effective tax rate\t18%\t19%" in lines
+
+    def test_header_rows_merged(self):
+        table = load_soup('sample_10q_tables.htm').find('table')
+        lines = table_compaction.compact_table(table).splitlines()
+        # The label spanning both years becomes one caption line instead of being repeated
+        assert lines[0] == "(In millions, except per share amounts) (Unaudited)\tThree Months Ended September 30,"
+        assert lines[1] == "\t2023\t2022"
+        assert lines[2] == "Revenue:"
+
+    def test_layout_table_becomes_plain_row(self):
+        table = load_soup('sample_10q_tables.htm').find_all('table')[1]
+        assert table_compaction.compact_table(table) == "•\tAzure and other cloud services revenue grew 29%."
+
+
+class TestHtmlToText:
+    """Test that tables keep their rows while the rest of the text is collapsed"""
+
+    def test_tables_on_their_own_lines(self):
+        text = html_to_text(load_soup('sample_10q_tables.htm'))
+        assert "INCOME STATEMENTS\n" in text
+        assert "\nTotal revenue\t56,517\t50,122\n" in text
+        assert "Revenue increased $6.4 billion" in text
+        assert table_compaction.PLACEHOLDER_PATTERN.search(text) is None
+
+    def test_nested_tables_restored(self):
+        soup = BeautifulSoup("<p>Intro</p><table><tr><td>Outer</td><td><table><tr><td>Inner cell</td>"
+                             "<td>42</td></tr></table></td></tr></table><p>End</p>", 'html.parser')
+        text = html_to_text(soup)
+        assert "\nInner cell\t42\n" in text
+        assert table_compaction.PLACEHOLDER_PATTERN.search(text) is None
+
+    def test_header_over_spacer_column_kept(self):
+        text = html_to_text(load_soup('sample_10k_ixbrl.htm'))
+        assert "\tSeptember 30, 2023\tSeptember 24, 2022\n" in text
+
+    def test_compaction_reduces_token_count(self):
+        for name in ('sample_10q_tables.htm', 'sample_10k_ixbrl.htm'):
+            compact = html_to_text(load_soup(name))
+            flat = html_to_text(load_soup(name), compact_tables=False)
+            assert table_compaction.count_tokens(compact) < table_compaction.count_tokens(flat)
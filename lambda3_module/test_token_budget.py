@@ -0,0 +1,100 @@
+# test_token_budget.py - Tests for token estimates, calibration and per-request context budgets
+import json
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import retrieval
+import token_budget
+from token_budget import TokenEstimator, estimate_tokens, plan_context_tokens, raw_token_estimate
+from lambda_3 import lambda_handler
+
+SONNET = "us.anthropic.claude-3-5-sonnet-20241022-v2:0"
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+FILING_TEXT = ("Total net sales were $383.3 billion, compared with $394.3 billion a year earlier. "
+               "Supply chain risks increased because of concentration in a few outsourcing partners. ") * 400
+
+
+class TestEstimator:
+    """Test the character-class estimate and its calibration"""
+
+    def test_numbers_cost_more_than_prose(self):
+        assert raw_token_estimate("") == 0
+        assert raw_token_estimate("383,285\t394,328\t365,817") > raw_token_estimate("revenue for the fiscal yr")
+
+    def test_calibration_moves_toward_reported_usage(self):
+        estimator = TokenEstimator(alpha=0.5)
+        text = "word " * 400  # 500 raw tokens
+        assert estimator.calibrate(text, 600) == 1.2
+        assert estimator.scale == 1.2
+        estimator.calibrate(text, 500)
+        assert round(estimator.scale, 3) == 1.1
+        assert estimator.estimate(text) == 550
+
+    def test_calibration_is_bounded_and_reported(self, capsys):
+        token_budget.calibrate("word " * 400, 100000)
+        assert token_budget.calibration_scale() == 2.0
+        emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws"')]
+        assert emf[0]['TokenEstimateRatio'] == 200.0
+
+
+class TestPlanner:
+    """Test that budgets follow the tier, the model window and max_tokens"""
+
+    def test_tiers_and_window(self):
+        assert plan_context_tokens(SONNET, 3000, 'fast') < plan_context_tokens(SONNET, 3000, 'standard')
+        assert plan_context_tokens(SONNET, 3000, 'unknown') == token_budget.LATENCY_TIERS['standard']
+        with patch.dict(token_budget.LATENCY_TIERS, {'huge': 500000}):
+            assert plan_context_tokens(SONNET, 3000, 'huge') == int((200000 - 3000 - 500) * 0.9)
+            # max_tokens beyond the model's output limit is clamped before it is reserved
+            assert plan_context_tokens(SONNET, 50000, 'huge') == int((200000 - 8192 - 500) * 0.9)
+
+    def test_retrieval_budget_uses_calibration(self):
+        token_budget.reset_calibration()
+        index = retrieval.BM25Index(retrieval.chunk_text(FILING_TEXT), text=FILING_TEXT)
+        before = index.build_context("net sales", top_k=100, token_budget=2000)
+        assert estimate_tokens(before) <= 2000
+        token_budget.calibrate("word " * 400, 1000)
+        after = index.build_context("net sales", top_k=100, token_budget=2000)
+        assert len(after) < len(before)
+        token_budget.reset_calibration()
+
+    def test_prefix_ignores_calibration(self):
+        index = retrieval.BM25Index(retrieval.chunk_text(FILING_TEXT), text=FILING_TEXT)
+        prefix = index.document_prefix(2000)
+        token_budget.calibrate("word " * 400, 1000)
+        assert index.document_prefix(2000) == prefix
+        token_budget.reset_calibration()
+
+
+class TestTimeFit:
+    """Test fitting the context and max_tokens into the time left"""
+
+    def test_fit_to_time(self):
+        assert token_budget.fit_to_time(12000, 3000, float('inf')) == (12000, 3000)
+        # Context shrinks first, then max_tokens; nothing fits below the minimums
+        context, max_tokens = token_budget.fit_to_time(12000, 500, 9500)
+        assert token_budget.MIN_CONTEXT_TOKENS < context < 12000 and max_tokens == 500
+        context, max_tokens = token_budget.fit_to_time(12000, 3000, 5000)
+        assert context == token_budget.MIN_CONTEXT_TOKENS and token_budget.MIN_OUTPUT_TOKENS < max_tokens < 3000
+        assert token_budget.answer_ms(context, max_tokens) <= 5000
+        assert token_budget.fit_to_time(12000, 3000, 2000) is None
+
+
+class TestHandlerBudgets:
+    """Test that short factual questions get smaller prompts"""
+
+    @patch('lambda_3.ask_claude_question', return_value="An answer.")
+    @patch('lambda_3.download_sec_document', return_value=FILING_TEXT)
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_fact_question_gets_fast_tier(self, mock_url, mock_download, mock_claude):
+        fact = json.loads(lambda_handler({"question": "What was total revenue in 2023?", "ticker": "AAPL", "year": "2023"}, None)['body'])
+        why = json.loads(lambda_handler({"question": "Why did supply chain risks increase?", "ticker": "AAPL", "year": "2023"}, None)['body'])
+        forced = json.loads(lambda_handler({"question": "What was total revenue in 2023?", "ticker": "AAPL", "year": "2023",
+                                            "latency_tier": "thorough", "use_cache": False}, None)['body'])
+
+        assert fact['latency_tier'] == 'fast' and fact['context_tokens'] <= 3000
+        assert why['latency_tier'] == 'standard' and fact['context_tokens'] < why['context_tokens'] <= 12000
+        assert forced['latency_tier'] == 'thorough' and forced['context_tokens'] > why['context_tokens']
@@ -0,0 +1,137 @@
+# test_xbrl_facts.py - Tests for inline XBRL fact extraction and the direct-answer fast path
+import datetime
+import json
+from unittest.mock import Mock, patch
+import sys
+import os
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import xbrl_facts
+from lambda_3 import download_sec_document, lambda_handler
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'sample_10k_ixbrl.htm')
+FILING_URL = "https://www.sec.gov/Archives/edgar/data/320193/000032019323000106/aapl-20230930.htm"
+
+
+def load_facts():
+    with open(FIXTURE, 'rb') as f:
+        return xbrl_facts.extract_facts(BeautifulSoup(f.read(), 'html.parser'))
+
+
+class TestFactExtraction:
+    """Test building the compact fact table"""
+
+    def test_extracts_scaled_signed_values(self):
+        facts = load_facts()
+        revenue = [f for f in facts if f.concept == 'us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax']
+        assert {f.value for f in revenue} == {383285e6, 394328e6}
+        other = next(f for f in facts if f.concept == 'us-gaap:NonoperatingIncomeExpense')
+        assert other.value == -565e6
+        eps = next(f for f in facts if f.concept == 'us-gaap:EarningsPerShareDiluted')
+        assert eps.unit == 'USD/shares'
+        assert eps.value == 6.13
+
+    def test_skips_dimensional_contexts_and_keeps_instants(self):
+        facts = load_facts()
+        assert all(f.value != 298085e6 for f in facts)
+        assets = next(f for f in facts if f.concept == 'us-gaap:Assets')
+        assert assets.start is None
+        assert assets.end == datetime.date(2023, 9, 30)
+
+
+class TestDirectAnswer:
+    """Test mapping questions to concepts"""
+
+    def test_revenue_question_answered_from_facts(self):
+        answer = xbrl_facts.direct_answer("What was Apple's total revenue in 2023?", load_facts(), "Annual", 2023)
+        assert "$383.29 billion" in answer
+        assert "September 30, 2023" in answer
+
+    def test_year_in_question_selects_prior_period(self):
+        answer = xbrl_facts.direct_answer("What was net income in 2022?", load_facts(), "Annual", 2023)
+        assert "$99.80 billion" in answer
+
+    def test_per_share_and_instant_formatting(self):
+        facts = load_facts()
+        assert "$6.13" in xbrl_facts.direct_answer("What was diluted EPS?", facts)
+        assert "as of September 30, 2023" in xbrl_facts.direct_answer("What were total assets?", facts)
+
+    def test_explanations_and_unknown_metrics_fall_through(self):
+        facts = load_facts()
+        assert xbrl_facts.direct_answer("Why did revenue decrease?", facts) is None
+        assert xbrl_facts.facts_context("Why did revenue decrease?", facts) is None
+        assert xbrl_facts.direct_answer("Who is the CEO?", facts) is None
+
+    def test_narrative_questions_and_missing_years_fall_through(self):
+        facts = load_facts()
+        assert xbrl_facts.direct_answer("How does Apple recognize revenue?", facts, "Annual", 2023) is None
+        assert xbrl_facts.direct_answer("What was net income in 2019?", facts, "Annual", 2023) is None
+        assert xbrl_facts.direct_answer("What were total assets?", facts, "Annual", 2019) is None
+
+    def test_several_metrics_answered_in_question_order(self):
+        answer = xbrl_facts.direct_answer("What were net income and revenue in 2023?", load_facts())
+        assert answer.index("Net income") < answer.index("Total revenue")
+        assert "$383.29 billion" in answer
+        assert [label for label, _ in xbrl_facts.match_metrics("cost of revenue and revenue")] == \
+            ['Cost of revenue', 'Total revenue']
+
+    def test_unparseable_dates_are_dropped(self):
+        facts = load_facts() + [xbrl_facts.Fact('us-gaap:NetIncomeLoss', None, None, 'USD', 6, 1.0)]
+        assert "$97.00 billion" in xbrl_facts.direct_answer("What was net income in 2023?", facts)
+        soup = BeautifulSoup('<xbrli:context id="c1"><xbrli:period><xbrli:instant>FY2023</xbrli:instant>'
+                             '</xbrli:period></xbrli:context>', 'html.parser')
+        assert xbrl_facts._parse_contexts(soup) == {}
+
+    def test_comparison_gets_tiny_fact_table(self):
+        context = xbrl_facts.facts_context("How did revenue change compared to 2022?", load_facts())
+        rows = context.splitlines()
+        assert len(rows) == 3
+        assert rows[1].endswith("383285000000")
+
+
+class TestHandlerFastPath:
+    """Test that Lambda 3 skips Bedrock for plain numeric lookups"""
+
+    @patch('lambda_3.requests.get')
+    def test_download_caches_facts_and_hides_xbrl_header(self, mock_get):
+        with open(FIXTURE, 'rb') as f:
+            mock_get.return_value = Mock(status_code=200, content=f.read())
+        text = download_sec_document(FILING_URL, max_chars=None)
+        assert "iso4217" not in text
+        assert len(xbrl_facts.get_cached_facts("000032019323000106")) > 0
+
+    @patch('lambda_3.ask_claude_question')
+    @patch('lambda_3.requests.get')
+    @patch('lambda_3.get_sec_document_url')
+    def test_numeric_question_skips_bedrock(self, mock_get_url, mock_get, mock_claude):
+        mock_get_url.return_value = FILING_URL
+        with open(FIXTURE, 'rb') as f:
+            mock_get.return_value = Mock(status_code=200, content=f.read())
+
+        result = lambda_handler({"question": "What was Apple's total revenue in 2023?", "ticker": "AAPL", "year": "2023"}, None)
+        body = json.loads(result['body'])
+        assert body['answer_source'] == 'xbrl_fact'
+        assert "$383.29 billion" in body['answer']
+        mock_claude.assert_not_called()
+
+        mock_claude.return_value = "Revenue decreased 3% due to lower Mac and iPhone sales."
+        result = lambda_handler({"question": "Why did revenue decrease in 2023?", "ticker": "AAPL", "year": "2023"}, None)
+        body = json.loads(result['body'])
+        assert body['answer_source'] == 'filing'
+        mock_claude.assert_called_once()
+
+    @patch('lambda_3.ask_claude_question', return_value="Apple recognizes revenue when control transfers to the customer.")
+    @patch('lambda_3.requests.get')
+    @patch('lambda_3.get_sec_document_url', return_value=FILING_URL)
+    def test_narrative_question_goes_to_bedrock(self, mock_get_url, mock_get, mock_claude):
+        with open(FIXTURE, 'rb') as f:
+            mock_get.return_value = Mock(status_code=200, content=f.read())
+
+        result = lambda_handler({"question": "How does Apple recognize revenue?", "ticker": "AAPL", "year": "2023"}, None)
+        body = json.loads(result['body'])
+        assert body['answer_source'] == 'filing'
+        assert "control transfers" in body['answer']
+        mock_claude.assert_called_once()
@@ -0,0 +1,145 @@
+# token_budget.py - Local prompt token estimates and per-request context budgets
+import math
+import threading
+
+from metrics import emit_metrics
+
+# Prose runs about 4 characters per Claude token; digits split into much shorter
+# tokens, so number-dense financial tables cost more per character
+TEXT_CHARS_PER_TOKEN = 4.0
+DIGIT_CHARS_PER_TOKEN = 2.0
+DIGITS = '0123456789'
+
+# Context window and output limit for each Bedrock model we call
+MODEL_LIMITS = {
+    "us.anthropic.claude-3-5-sonnet-20241022-v2:0": {'context_tokens': 200000, 'max_output_tokens': 8192},
+    "us.anthropic.claude-3-5-haiku-20241022-v1:0": {'context_tokens': 200000, 'max_output_tokens': 8192},
+}
+DEFAULT_MODEL_LIMITS = {'context_tokens': 100000, 'max_output_tokens': 4096}
+
+# Filing tokens sent per latency tier; prompt size drives time to first token
+LATENCY_TIERS = {'fast': 3000, 'standard': 12000, 'thorough': 25000}
+DEFAULT_LATENCY_TIER = 'standard'
+
+# System prompt, question and instructions around the filing text
+PROMPT_OVERHEAD_TOKENS = 500
+# Only fill this share of the model's window, since the estimate is approximate
+WINDOW_SAFETY_FACTOR = 0.9
+
+# Rough Bedrock speeds, for fitting a request into the time left before the deadline
+FIRST_TOKEN_MS = 800
+PREFILL_TOKENS_PER_SECOND = 8000
+OUTPUT_TOKENS_PER_SECOND = 60
+# Below these a Bedrock answer isn't worth asking for
+MIN_CONTEXT_TOKENS = 1000
+MIN_OUTPUT_TOKENS = 150
+
+# Calibration: exponential moving average of actual / estimated prompt tokens
+CALIBRATION_ALPHA = 0.2
+CALIBRATION_BOUNDS = (0.5, 2.0)
+
+
+def raw_token_estimate(text):
+    """Uncalibrated token estimate from character classes (str.count runs in C, so this stays fast)"""
+    if not text:
+        return 0.0
+    digits = sum(text.count(digit) for digit in DIGITS)
+    return (len(text) - digits) / TEXT_CHARS_PER_TOKEN + digits / DIGIT_CHARS_PER_TOKEN
+
+
+class TokenEstimator:
+    """Character-class token estimate scaled by what Bedrock actually reports"""
+
+    def __init__(self, alpha=CALIBRATION_ALPHA, bounds=CALIBRATION_BOUNDS):
+        self.alpha = alpha
+        self.bounds = bounds
+        self.scale = 1.0
+        self.samples = 0
+        # Batch requests report usage from several threads
+        self._lock = threading.Lock()
+
+    def estimate(self, text):
+        return int(math.ceil(raw_token_estimate(text) * self.scale))
+
+    def calibrate(self, prompt_text, actual_tokens):
+        """Fold one Bedrock usage count into the scale; returns actual / estimated before the update"""
+        raw = raw_token_estimate(prompt_text)
+        if raw <= 0 or not actual_tokens:
+            return None
+        with self._lock:
+            ratio = actual_tokens / (raw * self.scale)
+            observed = min(max(actual_tokens / raw, self.bounds[0]), self.bounds[1])
+            # The first sample replaces the default outright
+            self.scale = observed if self.samples == 0 else (1 - self.alpha) * self.scale + self.alpha * observed
+            self.samples += 1
+        return ratio
+
+
+_estimator = TokenEstimator()
+
+
+def estimate_tokens(text):
+    return _estimator.estimate(text)
+
+
+def calibration_scale():
+    return _estimator.scale
+
+
+def calibrate(prompt_text, actual_tokens):
+    """Update the estimator from a Bedrock response and report how far off the estimate was"""
+    ratio = _estimator.calibrate(prompt_text, actual_tokens)
+    if ratio is not None:
+        emit_metrics({'TokenEstimateRatio': (round(ratio, 3), 'None')})
+    return ratio
+
+
+def reset_calibration():
+    global _estimator
+    _estimator = TokenEstimator()
+
+
+def model_limits(model_id):
+    return MODEL_LIMITS.get(model_id, DEFAULT_MODEL_LIMITS)
+
+
+def output_tokens(model_id, max_tokens):
+    """Clamp a max_tokens request to what the model can produce"""
+    return min(max_tokens, model_limits(model_id)['max_output_tokens'])
+
+
+def plan_context_tokens(model_id, max_tokens, latency_tier=DEFAULT_LATENCY_TIER,
+                        overhead_tokens=PROMPT_OVERHEAD_TOKENS):
+    """Filing tokens to send: the latency tier's target, capped by the room the model has
+    left after the reserved output (max_tokens) and the rest of the prompt"""
+    limits = model_limits(model_id)
+    room = (limits['context_tokens'] - output_tokens(model_id, max_tokens) - overhead_tokens) * WINDOW_SAFETY_FACTOR
+    target = LATENCY_TIERS.get(latency_tier, LATENCY_TIERS[DEFAULT_LATENCY_TIER])
+    return max(0, min(target, int(room)))
+
+
+def answer_ms(context_tokens, max_tokens, overhead_tokens=PROMPT_OVERHEAD_TOKENS):
+    """Estimated time for Bedrock to read the prompt and write max_tokens"""
+    prefill = (context_tokens + overhead_tokens) / PREFILL_TOKENS_PER_SECOND
+    return FIRST_TOKEN_MS + (prefill + max_tokens / OUTPUT_TOKENS_PER_SECOND) * 1000
+
+
+def fit_to_time(context_tokens, max_tokens, remaining_ms):
+    """Shrink the filing context, then max_tokens, until the answer should arrive within remaining_ms.
+
+    Returns (context_tokens, max_tokens), unchanged when they already fit, or None when even
+    MIN_CONTEXT_TOKENS and MIN_OUTPUT_TOKENS would not.
+    """
+    if answer_ms(context_tokens, max_tokens) <= remaining_ms:
+        return context_tokens, max_tokens
+    min_context = min(context_tokens, MIN_CONTEXT_TOKENS)
+    min_output = min(max_tokens, MIN_OUTPUT_TOKENS)
+    if answer_ms(min_context, min_output) > remaining_ms:
+        return None
+    # Context first: it changes the answer's quality least per second saved
+    spare_ms = remaining_ms - answer_ms(min_context, max_tokens)
+    if spare_ms >= 0:
+        extra = int(spare_ms / 1000 * PREFILL_TOKENS_PER_SECOND)
+        return min(context_tokens, min_context + extra), max_tokens
+    spare_ms = remaining_ms - answer_ms(min_context, min_output)
+    return min_context, min(max_tokens, min_output + int(spare_ms / 1000 * OUTPUT_TOKENS_PER_SECOND))
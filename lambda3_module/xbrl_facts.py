@@ -0,0 +1,261 @@
+# xbrl_facts.py - Inline XBRL (ix:nonFraction) fact extraction and direct answers for numeric questions
+import datetime
+import re
+from collections import OrderedDict, namedtuple
+
+# One row of the compact per-filing fact table. start is None for instant (balance sheet) facts.
+Fact = namedtuple('Fact', ['concept', 'start', 'end', 'unit', 'scale', 'value'])
+
+FACT_CACHE_SIZE = 8
+
+# Question phrases mapped to the us-gaap concepts that answer them. Order matters:
+# more specific phrases ("cost of revenue") must come before general ones ("revenue").
+METRICS = [
+    (r'cost of (?:revenue|sales|goods sold)', 'Cost of revenue',
+     ['us-gaap:CostOfRevenue', 'us-gaap:CostOfGoodsAndServicesSold']),
+    (r'gross (?:profit|margin)', 'Gross profit', ['us-gaap:GrossProfit']),
+    (r'operating income|income from operations', 'Operating income', ['us-gaap:OperatingIncomeLoss']),
+    (r'operating expenses', 'Total operating expenses', ['us-gaap:OperatingExpenses']),
+    (r'net (?:income|earnings|profit|loss)', 'Net income', ['us-gaap:NetIncomeLoss', 'us-gaap:ProfitLoss']),
+    (r'diluted (?:eps|earnings per share)', 'Diluted earnings per share', ['us-gaap:EarningsPerShareDiluted']),
+    (r'\beps\b|earnings per share', 'Basic earnings per share', ['us-gaap:EarningsPerShareBasic']),
+    (r'research and development|r&d', 'Research and development expense', ['us-gaap:ResearchAndDevelopmentExpense']),
+    (r'cash and cash equivalents', 'Cash and cash equivalents', ['us-gaap:CashAndCashEquivalentsAtCarryingValue']),
+    (r'total assets', 'Total assets', ['us-gaap:Assets']),
+    (r'total liabilities', 'Total liabilities', ['us-gaap:Liabilities']),
+    (r"(?:stockholders|shareholders)'? equity", "Total shareholders' equity", ['us-gaap:StockholdersEquity']),
+    (r'revenues?|net sales|total sales', 'Total revenue',
+     ['us-gaap:Revenues', 'us-gaap:RevenueFromContractWithCustomerExcludingAssessedTax', 'us-gaap:SalesRevenueNet']),
+]
+METRICS = [(re.compile(pattern), label, concepts) for pattern, label, concepts in METRICS]
+
+# Questions that compare figures get a tiny fact-table prompt; questions that ask for
+# reasons need the narrative text, so they go through the normal filing path
+COMPARISON_PATTERN = re.compile(r'\b(?:change|changed|compare|compared|growth|grow|grew|increase|decrease|difference|trend|versus|vs)\b')
+EXPLANATION_PATTERN = re.compile(r'\b(?:why|explain|reason|reasons|driver|drivers|drove|cause|caused)\b')
+YEAR_PATTERN = re.compile(r'\b(19|20)\d{2}\b')
+# Only questions shaped like a lookup ("what was ...", "how much ...") are answered from the
+# facts alone; "How does Apple recognize revenue?" names a metric but wants the narrative
+LOOKUP_PATTERN = re.compile(r"\b(?:how much|how many|what(?:'s| (?:was|were|is|are))|report(?:ed)?)\b")
+
+_fact_cache = OrderedDict()
+
+
+def _parse_date(text):
+    try:
+        return datetime.date.fromisoformat(text.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def _parse_contexts(soup):
+    """Map context id -> (start, end) for contexts without dimensional segments"""
+    contexts = {}
+    for context in soup.find_all('xbrli:context'):
+        # Segment contexts hold breakdowns (by product, region, ...), not the consolidated total
+        if context.find('xbrli:segment') is not None:
+            continue
+        # Contexts whose dates don't parse are dropped rather than guessed at
+        instant = context.find('xbrli:instant')
+        if instant is not None:
+            end = _parse_date(instant.get_text())
+            if end is not None:
+                contexts[context.get('id')] = (None, end)
+            continue
+        start = context.find('xbrli:startdate')
+        end = context.find('xbrli:enddate')
+        if start is not None and end is not None:
+            period = (_parse_date(start.get_text()), _parse_date(end.get_text()))
+            if None not in period:
+                contexts[context.get('id')] = period
+    return contexts
+
+
+def _parse_units(soup):
+    """Map unit id -> readable measure such as 'USD' or 'USD/shares'"""
+    units = {}
+    for unit in soup.find_all('xbrli:unit'):
+        measures = [m.get_text().strip().split(':')[-1] for m in unit.find_all('xbrli:measure')]
+        if measures:
+            units[unit.get('id')] = '/'.join(measures)
+    return units
+
+
+def _parse_value(tag):
+    """Convert an ix:nonFraction tag's display text into a signed, scaled number"""
+    text = tag.get_text().strip()
+    number_format = tag.get('format', '')
+    if 'zero' in number_format or text in ('', '-', '—', '–'):
+        value = 0.0
+    else:
+        cleaned = text.replace(',', '').replace(' ', '')
+        if 'numcommadecimal' in number_format:
+            cleaned = text.replace('.', '').replace(' ', '').replace(',', '.')
+        try:
+            value = float(cleaned)
+        except ValueError:
+            return None
+    scale = int(tag.get('scale', 0) or 0)
+    value *= 10 ** scale
+    if tag.get('sign') == '-':
+        value = -value
+    return value
+
+
+def extract_facts(soup):
+    """Build the compact fact table (concept, period, unit, scale, value) from a parsed filing"""
+    contexts = _parse_contexts(soup)
+    units = _parse_units(soup)
+    facts = []
+    seen = set()
+    for tag in soup.find_all('ix:nonfraction'):
+        period = contexts.get(tag.get('contextref'))
+        if period is None:
+            continue
+        value = _parse_value(tag)
+        if value is None:
+            continue
+        concept = tag.get('name')
+        unit = units.get(tag.get('unitref'), tag.get('unitref'))
+        # The same fact is often tagged several times (statements, notes, MD&A)
+        key = (concept, period, unit, value)
+        if key in seen:
+            continue
+        seen.add(key)
+        facts.append(Fact(concept, period[0], period[1], unit, int(tag.get('scale', 0) or 0), value))
+    return facts
+
+
+def cache_facts(accession, facts):
+    _fact_cache[accession] = facts
+    _fact_cache.move_to_end(accession)
+    while len(_fact_cache) > FACT_CACHE_SIZE:
+        _fact_cache.popitem(last=False)
+
+
+def get_cached_facts(accession):
+    """Return the cached fact table for a filing, or None if it has not been extracted"""
+    facts = _fact_cache.get(accession)
+    if facts is not None:
+        _fact_cache.move_to_end(accession)
+    return facts
+
+
+def clear_fact_cache():
+    _fact_cache.clear()
+
+
+def match_metrics(question):
+    """Return (label, concepts) for every metric the question mentions, in question order.
+
+    A phrase claimed by a more specific metric ("cost of revenue") isn't matched again
+    by a general one ("revenue").
+    """
+    question_lower = question.lower()
+    claimed = []
+    found = []
+    for pattern, label, concepts in METRICS:
+        for match in pattern.finditer(question_lower):
+            if any(match.start() < end and start < match.end() for start, end in claimed):
+                continue
+            claimed.append(match.span())
+            found.append((match.start(), label, concepts))
+            break
+    return [(label, concepts) for _, label, concepts in sorted(found, key=lambda item: item[0])]
+
+
+def match_metric(question):
+    """Return (label, concepts) for the first metric the question mentions, or None"""
+    metrics = match_metrics(question)
+    return metrics[0] if metrics else None
+
+
+def _period_matches(fact, filing_type):
+    if fact.end is None:
+        # An end date that didn't parse can't be placed in any period
+        return False
+    if fact.start is None:
+        return True
+    days = (fact.end - fact.start).days
+    if filing_type == "Quarter":
+        return 80 <= days <= 100
+    return 350 <= days <= 380
+
+
+def select_facts(facts, concepts, filing_type="Annual"):
+    """Return the consolidated facts for the first concept that the filing reports, newest first"""
+    for concept in concepts:
+        matches = [f for f in facts if f.concept == concept and _period_matches(f, filing_type)]
+        if matches:
+            return sorted(matches, key=lambda f: f.end, reverse=True)
+    return []
+
+
+def format_value(value, unit):
+    """Format a fact value for an answer, e.g. 383285000000 USD -> '$383.29 billion'"""
+    sign = '-' if value < 0 else ''
+    magnitude = abs(value)
+    if unit and unit.startswith('USD/'):
+        return f"{sign}${magnitude:,.2f}"
+    prefix = '$' if unit == 'USD' else ''
+    suffix = '' if unit in ('USD', None) else f" {unit}"
+    for threshold, word in ((1e12, 'trillion'), (1e9, 'billion'), (1e6, 'million')):
+        if magnitude >= threshold:
+            return f"{sign}{prefix}{magnitude / threshold:,.2f} {word}{suffix}"
+    return f"{sign}{prefix}{magnitude:,.0f}{suffix}"
+
+
+def is_lookup(question):
+    """True for a plain lookup question: lookup-shaped, and neither a comparison nor an explanation"""
+    question_lower = question.lower()
+    return (bool(LOOKUP_PATTERN.search(question_lower)) and not COMPARISON_PATTERN.search(question_lower)
+            and not EXPLANATION_PATTERN.search(question_lower))
+
+
+def direct_answer(question, facts, filing_type="Annual", year=None):
+    """Answer a plain numeric lookup straight from the fact table, or return None.
+
+    Every metric the question names is answered, in question order. None (so the question
+    goes to Claude) unless each one has a fact for the year asked about.
+    """
+    if not facts or not is_lookup(question):
+        return None
+    metrics = match_metrics(question)
+    if not metrics:
+        return None
+
+    # A 10-K reports several years side by side; honour a year named in the question
+    years = {int(match.group(0)) for match in YEAR_PATTERN.finditer(question)}
+    if not years and year is not None:
+        years = {int(year)}
+    sentences = []
+    for label, concepts in metrics:
+        candidates = select_facts(facts, concepts, filing_type)
+        if years:
+            candidates = [f for f in candidates if f.end.year in years]
+        if not candidates:
+            return None
+        fact = candidates[0]
+        period = f"period ended {fact.end:%B} {fact.end.day}, {fact.end.year}"
+        if fact.start is None:
+            period = f"as of {fact.end:%B} {fact.end.day}, {fact.end.year}"
+        sentences.append(f"{label} for the {period} was {format_value(fact.value, fact.unit)}, "
+                         f"as tagged in the filing's inline XBRL ({fact.concept}).")
+    return " ".join(sentences)
+
+
+def facts_context(question, facts, filing_type="Annual"):
+    """Build a tiny tab-separated fact table for comparison questions, or return None"""
+    question_lower = question.lower()
+    if not facts or EXPLANATION_PATTERN.search(question_lower) or not COMPARISON_PATTERN.search(question_lower):
+        return None
+    metric = match_metric(question)
+    if metric is None:
+        return None
+    rows = select_facts(facts, metric[1], filing_type)
+    if not rows:
+        return None
+    lines = ["concept\tperiod_start\tperiod_end\tunit\tvalue"]
+    for fact in rows:
+        lines.append(f"{fact.concept}\t{fact.start or ''}\t{fact.end}\t{fact.unit}\t{fact.value:.15g}")
+    return "\n".join(lines)